@@ -0,0 +1,513 @@
+﻿"""Đo throughput và độ trễ của cả đường input: client giả lập -> transport -> server -> dispatcher.
+
+    python -m Benchmarks.bench_pipeline --transport ws,http,udp --clients 1,8 --rate 250 -o results.json
+    python -m Benchmarks.bench_pipeline --layer transport --pattern mash --rate 0     # gửi nhanh hết mức
+    python -m Benchmarks.bench_pipeline --compare baseline.json results.json         # exit 1 nếu có regression
+    python -m Benchmarks.bench_pipeline --transport ws,http,udp --server-mode gevent,waitress -o ci.json
+
+Throughput phía server (server.fps) chỉ đếm frame mà decoder của phiên đã áp dụng; bản sao dư
+của UDP, frame đến trễ (server.redundant) và frame bị giới hạn tốc độ (server.rate_limited) báo
+riêng. Lần chạy có tốc độ cố định với kiểu input đổi mỗi frame (sweep, mash) mà server chấp nhận
+dưới MIN_DELIVERED_RATIO tải gửi vào thì được báo và lệnh exit 1, kể cả khi không có baseline
+(vd. HTTP keep-alive trên gevent bị Nagle làm chậm còn ~90 frame/s). Lần chạy có tốc độ cố định
+trong giới hạn của phiên mà server vẫn bỏ frame vì giới hạn tốc độ (vd. bản sao dư của UDP bị
+tính token) cũng là lỗi.
+
+Mỗi tổ hợp (transport, lớp gửi, kiểu input, số client, tốc độ) chạy trên một server mới
+(python -m Server.server, RC_TUNNEL_BACKEND=local, RC_DISCOVERY_BACKEND=file, cổng ngẫu nhiên)
+để các histogram của /metrics chỉ chứa frame của lần chạy đó; --server-url dùng server có sẵn
+(khi đó phân vị độ trễ tính cả các frame trước lần chạy). Mỗi client là một process riêng, gửi
+qua RemoteClient.send_controller_data (--layer client) hoặc gửi thẳng frame đã mã hoá qua
+transport (--layer transport).
+
+Độ trễ end-to-end là "lấy mẫu -> dispatch" do server đo từ timestamp của frame (mili giây) nên
+độ phân giải là 1 ms. CPU client là thời gian CPU của process client (kể cả luồng nền của
+transport) chia cho số trạng thái đã sinh, kể cả trạng thái không đổi mà encoder bỏ qua.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+from Common.metrics import LatencyHistogram
+from Common.protocol import AXIS_NAMES, BUTTON_NAMES, timestamp_ms
+from FireBase.discovery_backends import FileDiscovery, MemoryDiscovery
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATTERNS = ("sweep", "mash", "burst", "idle")
+LAYERS = ("client", "transport")
+SERVER_MODES = ("gevent", "waitress", "dev")
+# Tỉ lệ frame/s server chấp nhận so với tải gửi vào, dưới mức này là lỗi (chỉ với sweep/mash)
+MIN_DELIVERED_RATIO = 0.9
+# SESSION_RATE_LIMIT của Server/server.py: mỗi client là một phiên, gửi tới tốc độ này không được bị giới hạn
+SESSION_RATE_LIMIT = 500
+
+# Chỉ số dùng khi so sánh hai lần chạy: (đường dẫn trong kết quả, lớn hơn là tốt hơn, chênh lệch tối thiểu)
+# Chênh lệch tối thiểu bỏ qua nhiễu: độ trễ server chỉ chính xác tới 1 ms, cộng thêm một nhịp
+# dispatcher (4 ms ở TICK_RATE 250) tuỳ frame tới lúc nào trong nhịp
+COMPARE_METRICS = (
+    ("server.fps", True, 0.0),
+    ("server.dispatch_latency_ms.p50", False, 5.0),
+    ("server.dispatch_latency_ms.p99", False, 5.0),
+    ("server.dispatch_latency_ms.p999", False, 5.0),
+    ("client.cpu_us_per_frame", False, 2.0),
+    ("client.send_us.p99", False, 20.0),
+)
+
+
+class SyntheticController:
+    """Sinh trạng thái tay cầm theo một kiểu input, lặp lại được nhờ seed.
+
+    - "sweep": hai cần xoay tròn 1 vòng/giây, cò bóp nhả, không bấm nút
+    - "mash": nút, D-pad và cần đổi ngẫu nhiên ở gần như mọi frame (trường hợp nặng nhất)
+    - "burst": "mash" trong 200 ms rồi đứng yên 800 ms, như người chơi thật
+    - "idle": không đổi gì, chỉ còn keyframe định kỳ
+    """
+
+    def __init__(self, pattern="sweep", seed=0):
+        if pattern not in PATTERNS:
+            raise ValueError(f"Kiểu input không hợp lệ: {pattern}")
+        self.pattern = pattern
+        self.random = random.Random(seed)
+        self.buttons = {name: False for name in BUTTON_NAMES.values()}
+        self.axes = {name: 0.0 for name in AXIS_NAMES.values()}
+        self.axes["l2"] = self.axes["r2"] = -1.0
+        self.hats = {"hat_0": (0, 0)}
+
+    def _mash(self):
+        # Dict mới mỗi frame: encoder so sánh với trạng thái trước nên không được sửa tại chỗ
+        buttons = {name: (not pressed if self.random.random() < 0.1 else pressed)
+                   for name, pressed in self.buttons.items()}
+        axes = {name: max(-1.0, min(1.0, value + self.random.gauss(0, 0.2)))
+                for name, value in self.axes.items()}
+        hats = self.hats
+        if self.random.random() < 0.05:
+            hats = {"hat_0": (self.random.randint(-1, 1), self.random.randint(-1, 1))}
+        self.buttons, self.axes, self.hats = buttons, axes, hats
+
+    def state(self, t):
+        """Trạng thái (button_states, axis_values, hat_values) tại t giây kể từ lúc bắt đầu."""
+        if self.pattern == "sweep":
+            angle = 2 * math.pi * t
+            self.axes = dict(self.axes,
+                             left_stick_x=math.cos(angle), left_stick_y=math.sin(angle),
+                             right_stick_x=-math.sin(angle), right_stick_y=math.cos(angle),
+                             l2=math.sin(math.pi * t), r2=-math.sin(math.pi * t))
+        elif self.pattern == "mash" or (self.pattern == "burst" and t % 1.0 < 0.2):
+            self._mash()
+        return self.buttons, self.axes, self.hats
+
+
+def run_client(index, server_url, options, messages, start):
+    """Process của một client giả lập: kết nối, báo sẵn sàng, chờ hiệu lệnh rồi gửi trong duration giây."""
+    # RemoteClient in log mỗi lần kết nối; lỗi được gửi về qua messages
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    try:
+        messages.put(("result", _run_client(index, server_url, options, messages, start)))
+    except Exception as e:
+        messages.put(("error", index, repr(e)))
+
+
+def _run_client(index, server_url, options, messages, start):
+    from Client.client import RemoteClient
+
+    # Backend "memory" trong process client: trỏ thẳng vào server, không cần file hay Firebase
+    MemoryDiscovery.set_url(server_url)
+    client = RemoteClient(transport=options["transport"], wire_format=options["wire_format"],
+                          discovery_backend="memory", watch_url=False)
+    controller = SyntheticController(options["pattern"], seed=index)
+    messages.put(("ready", index))
+    if not start.wait(60):
+        client.close()
+        raise TimeoutError("không nhận được hiệu lệnh bắt đầu")
+
+    layer = options["layer"]
+    interval = 1.0 / options["rate"] if options["rate"] > 0 else 0.0
+    send_us = LatencyHistogram()
+    frames = failed = skipped = 0
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    deadline = started + options["duration"]
+    next_send = started
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        if interval:
+            if next_send > now:
+                time.sleep(next_send - now)
+            next_send += interval
+            # Tụt lại quá một nhịp thì bỏ nhịp thay vì dồn frame
+            if next_send < now - interval:
+                next_send = now
+        buttons, axes, hats = controller.state(time.monotonic() - started)
+
+        send_started = time.perf_counter()
+        if layer == "client":
+            sent = client.send_controller_data(buttons, axes, hats, timestamp=timestamp_ms())
+        else:
+            data = client.encoder.encode(buttons, axes, hats, timestamp=timestamp_ms())
+            if data is None:
+                skipped += 1
+                continue
+            sent = client.transport.send(data)
+        send_us.record((time.perf_counter() - send_started) * 1e6)
+        frames += 1
+        if not sent:
+            failed += 1
+
+    duration = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    transport_used = client.transport.name
+    client.close()
+    return {
+        "client": index,
+        "transport_used": transport_used,
+        "frames": frames,
+        "failed": failed,
+        "skipped": skipped,
+        "duration_s": duration,
+        "cpu_s": cpu,
+        "send_us": send_us,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """Chạy python -m Server.server trên cổng ngẫu nhiên, không tunnel, công bố URL vào file tạm."""
+
+    def __init__(self, mode="gevent", workdir=None):
+        self.mode = mode
+        self.workdir = workdir or tempfile.mkdtemp(prefix="rc-bench-")
+        self.discovery = FileDiscovery(os.path.join(self.workdir, "server_url.json"))
+        self.log_path = os.path.join(self.workdir, "server.log")
+        self.process = None
+        self.url = None
+
+    def start(self, timeout=30):
+        if os.path.exists(self.discovery.path):
+            os.remove(self.discovery.path)
+        env = dict(os.environ,
+                   RC_SERVER_MODE=self.mode,
+                   RC_TUNNEL_BACKEND="local",
+                   RC_DISCOVERY_BACKEND="file",
+                   RC_DISCOVERY_FILE=self.discovery.path,
+                   RC_PORT=str(free_port()),
+                   RC_UDP_PORT="0",
+                   PYTHONUNBUFFERED="1")
+        with open(self.log_path, "w", encoding="utf-8") as log:
+            self.process = subprocess.Popen([sys.executable, "-m", "Server.server"], cwd=REPO_ROOT, env=env,
+                                            stdout=log, stderr=subprocess.STDOUT)
+        # Server chỉ công bố URL sau khi /check-connection trả lời: có URL nghĩa là đã sẵn sàng
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.process.poll() is None:
+            self.url = self.discovery.get_url()
+            if self.url:
+                return self.url
+            time.sleep(0.1)
+        self.stop()
+        with open(self.log_path, encoding="utf-8", errors="replace") as log:
+            tail = log.read()[-2000:]
+        raise RuntimeError(f"Server không khởi động được sau {timeout}s:\n{tail}")
+
+    def stop(self, timeout=10):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            # SIGTERM: server dừng supervisor và dọn dẹp như khi bị tắt dịch vụ
+            self.process.terminate()
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+
+def scrape_metrics(server_url):
+    """Đọc /metrics thành dict {'tên{nhãn}': giá trị}."""
+    response = requests.get(f"{server_url}/metrics", timeout=5)
+    response.raise_for_status()
+    values = {}
+    for line in response.text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, value = line.rsplit(" ", 1)
+        values[name] = float(value)
+    return values
+
+
+def metric_sum(values, name):
+    """Tổng của metric qua mọi nhãn (vd. cộng các phiên)."""
+    return sum(value for key, value in values.items() if key == name or key.startswith(name + "{"))
+
+
+def latency_ms(values, name):
+    return {
+        label: round(values.get(f'{name}{{quantile="{quantile}"}}', 0.0) * 1000, 3)
+        for label, quantile in (("p50", "0.5"), ("p99", "0.99"), ("p999", "0.999"))
+    }
+
+
+def histogram_summary(histogram):
+    summary = histogram.summary()
+    return {
+        "p50": summary["p50_us"],
+        "p99": summary["p99_us"],
+        "p999": summary["p999_us"],
+        "max": summary["max_us"],
+        "mean": summary["mean_us"],
+    }
+
+
+def run_benchmark(options, server_url=None):
+    """Một lần chạy: khởi động server (nếu cần), N process client, trả về dict kết quả."""
+    server = None
+    if server_url is None:
+        server = LocalServer(options["server_mode"])
+        server_url = server.start()
+    context = multiprocessing.get_context("spawn")
+    messages = context.Queue()
+    start = context.Event()
+    processes = [context.Process(target=run_client, args=(index, server_url, options, messages, start), daemon=True)
+                 for index in range(options["clients"])]
+    try:
+        for process in processes:
+            process.start()
+
+        errors = []
+        ready = 0
+        while ready + len(errors) < len(processes):
+            message = messages.get(timeout=60)
+            if message[0] == "ready":
+                ready += 1
+            else:
+                errors.append(message[2])
+        if errors:
+            raise RuntimeError(f"Client không kết nối được: {errors[0]}")
+
+        before = scrape_metrics(server_url)
+        start.set()
+        results = []
+        while len(results) < len(processes):
+            message = messages.get(timeout=options["duration"] + 60)
+            if message[0] == "error":
+                raise RuntimeError(f"Client {message[1]} lỗi: {message[2]}")
+            results.append(message[1])
+        # Chờ dispatcher xử lý nốt các frame còn trong hàng đợi
+        time.sleep(0.5)
+        after = scrape_metrics(server_url)
+    finally:
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        if server is not None:
+            server.stop()
+            shutil.rmtree(server.workdir, ignore_errors=True)
+
+    def delta(name):
+        return metric_sum(after, name) - metric_sum(before, name)
+
+    duration = max(result["duration_s"] for result in results)
+    frames = sum(result["frames"] for result in results)
+    generated = frames + sum(result["skipped"] for result in results)
+    cpu = sum(result["cpu_s"] for result in results)
+    send_us = LatencyHistogram()
+    for result in results:
+        send_us.merge(result["send_us"])
+    received = delta("rc_frames_received_total")
+    accepted = delta("rc_frames_accepted_total")
+    return dict(options, **{
+        "transport_used": sorted({result["transport_used"] for result in results}),
+        "fresh_server": server is not None,
+        "client": {
+            "frames": frames,
+            "failed": sum(result["failed"] for result in results),
+            "skipped": sum(result["skipped"] for result in results),
+            "rate": round(generated / duration, 1),
+            "cpu_us_per_frame": round(cpu / generated * 1e6, 2) if generated else 0.0,
+            "send_us": histogram_summary(send_us),
+        },
+        "server": {
+            "frames": int(accepted),
+            "fps": round(accepted / duration, 1),
+            "received": int(received),
+            "redundant": int(delta("rc_session_reordered_total")),
+            "dispatched": int(delta('rc_dispatch_frames_total{result="dispatched"}')),
+            "coalesced": int(delta('rc_dispatch_frames_total{result="coalesced"}')),
+            "overflow": int(delta('rc_dispatch_frames_total{result="overflow"}')),
+            "rate_limited": int(delta("rc_session_rate_limited_total")),
+            "lost": int(delta("rc_session_lost_frames_total")),
+            "receive_latency_ms": latency_ms(after, "rc_receive_latency_seconds"),
+            "dispatch_latency_ms": latency_ms(after, "rc_dispatch_latency_seconds"),
+        },
+    })
+
+
+def run_key(run):
+    # Kết quả cũ không có server_mode: khi đó server chạy gevent (mặc định)
+    return (run.get("server_mode", "gevent"),) + tuple(
+        run[key] for key in ("transport", "wire_format", "layer", "pattern", "clients", "rate"))
+
+
+def underdelivered(run):
+    """Server chấp nhận ít hơn MIN_DELIVERED_RATIO tải gửi vào (chỉ xét tốc độ cố định, input đổi mỗi frame)."""
+    if run["rate"] <= 0 or run["pattern"] not in ("sweep", "mash"):
+        return False
+    return run["server"]["fps"] < MIN_DELIVERED_RATIO * run["rate"] * run["clients"]
+
+
+def rate_limited(run):
+    """Server bỏ frame vì giới hạn tốc độ dù mỗi client gửi không quá SESSION_RATE_LIMIT frame/s."""
+    return 0 < run["rate"] <= SESSION_RATE_LIMIT and run["server"].get("rate_limited", 0) > 0
+
+
+def lookup(run, path):
+    value = run
+    for part in path.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(baseline, current, threshold):
+    """In bảng so sánh; trả về danh sách các regression vượt ngưỡng."""
+    baseline_runs = {run_key(run): run for run in baseline["runs"]}
+    regressions = []
+    for run in current["runs"]:
+        key = run_key(run)
+        base = baseline_runs.get(key)
+        print(f"\n{'/'.join(str(part) for part in key)}")
+        if base is None:
+            print("  (không có trong baseline)")
+            continue
+        for path, higher_is_better, min_delta in COMPARE_METRICS:
+            old, new = lookup(base, path), lookup(run, path)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            worse = (old - new) if higher_is_better else (new - old)
+            regressed = worse > min_delta and old and worse / old > threshold
+            flag = "  REGRESSION" if regressed else ""
+            print(f"  {path:34} {old:>12} -> {new:<12} {change:+.1%}{flag}")
+            if regressed:
+                regressions.append((key, path, old, new))
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def split_list(value, cast=str):
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transport", default="ws", help="comma-separated: ws,http,udp")
+    parser.add_argument("--wire-format", default="binary", choices=("binary", "json"))
+    parser.add_argument("--layer", default="client", choices=LAYERS,
+                        help="send through RemoteClient.send_controller_data or straight to the transport")
+    parser.add_argument("--pattern", default="sweep", help=f"comma-separated: {','.join(PATTERNS)}")
+    parser.add_argument("--clients", default="1", help="comma-separated numbers of concurrent clients")
+    parser.add_argument("--rate", default="250", help="comma-separated frames/s per client, 0 = as fast as possible")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--server-url", help="benchmark an already running server instead of starting one")
+    parser.add_argument("--server-mode", default="gevent", help=f"comma-separated: {','.join(SERVER_MODES)}")
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        print(f"\n{len(regressions)} regression vượt {args.threshold:.0%}")
+        raise SystemExit(1 if regressions else 0)
+
+    for pattern in split_list(args.pattern):
+        if pattern not in PATTERNS:
+            parser.error(f"unknown pattern: {pattern}")
+    for server_mode in split_list(args.server_mode):
+        if server_mode not in SERVER_MODES:
+            parser.error(f"unknown server mode: {server_mode}")
+
+    runs = []
+    for server_mode, transport, pattern, clients, rate in itertools.product(
+            split_list(args.server_mode), split_list(args.transport), split_list(args.pattern),
+            split_list(args.clients, int), split_list(args.rate, float)):
+        options = {
+            "server_mode": server_mode,
+            "transport": transport,
+            "wire_format": args.wire_format,
+            "layer": args.layer,
+            "pattern": pattern,
+            "clients": clients,
+            "rate": rate,
+            "duration": args.duration,
+        }
+        print(f"⏱️ {server_mode} {transport} {args.layer} {pattern} x{clients} @ {rate or 'max'} frame/s "
+              f"trong {args.duration}s...")
+        run = run_benchmark(options, args.server_url)
+        runs.append(run)
+        print(f"   server {run['server']['fps']} fps, dispatch p50/p99/p999 "
+              f"{run['server']['dispatch_latency_ms']['p50']}/{run['server']['dispatch_latency_ms']['p99']}/"
+              f"{run['server']['dispatch_latency_ms']['p999']} ms, client {run['client']['cpu_us_per_frame']} µs CPU/frame")
+
+    results = {
+        "meta": {
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"📝 Đã ghi {args.output}")
+
+    failures = 0
+    for run in runs:
+        name = '/'.join(str(part) for part in run_key(run))
+        if underdelivered(run):
+            failures += 1
+            print(f"❌ {name}: server chỉ chấp nhận {run['server']['fps']} "
+                  f"trên {run['rate'] * run['clients']:g} frame/s gửi vào")
+        if rate_limited(run):
+            failures += 1
+            print(f"❌ {name}: server bỏ {run['server']['rate_limited']} frame vì giới hạn tốc độ "
+                  f"ở {run['rate']:g} frame/s mỗi client")
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
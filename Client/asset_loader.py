@@ -0,0 +1,126 @@
+﻿import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+# Built by `python -m Client.build_atlas`; not committed
+ATLAS_IMAGE = 'atlas.png'
+ATLAS_INDEX = 'atlas.json'
+
+ASSET_FILES = {
+    'icon': 'icon.png',
+    'center_pad': 'center-pad.png',
+    'highlight': 'highlight.png',
+    'speaker': 'speaker.png',
+    'ps_logo_under': 'ps_logo_under.png',
+    'ps_logo_upper': 'ps_logo_upper.png',
+    'ps_logo_under_layout': 'ps_logo_under_layout.png',
+    'ps_logo_upper_layout': 'ps_logo_upper_layout.png',
+    'voice_button': 'voice_button.png',
+    'voice_button_highlight': 'voice_button_highlight.png',
+    'icon_mute': 'icon-mute.png',
+    'loudspeaker': 'loudspeaker.png',
+    'button_circle': 'button-circle.png',
+    'button_cross': 'button-cross.png',
+    'button_square': 'button-square.png',
+    'button_triangle': 'button-triangle.png',
+    'right_side': 'right_side.png',
+    'left_side': 'left-side.png',
+    'blue_highlight_right': 'blue_highlight_right.png',
+    'blue_highlight_left': 'blue_highlight_left.png',
+    'black_right': 'black_right.png',
+    'black_left': 'black_left.png',
+    'white_right': 'white_right_highlight.png',
+    'white_left': 'white_left_highlight.png',
+    'right_analog_stick': 'right_analog_stick.png',
+    'dpad_up': 'dpad_up.png',
+    'dpad_down': 'dpad_down.png',
+    'dpad_left': 'dpad_left.png',
+    'dpad_right': 'dpad_right.png',
+    'r1': 'R1.png',
+    'l1': 'L1.png',
+    'joystick': 'joystick.png',
+    'left_icon': 'left_icon.png',
+    'right_icon': 'right_icon.png',
+    'share_button': 'share_button.png',
+    'option_button': 'option_button.png',
+    'l2': 'L2.png',
+    'r2': 'R2.png',
+}
+
+
+def _decode(path):
+    try:
+        return pygame.image.load(path)
+    except (pygame.error, FileNotFoundError) as e:
+        print(f"Could not load {path}: {e}")
+        return None
+
+
+def load_assets(asset_files=ASSET_FILES, asset_dir=ASSET_DIR, max_workers=8):
+    """Decode the PNGs on a thread pool, then convert them for fast blitting.
+
+    convert_alpha() needs the display mode to be set, so it runs on the calling (main)
+    thread once all files are decoded. Missing or broken files become a magenta
+    placeholder instead of stopping startup.
+    """
+    names = list(asset_files)
+    paths = [os.path.join(asset_dir, asset_files[name]) for name in names]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths) or 1)) as pool:
+        decoded = list(pool.map(_decode, paths))
+
+    assets = {}
+    for name, surface in zip(names, decoded):
+        if surface is None:
+            # Create a placeholder surface
+            surface = pygame.Surface((50, 50), pygame.SRCALPHA)
+            surface.fill((255, 0, 255, 128))
+            assets[name] = surface
+        else:
+            assets[name] = surface.convert_alpha()
+    return assets
+
+
+class Atlas:
+    """One decoded atlas image and the sub-rectangle of every asset packed into it"""
+
+    def __init__(self, surface, rects):
+        self.surface = surface
+        self.rects = rects
+
+    def subsurfaces(self):
+        """Asset surfaces that share the atlas pixels instead of holding their own copy"""
+        return {name: self.surface.subsurface(rect) for name, rect in self.rects.items()}
+
+
+def load_atlas(asset_files=ASSET_FILES, asset_dir=ASSET_DIR):
+    """Load the packed atlas if it is complete and newer than every source PNG, otherwise None"""
+    index_path = os.path.join(asset_dir, ATLAS_INDEX)
+    try:
+        with open(index_path, encoding='utf-8') as f:
+            index = json.load(f)
+        image_path = os.path.join(asset_dir, index['image'])
+        sprites = index['sprites']
+        built_at = min(os.path.getmtime(index_path), os.path.getmtime(image_path))
+    except (OSError, ValueError, KeyError):
+        return None
+
+    for name, filename in asset_files.items():
+        sprite = sprites.get(name)
+        if sprite is None or sprite.get('file') != filename:
+            print("Atlas does not match the asset list, run `python -m Client.build_atlas`")
+            return None
+        source_path = os.path.join(asset_dir, filename)
+        if os.path.exists(source_path) and os.path.getmtime(source_path) > built_at:
+            print(f"Atlas is older than {filename}, run `python -m Client.build_atlas`")
+            return None
+
+    try:
+        surface = pygame.image.load(image_path).convert_alpha()
+    except pygame.error as e:
+        print(f"Could not load {image_path}: {e}")
+        return None
+    rects = {name: pygame.Rect(sprites[name]['rect']) for name in asset_files}
+    return Atlas(surface, rects)
@@ -0,0 +1,65 @@
+﻿"""Pack the client assets into one texture atlas.
+
+    python -m Client.build_atlas [--padding 2] [--max-width 1600]
+
+Writes Client/assets/atlas.png and Client/assets/atlas.json (sub-rectangle of every
+asset). Both are build artifacts: rerun after changing any PNG. The client falls
+back to the individual PNGs when the atlas is missing or older than its sources.
+"""
+import argparse
+import json
+import os
+import pygame
+from Client.asset_loader import ASSET_DIR, ASSET_FILES, ATLAS_IMAGE, ATLAS_INDEX
+
+
+def pack(sizes, padding, max_width):
+    """Shelf packing, tallest first. Returns ({name: (x, y)}, (width, height))."""
+    positions = {}
+    x = y = shelf_height = width = 0
+    for name, (w, h) in sorted(sizes.items(), key=lambda item: (-item[1][1], -item[1][0], item[0])):
+        cell_w, cell_h = w + 2 * padding, h + 2 * padding
+        if x and x + cell_w > max_width:
+            y += shelf_height
+            x = shelf_height = 0
+        positions[name] = (x + padding, y + padding)
+        x += cell_w
+        shelf_height = max(shelf_height, cell_h)
+        width = max(width, x)
+    return positions, (width, y + shelf_height)
+
+
+def build_atlas(asset_files=ASSET_FILES, asset_dir=ASSET_DIR, padding=2, max_width=1600):
+    surfaces = {name: pygame.image.load(os.path.join(asset_dir, filename))
+                for name, filename in asset_files.items()}
+    positions, size = pack({name: surface.get_size() for name, surface in surfaces.items()},
+                           padding, max_width)
+
+    # Transparent gutters keep smoothscale from bleeding neighbours into each other
+    atlas = pygame.Surface(size, pygame.SRCALPHA)
+    atlas.fill((0, 0, 0, 0))
+    sprites = {}
+    for name, surface in surfaces.items():
+        atlas.blit(surface, positions[name])
+        sprites[name] = {"file": asset_files[name], "rect": [*positions[name], *surface.get_size()]}
+
+    pygame.image.save(atlas, os.path.join(asset_dir, ATLAS_IMAGE))
+    index = {"image": ATLAS_IMAGE, "size": list(size), "padding": padding, "sprites": sprites}
+    with open(os.path.join(asset_dir, ATLAS_INDEX), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--padding", type=int, default=2, help="transparent pixels around each sprite")
+    parser.add_argument("--max-width", type=int, default=1600)
+    args = parser.parse_args()
+
+    index = build_atlas(padding=args.padding, max_width=args.max_width)
+    width, height = index["size"]
+    print(f"Packed {len(index['sprites'])} assets into {ATLAS_IMAGE} ({width}x{height})")
+
+
+if __name__ == "__main__":
+    main()
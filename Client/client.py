@@ -1,61 +1,248 @@
-﻿import requests
-from FireBase.firebase_controller import FirebaseController
+﻿import threading
+import time
+from FireBase.discovery_backends import DEFAULT_DISCOVERY_BACKEND, create_discovery
+from Client.discovery import ServerUrlDiscovery, DEFAULT_CACHE_PATH, DEFAULT_CACHE_TTL
+from Client.transport import HttpTransport, UdpTransport, WebSocketTransport
+from Common.protocol import FrameEncoder
+
+# Gửi lỗi liên tiếp chừng này lần thì hỏi lại Firebase xem tunnel đã đổi chưa
+URL_REFRESH_FAILURES = 3
+URL_REFRESH_INTERVAL = 10  # giây tối thiểu giữa hai lần hỏi lại
 
 class RemoteClient:
     def __init__(self,
                  firebase_cred_path="../Firebase/service-account-key.json",
-                 timeout=10):
-        self.firebase = FirebaseController(
-            cred_path=firebase_cred_path
-        )
+                 timeout=10,
+                 transport="ws",
+                 wire_format="binary",
+                 keyframe_interval=60,
+                 connect_timeout=3.05,
+                 max_in_flight=4,
+                 http2=False,
+                 udp_host=None,
+                 udp_redundancy=2,
+                 udp_loss=0.0,
+                 udp_jitter_ms=0.0,
+                 url_cache_path=DEFAULT_CACHE_PATH,
+                 url_cache_ttl=DEFAULT_CACHE_TTL,
+                 watch_url=True,
+                 discovery_backend=None):
+        # URL server: cache trên đĩa, rồi nguồn discovery (mặc định Firebase, xem RC_DISCOVERY_BACKEND);
+        # listener realtime báo khi tunnel đổi
+        discovery_backend = discovery_backend or DEFAULT_DISCOVERY_BACKEND
+        if discovery_backend != "firebase":
+            # Nguồn local đọc tức thì và URL đổi theo mỗi lần chạy: không cần cache
+            url_cache_path = None
+        self.discovery = ServerUrlDiscovery(lambda: create_discovery(discovery_backend, cred_path=firebase_cred_path),
+                                            cache_path=url_cache_path, ttl=url_cache_ttl)
         self.timeout = timeout
-        self.server_url = self.get_server_url()
+        self.http_options = {
+            "connect_timeout": connect_timeout,
+            "read_timeout": timeout,
+            "max_in_flight": max_in_flight,
+            "http2": http2,
+        }
+        self.requested_transport = transport
+        self.requested_format = "binary" if transport == "udp" else wire_format
+        self.keyframe_interval = keyframe_interval
+        self.udp_options = {
+            "host": udp_host,
+            "redundancy": udp_redundancy,
+            "loss": udp_loss,
+            "jitter_ms": udp_jitter_ms,
+        }
+        self.last_state = None
+        self.pending_url = None
+        self.send_failures = 0
+        self.last_url_refresh = 0.0
+
+        self.connect(self.get_server_url())
+        if not self.server_info and self.discovery.from_cache:
+            # Server không trả lời URL trong cache: tunnel có thể đã đổi, hỏi lại Firebase
+            self.refresh_server_url()
+
+        if watch_url:
+            # Khởi tạo Firebase và mở listener ở nền, không làm chậm lúc khởi động
+            threading.Thread(target=self.discovery.watch, args=(self.on_server_url_changed,), daemon=True).start()
+
+    def connect(self, server_url):
+        """Mở kết nối tới server_url: thoả thuận định dạng frame, phiên làm việc và transport."""
+        self.server_url = server_url
+        # Session giữ kết nối dùng chung cho check-connection và gửi frame qua HTTP
+        self.http_transport = HttpTransport(self.server_url, **self.http_options)
+        self.http_failed_seen = 0
+        self.server_info = {}
+        self.wire_format = self.negotiate_wire_format(self.requested_format)
+        transport = self.requested_transport
+        keyframe_interval = self.keyframe_interval
+        udp_host = self.udp_options["host"] or self.server_info.get("udp_host")
+        if transport == "udp" and self.wire_format == "binary" and self.server_info.get("udp_port") and udp_host:
+            # Mỗi datagram phải tự đủ thông tin: chỉ gửi keyframe
+            keyframe_interval = 0
+        elif transport == "udp":
+            if self.server_info.get("udp_port") and not udp_host:
+                # Host của server_url là tunnel HTTP (ngrok), không chuyển UDP: gửi tới đó là mất hết
+                print("⚠️ Server không cho biết host nhận UDP (đặt udp_host hoặc RC_UDP_HOST trên server).")
+            else:
+                print("⚠️ Server không hỗ trợ UDP.")
+            transport = "ws"
+        self.transport = self.create_transport(transport)
+        if self.transport is self.http_transport and self.http_transport.max_in_flight > 1:
+            # Các POST song song có thể tới server sai thứ tự, delta đến trễ bị bỏ (mất nhả nút):
+            # mỗi frame phải tự đủ thông tin như với UDP
+            keyframe_interval = 0
+        self.encoder = FrameEncoder(self.wire_format, keyframe_interval=keyframe_interval)
+
+    def switch_server(self, server_url):
+        """Chuyển sang URL mới (tunnel được xoay): đóng kết nối cũ, mở lại, frame kế tiếp là keyframe."""
+        print(f"🔀 Server đổi URL: {self.server_url} -> {server_url}")
+        self.close_transports()
+        self.connect(server_url)
+        self.send_failures = 0
+
+    def on_server_url_changed(self, url):
+        """Listener của Firebase: chỉ ghi nhận, luồng gửi sẽ chuyển server ở lần gửi kế tiếp."""
+        if url != self.server_url:
+            self.pending_url = url
+
+    def refresh_server_url(self):
+        """Bỏ qua cache, hỏi lại Firebase; chuyển server nếu URL đã đổi."""
+        self.last_url_refresh = time.monotonic()
+        try:
+            url = self.discovery.get_url(use_cache=False)
+        except Exception as e:
+            print(f"❌ Không lấy được server_url: {e}")
+            return False
+        if url and url != self.server_url:
+            self.switch_server(url)
+            return True
+        return False
+
+    def apply_server_url_change(self):
+        """Gọi trên luồng gửi: áp dụng URL mới do listener báo hoặc tự tìm lại khi gửi lỗi liên tục."""
+        url, self.pending_url = self.pending_url, None
+        if url and url != self.server_url:
+            self.switch_server(url)
+        elif (self.send_failures >= URL_REFRESH_FAILURES
+              and time.monotonic() - self.last_url_refresh >= URL_REFRESH_INTERVAL):
+            self.refresh_server_url()
+
+    def create_transport(self, name):
+        """Tạo transport gửi dữ liệu; WebSocket/UDP không mở được thì quay về HTTP."""
+        if name == "udp":
+            # Tunnel HTTP không chuyển UDP: chỉ gửi tới host do người dùng hoặc server chỉ định
+            host = self.udp_options["host"] or self.server_info["udp_host"]
+            udp_transport = UdpTransport(host, self.server_info["udp_port"],
+                                         session_id=self.session_id,
+                                         redundancy=self.udp_options["redundancy"],
+                                         loss=self.udp_options["loss"],
+                                         jitter_ms=self.udp_options["jitter_ms"])
+            if udp_transport.connect():
+                return udp_transport
+            print("↩️ Chuyển sang gửi dữ liệu qua HTTP.")
+        if name == "ws":
+            ws_transport = WebSocketTransport(self.server_url, session_id=self.session_id)
+            if ws_transport.connect():
+                return ws_transport
+            print("↩️ Chuyển sang gửi dữ liệu qua HTTP.")
+        return self.http_transport
+
+    @property
+    def session_id(self):
+        return self.server_info.get("session_id")
 
     def get_server_url(self):
-        url = self.firebase.get_url()
+        url = self.discovery.get_url()
         if not url:
             raise ValueError("❌ Không tìm thấy server_url trong Firebase.")
-        print(f"🌐 Lấy server_url từ Firebase: {url}")
         return url
 
+    def negotiate_wire_format(self, preferred):
+        """Hỏi server các định dạng frame hỗ trợ; server cũ không khai báo thì dùng JSON."""
+        if preferred == "json":
+            return "json"
+        try:
+            response = self.http_transport.get("/check-connection")
+            if response.status_code == 200:
+                self.server_info = response.json()
+        except self.http_transport.errors + (ValueError,):
+            pass
+        if self.session_id:
+            print(f"🪪 Phiên làm việc: {self.session_id}")
+            self.http_transport.set_session(self.session_id)
+        formats = self.server_info.get("formats", ["json"])
+        wire_format = preferred if preferred in formats else "json"
+        print(f"📦 Định dạng frame: {wire_format}")
+        return wire_format
+
     def check_connection(self):
         """Gửi request GET để kiểm tra kết nối đến server."""
         try:
             print(f"🔍 Gửi request đến: {self.server_url}/check-connection")
-            response = requests.get(f"{self.server_url}/check-connection", timeout=self.timeout)
+            response = self.http_transport.get("/check-connection")
             if response.status_code == 200:
                 print("✅ Kết nối thành công:", response.json())
                 return True
             else:
                 print(f"⚠️ Phản hồi lỗi từ server: {response.status_code}")
                 return False
-        except requests.RequestException as e:
+        except self.http_transport.errors as e:
             print("❌ Lỗi khi kết nối đến server:", e)
             return False
 
-    def send_controller_data(self, button_states, axis_values, hat_values):
-        """Gửi dữ liệu trạng thái bộ điều khiển đến server."""
+    def send_controller_data(self, button_states, axis_values, hat_values, timestamp=None):
+        """Gửi dữ liệu trạng thái bộ điều khiển đến server (timestamp: lúc lấy mẫu, mili giây)."""
         if not self.server_url:
             print("❌ Không có URL server để gửi dữ liệu.")
             return False
+        self.apply_server_url_change()
 
-        data = {
-            "button_states": button_states,
-            "axis_values": axis_values,
-            "hat_values": hat_values
-        }
+        # Nút bấm hoặc D-pad đổi trạng thái là input quan trọng (UDP gửi kèm bản dự phòng)
+        important = (self.last_state is None or
+                     button_states != self.last_state[0] or hat_values != self.last_state[2])
+        self.last_state = (button_states, axis_values, hat_values)
+        # Chỉ gửi phần đã thay đổi, định kỳ kèm keyframe đầy đủ
+        data = self.encoder.encode(button_states, axis_values, hat_values, timestamp=timestamp)
+        if data is None:
+            return True
         try:
-            # print(f"🎮 Gửi dữ liệu điều khiển đến: {self.server_url}/controller-input")
-            response = requests.post(f"{self.server_url}/controller-input", json=data, timeout=self.timeout)
-            if response.status_code == 200:
-                # print("✅ Dữ liệu điều khiển đã gửi thành công.", response.json())
-                return True
+            if self.transport.name == "udp":
+                sent = self.transport.send(data, important=important)
             else:
-                print(f"⚠️ Lỗi gửi dữ liệu điều khiển: {response.status_code} - {response.text}")
-                return False
-        except requests.RequestException as e:
+                sent = self.transport.send(data)
+            if not sent and self.transport is not self.http_transport:
+                # WebSocket hỏng hẳn: gửi frame này qua HTTP để không mất input
+                sent = self.http_transport.send(data)
+        except self.http_transport.errors as e:
             print(f"❌ Lỗi khi gửi dữ liệu điều khiển: {e}")
-            return False
+            sent = False
+
+        # Frame delta bị mất hoặc server xin lại: frame kế tiếp sẽ là keyframe
+        if not sent or self.transport.poll_keyframe_request() or self.http_transport.poll_keyframe_request():
+            self.encoder.request_keyframe()
+        # HTTP gửi bất đồng bộ: lỗi chỉ hiện ra ở bộ đếm failed của transport
+        http_failed, self.http_failed_seen = self.http_transport.failed > self.http_failed_seen, self.http_transport.failed
+        self.send_failures = 0 if sent and not http_failed else self.send_failures + 1
+        return sent
+
+    def resend_keyframe_if_requested(self):
+        """Khi input đứng yên mà server (hoặc một lần gửi lỗi) cần keyframe, gửi lại trạng thái cuối."""
+        self.apply_server_url_change()
+        if self.transport.poll_keyframe_request() or self.http_transport.poll_keyframe_request():
+            self.encoder.request_keyframe()
+        if self.encoder.keyframe_pending and self.last_state is not None:
+            return self.send_controller_data(*self.last_state)
+        return True
+
+    def close_transports(self):
+        self.transport.close()
+        if self.transport is not self.http_transport:
+            self.http_transport.close()
+
+    def close(self):
+        """Đóng các kết nối lâu dài tới server và ngừng theo dõi server_url."""
+        self.close_transports()
+        self.discovery.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+﻿import json
+import math
+import os
+from Common.protocol import AXIS_NAMES
+
+DEFAULT_PROFILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input_profile.json")
+
+# Giá trị mặc định cho trục không có trong profile: không lọc gì, giữ hành vi cũ
+PASSTHROUGH = {
+    "center": 0.0,
+    "deadzone": 0.0,
+    "quantize": 0.0,
+    "hysteresis": 0.0,
+    "smoothing": 0.0,
+}
+
+# EMA cách giá trị đích ít hơn chừng này thì coi như đã hội tụ, không cần tick() nữa
+SETTLE_EPSILON = 1e-4
+
+
+class AxisFilter:
+    """Lọc một trục analog: làm mượt EMA -> deadzone -> lượng tử hoá -> hysteresis.
+
+    - center: vị trí nghỉ của trục (0 với cần analog, -1 với cò L2/R2).
+    - deadzone: tỉ lệ hành trình quanh center bị ép về center; phần còn lại được co giãn
+      lại để vẫn đạt tới ±1.
+    - quantize: bước lượng tử (0 = tắt).
+    - hysteresis: chỉ nhận giá trị mới khi lệch khỏi giá trị đã gửi ít nhất chừng này;
+      về center hoặc chạm biên luôn được nhận ngay.
+    - smoothing: hệ số EMA trong [0, 1), càng lớn càng mượt (0 = tắt). Tiến một bước mỗi
+      mẫu mới, và mỗi chu kỳ lấy mẫu không có mẫu mới thì tick() tiến tiếp với mẫu cuối để
+      cần giữ yên vẫn hội tụ. Bị xoá khi trục về deadzone để nhả cần không bị trễ.
+    """
+
+    def __init__(self, center=0.0, deadzone=0.0, quantize=0.0, hysteresis=0.0, smoothing=0.0):
+        if not 0.0 <= deadzone < 1.0:
+            raise ValueError(f"deadzone phải trong [0, 1): {deadzone}")
+        if not 0.0 <= smoothing < 1.0:
+            raise ValueError(f"smoothing phải trong [0, 1): {smoothing}")
+        self.center = center
+        self.deadzone = deadzone
+        self.quantize = quantize
+        self.hysteresis = hysteresis
+        self.smoothing = smoothing
+        self.smoothed = None
+        self.target = None
+        self.raw = None
+        self.fresh = False
+        self.output = center
+
+    def reset(self, value=None):
+        self.smoothed = None
+        self.target = None
+        self.raw = None
+        self.fresh = False
+        self.output = self.center if value is None else value
+
+    @property
+    def settling(self):
+        """EMA chưa tới giá trị của mẫu cuối cùng."""
+        return self.smoothed is not None and self.smoothed != self.target
+
+    def tick(self):
+        """Gọi mỗi chu kỳ lấy mẫu: nếu chu kỳ này không có mẫu mới, tiến EMA với mẫu cuối."""
+        if self.fresh:
+            self.fresh = False
+            return self.output
+        if not self.settling:
+            return self.output
+        return self._filter(self.raw)
+
+    def _apply_deadzone(self, value):
+        offset = value - self.center
+        span = (1.0 - self.center) if offset >= 0 else (self.center + 1.0)
+        if span <= 0 or abs(offset) <= self.deadzone * span:
+            return None
+        scaled = (abs(offset) - self.deadzone * span) / (1.0 - self.deadzone)
+        return self.center + math.copysign(scaled, offset)
+
+    def __call__(self, raw):
+        self.raw = raw
+        self.fresh = True
+        return self._filter(raw)
+
+    def _filter(self, raw):
+        value = self._apply_deadzone(raw)
+        if value is None:
+            self.smoothed = None
+            self.target = None
+            self.output = self.center
+            return self.output
+
+        if self.smoothing:
+            self.target = value
+            if self.smoothed is None:
+                self.smoothed = value
+            else:
+                self.smoothed += (1.0 - self.smoothing) * (value - self.smoothed)
+                if abs(value - self.smoothed) < SETTLE_EPSILON:
+                    self.smoothed = value
+            value = self.smoothed
+
+        if self.quantize:
+            value = round(value / self.quantize) * self.quantize
+        value = max(-1.0, min(1.0, value))
+
+        if (abs(value - self.output) >= self.hysteresis or value == self.center
+                or value in (-1.0, 1.0)):
+            self.output = value
+        return self.output
+
+
+class InputConditioner:
+    """Bộ lọc cho từng trục theo profile JSON, đặt trước bước phát hiện thay đổi.
+
+    Profile có dạng {"default": {...}, "axes": {"left_stick_x": {...}, "l2": {...}}}; mỗi
+    trục lấy "default" rồi ghi đè bằng phần riêng của nó. Nhiễu analog lúc cần đứng yên
+    không còn làm đổi giá trị nên cũng không sinh ra lượt gửi mạng.
+    """
+
+    def __init__(self, profile=None, axis_names=AXIS_NAMES):
+        self.profile = profile or {}
+        self.axis_names = axis_names
+        self.filters = {}
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_PROFILE_PATH):
+        """Đọc profile; thiếu file thì trả về bộ lọc không làm gì."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                profile = json.load(f)
+        except FileNotFoundError:
+            print(f"⚠️ Không tìm thấy profile input {path}, không lọc trục.")
+            profile = {}
+        return cls(profile)
+
+    def settings(self, axis_name):
+        settings = dict(PASSTHROUGH)
+        settings.update(self.profile.get("default", {}))
+        settings.update(self.profile.get("axes", {}).get(axis_name, {}))
+        return settings
+
+    def filter(self, axis):
+        axis_filter = self.filters.get(axis)
+        if axis_filter is None:
+            axis_name = self.axis_names.get(axis, f"axis_{axis}")
+            axis_filter = self.filters[axis] = AxisFilter(**self.settings(axis_name))
+        return axis_filter
+
+    def __call__(self, axis, value):
+        return self.filter(axis)(value)
+
+    def tick(self):
+        """Tiến các trục còn đang làm mượt một chu kỳ; trả về {chỉ số trục: giá trị đã lọc}."""
+        return {axis: axis_filter.tick() for axis, axis_filter in self.filters.items()
+                if axis_filter.fresh or axis_filter.settling}
+
+    def reset(self):
+        self.filters = {}
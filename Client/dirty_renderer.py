@@ -0,0 +1,74 @@
+﻿class Widget:
+    """One retained controller part: its fixed screen bounds, a state snapshot and a draw call"""
+
+    def __init__(self, name, bounds, state, draw):
+        self.name = name
+        self.bounds = bounds
+        self.state = state
+        self.draw = draw
+
+
+def merge_rects(rects):
+    """Union overlapping rectangles so each screen area is redrawn and pushed only once"""
+    merged = []
+    for rect in rects:
+        rect = rect.copy()
+        changed = True
+        while changed:
+            changed = False
+            for other in merged:
+                if rect.colliderect(other):
+                    rect.union_ip(other)
+                    merged.remove(other)
+                    changed = True
+                    break
+        merged.append(rect)
+    return merged
+
+
+class DirtyRectRenderer:
+    """Redraw only the widgets whose state changed since the previous frame.
+
+    Each widget's bounds cover everything it can ever draw for the current layout,
+    so a changed widget is repainted by restoring the background under its bounds
+    and redrawing (clipped) every widget that overlaps them, in z-order. render()
+    returns the rectangles to pass to pygame.display.update(); an idle controller
+    returns an empty list and costs nothing.
+    """
+
+    def __init__(self):
+        self.previous_states = {}
+        self.background = None
+        self.full_redraw = True
+
+    def invalidate(self):
+        """Force a full redraw on the next frame (resize, screen switch)"""
+        self.full_redraw = True
+
+    def render(self, screen, draw_background, widgets):
+        states = {widget.name: widget.state() for widget in widgets}
+
+        if self.full_redraw or self.background is None:
+            draw_background()
+            self.background = screen.copy()
+            for widget in widgets:
+                widget.draw()
+            self.previous_states = states
+            self.full_redraw = False
+            return [screen.get_rect()]
+
+        dirty = [widget.bounds for widget in widgets
+                 if states[widget.name] != self.previous_states.get(widget.name)]
+        self.previous_states = states
+        if not dirty:
+            return []
+
+        dirty = merge_rects([rect.clip(screen.get_rect()) for rect in dirty])
+        for rect in dirty:
+            screen.set_clip(rect)
+            screen.blit(self.background, rect, rect)
+            for widget in widgets:
+                if widget.bounds.colliderect(rect):
+                    widget.draw()
+        screen.set_clip(None)
+        return dirty
@@ -0,0 +1,88 @@
+﻿import json
+import os
+import threading
+import time
+from Common.fileio import write_json_atomic
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".remote-controller", "server_url.json")
+DEFAULT_CACHE_TTL = 3600  # giây; server xoay tunnel mỗi giờ
+
+
+class ServerUrlDiscovery:
+    """Tìm URL server: cache trên đĩa (còn hạn TTL) rồi mới tới nguồn (Firebase).
+
+    Nguồn được tạo lười bằng source_factory và phải có get_url() và listen_url(callback)
+    (trả về đối tượng có close()), như FirebaseController. Khởi động lạnh với cache còn
+    hạn không phải chờ Firebase; URL trong cache có thể đã cũ nên người dùng gọi lại
+    get_url(use_cache=False) khi server không trả lời.
+    """
+
+    def __init__(self, source_factory, cache_path=DEFAULT_CACHE_PATH, ttl=DEFAULT_CACHE_TTL):
+        self._source_factory = source_factory
+        self._source = None
+        self._source_lock = threading.Lock()
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.from_cache = False
+        self.listener = None
+
+    @property
+    def source(self):
+        with self._source_lock:
+            if self._source is None:
+                self._source = self._source_factory()
+            return self._source
+
+    def read_cache(self):
+        """Trả về (url, tuổi tính bằng giây), hoặc (None, None) nếu không có cache."""
+        if not self.cache_path:
+            return None, None
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cached = json.load(f)
+            return cached["url"], time.time() - cached["fetched_at"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, None
+
+    def write_cache(self, url):
+        if not self.cache_path:
+            return
+        try:
+            write_json_atomic(self.cache_path, {"url": url, "fetched_at": time.time()})
+        except OSError as e:
+            print(f"⚠️ Không ghi được cache URL: {e}")
+
+    def get_url(self, use_cache=True):
+        if use_cache:
+            url, age = self.read_cache()
+            if url and age is not None and 0 <= age < self.ttl:
+                self.from_cache = True
+                print(f"🗂️ Lấy server_url từ cache ({int(age)}s trước): {url}")
+                return url
+
+        self.from_cache = False
+        url = self.source.get_url()
+        if url:
+            print(f"🌐 Lấy server_url từ nguồn discovery: {url}")
+            self.write_cache(url)
+        return url
+
+    def watch(self, callback):
+        """Gọi callback(url) mỗi khi nguồn báo URL mới (chạy trên luồng của listener)."""
+        def on_change(url):
+            if url:
+                self.write_cache(url)
+                callback(url)
+
+        try:
+            self.listener = self.source.listen_url(on_change)
+        except Exception as e:
+            print(f"⚠️ Không theo dõi được server_url: {e}")
+
+    def close(self):
+        if self.listener is not None:
+            try:
+                self.listener.close()
+            except Exception:
+                pass
+            self.listener = None
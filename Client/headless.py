@@ -0,0 +1,73 @@
+﻿"""Client không cửa sổ: chỉ lấy mẫu tay cầm và gửi input, dùng cho máy relay không có màn hình.
+
+    python -m Client.headless --poll-hz 1000 --transport udp
+    python -m Client.headless --record session.rclog   # ghi lại input để phát lại bằng Client.replay_log
+
+Không nạp asset, không vẽ; SDL chạy với video driver "dummy" chỉ để có hàng đợi sự kiện.
+Tay cầm cắm sau khi khởi động (hoặc rút ra cắm lại) được nhận tự động.
+"""
+import argparse
+import os
+import signal
+
+# Phải đặt trước khi SDL khởi tạo
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_JOYSTICK_THREAD", "1")
+# Không có cửa sổ nào được focus, vẫn phải nhận sự kiện tay cầm
+os.environ.setdefault("SDL_JOYSTICK_ALLOW_BACKGROUND_EVENTS", "1")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from Client.conditioning import DEFAULT_PROFILE_PATH
+from Client.input_log import InputRecorder
+from Client.input_sampler import DEFAULT_POLL_HZ
+from Client.pipeline import InputPipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--poll-hz", type=int, default=DEFAULT_POLL_HZ)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE_PATH, help="input conditioning profile (JSON)")
+    parser.add_argument("--transport", default="ws", choices=("ws", "http", "udp"))
+    parser.add_argument("--wire-format", default="binary", choices=("binary", "json"))
+    parser.add_argument("--firebase-cred", default=None, help="service account key used to look up the server URL")
+    parser.add_argument("--record", metavar="PATH", help="also write every input state to a binary log")
+    args = parser.parse_args()
+
+    # Chỉ khởi tạo phần cần thiết: hàng đợi sự kiện (qua video dummy) và joystick
+    pygame.display.init()
+    pygame.joystick.init()
+
+    client_options = {"transport": args.transport, "wire_format": args.wire_format}
+    if args.firebase_cred:
+        client_options["firebase_cred_path"] = args.firebase_cred
+    pipeline = InputPipeline(poll_hz=args.poll_hz, input_profile=args.profile, client_options=client_options)
+    pipeline.check_controller()
+    if not pipeline.controller_connected:
+        print("🎮 Đang chờ tay cầm được cắm vào...")
+
+    recorder = None
+    if args.record:
+        recorder = InputRecorder(args.record).start()
+        pipeline.add_listener(recorder.record)
+
+    # SIGTERM (dịch vụ bị tắt) dừng vòng lấy mẫu giống Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: pipeline.sampler.stop())
+
+    print(f"📡 Đang gửi input ở {args.poll_hz} Hz (Ctrl+C để dừng)")
+    try:
+        if not pipeline.run():
+            raise SystemExit(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+        print(f"Input pipeline stats: {pipeline.stats()}")
+        if recorder is not None:
+            recorder.stop()
+            print(f"Recorder stats: {recorder.stats()}")
+        pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
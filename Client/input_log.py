@@ -0,0 +1,105 @@
+﻿import queue
+import struct
+import threading
+import time
+from Common.protocol import encode_frame, decode_frame, ProtocolError
+
+# ========== INPUT LOG ==========
+# Mỗi lần ghi tạo một file mới, chỉ ghi nối thêm:
+#   header  8 byte magic
+#   bản ghi Q thời điểm (micro giây kể từ lúc bắt đầu ghi) | H độ dài | keyframe nhị phân
+# Mỗi bản ghi là một keyframe đầy đủ (xem Common/protocol.py) nên đọc được từ bất kỳ bản
+# ghi nào, và file bị cắt ngang (client bị tắt đột ngột) chỉ mất bản ghi cuối.
+LOG_MAGIC = b"RCLOG\x00\x01\n"
+_RECORD = struct.Struct("<QH")
+
+# Báo cho luồng ghi biết đã hết bản ghi
+_STOP = object()
+
+
+class InputRecorder:
+    """Ghi các trạng thái tay cầm vào log nhị phân bằng một luồng ghi riêng.
+
+    record() chỉ đóng gói frame và đẩy vào hàng đợi có giới hạn, không bao giờ chặn luồng
+    lấy mẫu: hàng đợi đầy thì bỏ bản ghi và đếm vào dropped. Dùng làm listener của
+    InputPipeline: pipeline.add_listener(recorder.record).
+    """
+
+    def __init__(self, path, queue_size=4096, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.started_at = None
+        self.file = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.file = open(self.path, "wb")
+        self.file.write(LOG_MAGIC)
+        self.started_at = time.monotonic()
+        self.thread.start()
+        return self
+
+    def record(self, button_states, axis_values, hat_values, timestamp=None):
+        if self.started_at is None:
+            return
+        elapsed_us = int((time.monotonic() - self.started_at) * 1e6)
+        frame = encode_frame(button_states, axis_values, hat_values, seq=self.recorded, timestamp=timestamp)
+        self.recorded += 1
+        try:
+            self.queue.put_nowait(_RECORD.pack(elapsed_us, len(frame)) + frame)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = None
+            if record is not None and record is not _STOP:
+                self.file.write(record)
+                self.written += 1
+            if record is _STOP or time.monotonic() - last_flush >= self.flush_interval:
+                self.file.flush()
+                last_flush = time.monotonic()
+            if record is _STOP:
+                break
+
+    def stop(self, timeout=5):
+        """Ghi nốt các bản ghi còn trong hàng đợi rồi đóng file."""
+        if self.file is None:
+            return
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+        self.file.close()
+        self.file = None
+
+    def stats(self):
+        return {
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+        }
+
+
+def read_input_log(path):
+    """Đọc lần lượt (thời điểm micro giây, frame đã giải mã) từ log; bỏ bản ghi cuối nếu bị cắt ngang."""
+    with open(path, "rb") as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ProtocolError(f"{path} không phải input log")
+        while True:
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return
+            elapsed_us, length = _RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield elapsed_us, decode_frame(payload)
@@ -0,0 +1,67 @@
+﻿import threading
+import time
+
+DEFAULT_POLL_HZ = 250
+
+
+class InputSampler:
+    """Luồng lấy mẫu input với tần số cố định (250/1000 Hz), tách khỏi tốc độ vẽ của cửa sổ.
+
+    sample() được gọi mỗi chu kỳ; lịch gọi bám theo mốc thời gian tuyệt đối nên không bị
+    trôi. Nếu một lần lấy mẫu chạy quá một chu kỳ thì bỏ qua các mốc đã lỡ (đếm vào
+    overruns) thay vì gọi dồn để đuổi kịp.
+    """
+
+    def __init__(self, sample, poll_hz=DEFAULT_POLL_HZ):
+        if poll_hz <= 0:
+            raise ValueError(f"Tần số lấy mẫu không hợp lệ: {poll_hz}")
+        self.sample = sample
+        self.poll_hz = poll_hz
+        self.period = 1.0 / poll_hz
+        self.samples = 0
+        self.overruns = 0
+        self.errors = 0
+        self.started_at = None
+        self._stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def run(self):
+        """Vòng lấy mẫu tới khi stop(); start() chạy nó ở luồng nền, hoặc gọi thẳng trên luồng chính."""
+        self.started_at = time.monotonic()
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Lỗi khi lấy mẫu input: {e}")
+            self.samples += 1
+
+            next_time += self.period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                # Chậm hơn một chu kỳ: bỏ các mốc đã lỡ, lấy mẫu tiếp ngay
+                missed = int(-delay / self.period)
+                if missed:
+                    self.overruns += missed
+                    next_time += missed * self.period
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "poll_hz": self.poll_hz,
+            "samples": self.samples,
+            "actual_hz": round(self.samples / elapsed, 1) if elapsed else 0.0,
+            "overruns": self.overruns,
+            "errors": self.errors,
+        }
@@ -0,0 +1,113 @@
+﻿from array import array
+import pygame
+
+# Sự kiện thay đổi input của tay cầm; các sự kiện cửa sổ vẫn để luồng chính xử lý
+JOYSTICK_EVENTS = (pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP, pygame.JOYHATMOTION)
+
+
+class JoystickState:
+    """Trạng thái tay cầm được cập nhật tại chỗ từ sự kiện joystick của pygame.
+
+    Nút lưu trong một bitmask, trục trong mảng double cấp phát sẵn, hat trong list cố định.
+    apply() chỉ bật cờ dirty khi giá trị thực sự đổi, nên lúc tay cầm đứng yên không
+    phải gọi get_button/get_axis cho từng chỉ số hay so sánh dict mỗi lần lấy mẫu.
+    Nếu có conditioner (xem Client/conditioning.py), giá trị trục được lọc trước khi so
+    sánh, nên nhiễu bị lọc mất cũng không làm bẩn trạng thái.
+    """
+
+    def __init__(self, num_buttons=0, num_axes=0, num_hats=0, instance_id=None, conditioner=None):
+        self.num_buttons = num_buttons
+        self.buttons = 0
+        self.axes = array('d', [0.0] * num_axes)
+        self.hats = [(0, 0)] * num_hats
+        self.instance_id = instance_id
+        self.conditioner = conditioner
+        self.dirty = False
+        self.events = 0
+        self.changes = 0
+
+    @classmethod
+    def from_joystick(cls, joystick, conditioner=None):
+        """Đọc toàn bộ trạng thái hiện tại của tay cầm một lần khi vừa kết nối."""
+        if conditioner is not None:
+            conditioner.reset()
+        state = cls(joystick.get_numbuttons(), joystick.get_numaxes(), joystick.get_numhats(),
+                    joystick.get_instance_id(), conditioner)
+        for i in range(state.num_buttons):
+            if joystick.get_button(i):
+                state.buttons |= 1 << i
+        for i in range(len(state.axes)):
+            state.axes[i] = state.condition(i, joystick.get_axis(i))
+        for i in range(len(state.hats)):
+            state.hats[i] = tuple(joystick.get_hat(i))
+        state.dirty = True
+        return state
+
+    def apply(self, event):
+        """Áp dụng một sự kiện joystick; trả về True nếu trạng thái thay đổi."""
+        if self.instance_id is not None and getattr(event, 'instance_id', self.instance_id) != self.instance_id:
+            return False
+        self.events += 1
+
+        if event.type == pygame.JOYAXISMOTION:
+            if event.axis >= len(self.axes):
+                return False
+            value = self.condition(event.axis, event.value)
+            if self.axes[event.axis] == value:
+                return False
+            self.axes[event.axis] = value
+        elif event.type in (pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP):
+            if event.button >= self.num_buttons:
+                return False
+            bit = 1 << event.button
+            buttons = self.buttons | bit if event.type == pygame.JOYBUTTONDOWN else self.buttons & ~bit
+            if buttons == self.buttons:
+                return False
+            self.buttons = buttons
+        elif event.type == pygame.JOYHATMOTION:
+            value = tuple(event.value)
+            if event.hat >= len(self.hats) or self.hats[event.hat] == value:
+                return False
+            self.hats[event.hat] = value
+        else:
+            return False
+
+        self.changes += 1
+        self.dirty = True
+        return True
+
+    def condition(self, axis, value):
+        if self.conditioner is None:
+            return value
+        return self.conditioner(axis, value)
+
+    def tick(self):
+        """Gọi mỗi chu kỳ lấy mẫu: trục đang làm mượt tiến tiếp dù tay cầm không gửi sự kiện mới."""
+        if self.conditioner is None:
+            return False
+        changed = False
+        for axis, value in self.conditioner.tick().items():
+            if axis < len(self.axes) and self.axes[axis] != value:
+                self.axes[axis] = value
+                self.changes += 1
+                self.dirty = True
+                changed = True
+        return changed
+
+    def apply_events(self, events):
+        changed = False
+        for event in events:
+            if self.apply(event):
+                changed = True
+        return changed
+
+    def button(self, index):
+        return (self.buttons >> index) & 1
+
+    def to_dicts(self, button_names, axis_names):
+        """Tạo dict nút/trục/hat theo tên (chỉ gọi khi có thay đổi) và xoá cờ dirty."""
+        self.dirty = False
+        button_states = {button_names.get(i, f'button_{i}'): self.button(i) for i in range(self.num_buttons)}
+        axis_values = {axis_names.get(i, f'axis_{i}'): value for i, value in enumerate(self.axes)}
+        hat_values = {f'hat_{i}': value for i, value in enumerate(self.hats)}
+        return button_states, axis_values, hat_values
@@ -1,13 +1,24 @@
-﻿import pygame
+﻿import os
+import pygame
 import sys
 import math
-from Client.client import RemoteClient
+from Client.pipeline import InputPipeline, PIPELINE_EVENTS
+from Client.input_sampler import DEFAULT_POLL_HZ
+from Client.conditioning import DEFAULT_PROFILE_PATH
+from Client.asset_loader import load_assets, load_atlas
+from Client.render_cache import SurfaceCache, StaticLayers, gradient_surface
+from Client.dirty_renderer import DirtyRectRenderer, Widget
+from Common.protocol import BUTTON_NAMES, AXIS_NAMES
 import time
-import threading
-import queue
+
+RENDER_FPS = 60
+
 
 class PS5ControllerTester:
-    def __init__(self, width=1000, height=664):
+    def __init__(self, width=1000, height=664, pipeline=None, input_poll_hz=DEFAULT_POLL_HZ,
+                 input_profile=DEFAULT_PROFILE_PATH):
+        # Let SDL read joystick devices on its own thread (Windows raw input) so polling is not tied to the window
+        os.environ.setdefault('SDL_JOYSTICK_THREAD', '1')
         pygame.init()
         pygame.joystick.init()
 
@@ -24,10 +35,12 @@ class PS5ControllerTester:
         self.screen = pygame.display.set_mode((width, height))
         pygame.display.set_caption("PS5 Controller Tester")
 
-        # Controller detection
-        self.joystick = None
-        self.controller_connected = False
-        self.check_controller()
+        # Background and text layers, rendered once per window size
+        self.static_layers = StaticLayers()
+
+        # Show the window right away; assets decode and the server connects behind it
+        self.draw_gradient_background()
+        pygame.display.flip()
 
         # Button states
         self.button_states = {}
@@ -44,10 +57,10 @@ class PS5ControllerTester:
         # Joystick positions
         self.left_stick_pos = [0, 0]
         self.right_stick_pos = [0, 0]
-        self.left_stick_moved = False
-        self.right_stick_moved = False
         self.left_stick_move_timer = 0
         self.right_stick_move_timer = 0
+        self.left_stick_frame_pos = self.left_stick_pos
+        self.right_stick_frame_pos = self.right_stick_pos
         self.joystick_move_threshold = 0.2
 
         # Joystick properties
@@ -66,105 +79,52 @@ class PS5ControllerTester:
         self.load_assets()
         self.define_positions()
 
+        # Scaled and pre-tinted surfaces, rebuilt only when the window is resized
+        self.render_cache = SurfaceCache(self.assets, self.atlas)
+        self.rebuild_render_cache()
+
         # Fonts for text display
         self.title_font = pygame.font.Font(None, 36)
         self.font = pygame.font.Font(None, 24)
         self.small_font = pygame.font.Font(None, 18)
 
-        self.clock = pygame.time.Clock()
-
-        # Initialize RemoteClient
-        self.remote_client = RemoteClient()
-        self.controller_data_queue = queue.Queue()
-        self.running = True
-        self.send_thread = threading.Thread(target=self._send_data_thread_func)
-        self.send_thread.daemon = True
-        self.send_thread.start()
-
-        # Lưu trữ trạng thái cũ để phát hiện thay đổi
-        self.prev_button_states = {}
-        self.prev_axis_values = {}
-        self.prev_hat_values = {}
+        # Redraw at most this often; input is sampled far more often than that
+        self.frame_interval = 1.0 / RENDER_FPS
+        self.next_frame_time = 0.0
+
+        # The window is only a viewer of the shared input pipeline (see Client/headless.py for running without it).
+        # SDL only allows pumping events on the video (main) thread, so the main thread runs the pipeline's
+        # sampler loop itself at input_poll_hz: every tick pumps SDL and reads the joystick, then on_tick
+        # handles window events and redraws only once frame_interval has passed.
+        if pipeline is None:
+            pipeline = InputPipeline(poll_hz=input_poll_hz, input_profile=input_profile)
+        self.pipeline = pipeline
+        self.pipeline.pump_events = True
+        self.pipeline.after_sample = self.on_tick
+        self.pipeline.add_listener(self.on_input)
+        with self.pipeline.lock:
+            self.pipeline.check_controller()
 
         # Calculate controller offset to center it
         self.controller_offset_x = (width - (self.base_width * self.controller_scale)) // 2
         self.controller_offset_y = (height - (self.base_height * self.controller_scale)) // 2
 
-    def check_controller(self):
-        """Check for connected controllers"""
-        try:
-            pygame.joystick.quit()
-            pygame.joystick.init()
-
-            if pygame.joystick.get_count() > 0:
-                self.joystick = pygame.joystick.Joystick(0)
-                self.joystick.init()
-                self.controller_connected = True
-                print(f"Controller connected: {self.joystick.get_name()}")
-                print(f"Total buttons: {self.joystick.get_numbuttons()}")
-                print(f"Total axes: {self.joystick.get_numaxes()}")
-            else:
-                self.controller_connected = False
-                self.joystick = None
-                print("No controller connected")
-        except Exception as e:
-            print(f"Error checking controller: {e}")
-            self.controller_connected = False
-            self.joystick = None
+        # Retained widgets: only parts whose state changed are redrawn and pushed to the display
+        self.renderer = DirtyRectRenderer()
+        self.screen_mode = None
+        self.build_widgets()
 
-    def load_assets(self):
-        """Load all image assets with quality handling"""
-        asset_files = {
-            'icon': 'assets/icon.png',
-            'center_pad': 'assets/center-pad.png',
-            'highlight': 'assets/highlight.png',
-            'speaker': 'assets/speaker.png',
-            'ps_logo_under': 'assets/ps_logo_under.png',
-            'ps_logo_upper': 'assets/ps_logo_upper.png',
-            'ps_logo_under_layout': 'assets/ps_logo_under_layout.png',
-            'ps_logo_upper_layout': 'assets/ps_logo_upper_layout.png',
-            'voice_button': 'assets/voice_button.png',
-            'voice_button_highlight': 'assets/voice_button_highlight.png',
-            'icon_mute': 'assets/icon-mute.png',
-            'loudspeaker': 'assets/loudspeaker.png',
-            'button_circle': 'assets/button-circle.png',
-            'button_cross': 'assets/button-cross.png',
-            'button_square': 'assets/button-square.png',
-            'button_triangle': 'assets/button-triangle.png',
-            'right_side': 'assets/right_side.png',
-            'left_side': 'assets/left-side.png',
-            'blue_highlight_right': 'assets/blue_highlight_right.png',
-            'blue_highlight_left': 'assets/blue_highlight_left.png',
-            'black_right': 'assets/black_right.png',
-            'black_left': 'assets/black_left.png',
-            'white_right': 'assets/white_right_highlight.png',
-            'white_left': 'assets/white_left_highlight.png',
-            'right_analog_stick': 'assets/right_analog_stick.png',
-            'dpad_up': 'assets/dpad_up.png',
-            'dpad_down': 'assets/dpad_down.png',
-            'dpad_left': 'assets/dpad_left.png',
-            'dpad_right': 'assets/dpad_right.png',
-            'r1': 'assets/R1.png',
-            'l1': 'assets/L1.png',
-            'joystick': 'assets/joystick.png',
-            'left_icon': 'assets/left_icon.png',
-            'right_icon': 'assets/right_icon.png',
-            'share_button': 'assets/share_button.png',
-            'option_button': 'assets/option_button.png',
-            'l2': 'assets/L2.png',
-            'r2': 'assets/R2.png',
-        }
+    @property
+    def controller_connected(self):
+        return self.pipeline.controller_connected
 
-        self.assets = {}
-        for name, path in asset_files.items():
-            try:
-                original_surface = pygame.image.load(path)
-                self.assets[name] = original_surface.convert_alpha()
-            except pygame.error as e:
-                print(f"Could not load {path}: {e}")
-                # Create a placeholder surface
-                self.assets[name] = pygame.Surface((50, 50), pygame.SRCALPHA)
-                self.assets[name].fill((255, 0, 255, 128))
+    def load_assets(self):
+        """Load all image assets from the packed atlas, or decode the PNGs in parallel without one"""
+        self.atlas = load_atlas()
+        if self.atlas is not None:
+            self.assets = self.atlas.subsurfaces()
+        else:
+            self.assets = load_assets()
 
         # Set icon
         if 'icon' in self.assets:
@@ -218,117 +178,158 @@ class PS5ControllerTester:
         self.positions['r2'] = (r1_center_x - 50, -50)
         self.positions['l2'] = (l1_center_x - 50, -50)
 
-        # Button mapping for PS5 controller
-        self.button_mapping = {
-            0: 'cross',
-            1: 'circle',
-            2: 'square',
-            3: 'triangle',
-            4: 'share',
-            5: 'ps',
-            6: 'option',
-            7: 'l3',
-            8: 'r3',
-            9: 'l1',
-            10: 'r1',
-            11: 'dpad_up',
-            12: 'dpad_down',
-            13: 'dpad_left',
-            14: 'dpad_right',
-            15: 'touchpad',
-        }
+        # Button/axis mapping for PS5 controller (shared with the wire format)
+        self.button_mapping = dict(BUTTON_NAMES)
+        self.axis_mapping = dict(AXIS_NAMES)
+
+    def rebuild_render_cache(self):
+        """Bake every asset at the current scale plus the tinted variants of pressable parts"""
+        pressable_assets = [
+            'dpad_up', 'dpad_down', 'dpad_left', 'dpad_right',
+            'button_cross', 'button_square', 'button_circle', 'button_triangle',
+            'r1', 'l1', 'option_button', 'share_button', 'center_pad',
+            'ps_logo_under', 'ps_logo_upper', 'ps_logo_under_layout', 'ps_logo_upper_layout',
+        ]
+        variants = [(name, 1.0, self.pressed_color) for name in pressable_assets]
+        variants.append(('joystick', 1.0, self.joystick_pressed_color))
+        self.render_cache.rebuild(self.scale_x, self.scale_y, variants)
+
+    def build_widgets(self):
+        """Lay out the controller widgets in draw order with their bounds at the current scale"""
+        self.left_joystick_center = self.joystick_center('left_joystick')
+        self.right_joystick_center = self.joystick_center('right_joystick')
+        self.widgets = [
+            self.trigger_widget('l2'),
+            self.trigger_widget('r2'),
+            self.asset_widget('r1', 'r1'),
+            self.asset_widget('white_right'),
+            self.asset_widget('black_right'),
+            self.asset_widget('right_side'),
+            self.asset_widget('blue_highlight_right'),
+            self.asset_widget('button_cross', 'cross'),
+            self.asset_widget('button_square', 'square'),
+            self.asset_widget('button_circle', 'circle'),
+            self.asset_widget('button_triangle', 'triangle'),
+            self.joystick_widget('right_joystick', 'r3', is_left=False),
+            self.asset_widget('right_icon'),
+            self.asset_widget('option_button', 'option'),
+            self.asset_widget('l1', 'l1'),
+            self.asset_widget('white_left'),
+            self.asset_widget('black_left'),
+            self.asset_widget('left_side'),
+            self.asset_widget('blue_highlight_left'),
+            self.asset_widget('dpad_up', 'dpad_up'),
+            self.asset_widget('dpad_down', 'dpad_down'),
+            self.asset_widget('dpad_left', 'dpad_left'),
+            self.asset_widget('dpad_right', 'dpad_right'),
+            self.joystick_widget('left_joystick', 'l3', is_left=True),
+            self.asset_widget('left_icon'),
+            self.asset_widget('share_button', 'share'),
+            self.asset_widget('center_pad', 'touchpad'),
+            self.asset_widget('highlight'),
+            self.asset_widget('speaker'),
+            self.asset_widget('ps_logo_under', 'ps'),
+            self.asset_widget('ps_logo_upper', 'ps'),
+            self.asset_widget('ps_logo_under_layout', 'ps'),
+            self.asset_widget('ps_logo_upper_layout', 'ps'),
+            self.asset_widget('voice_button_highlight'),
+            self.asset_widget('voice_button'),
+            self.asset_widget('icon_mute'),
+            self.asset_widget('loudspeaker'),
+            self.circle_widget(is_left=True),
+            self.circle_widget(is_left=False),
+        ]
+
+    def asset_widget(self, asset_name, button_name=None):
+        """Static asset, tinted while button_name (if any) is pressed"""
+        bounds = pygame.Rect(self.scale_position(self.positions[asset_name]),
+                             self.render_cache.get(asset_name).get_size())
+        if button_name is None:
+            return Widget(asset_name, bounds, lambda: None, lambda: self.blit_scaled(asset_name, asset_name))
+        return Widget(asset_name, bounds,
+                      lambda: self.button_states.get(button_name, False),
+                      lambda: self.draw_symbol_button(asset_name, asset_name, button_name))
+
+    def trigger_widget(self, trigger_name):
+        """L2/R2 image plus its pressure overlay"""
+        base_pos = self.scale_position(self.positions[trigger_name])
+        bounds = pygame.Rect(base_pos, self.render_cache.get(trigger_name).get_size())
+        bounds.union_ip(pygame.Rect(base_pos, (100, 100)))
+        return Widget(trigger_name, bounds,
+                      lambda: self.axis_values.get(trigger_name, 0),
+                      lambda: self.draw_trigger(trigger_name, trigger_name))
+
+    def joystick_widget(self, base_pos_key, stick_button, is_left):
+        """Stick sprite anywhere within its travel, plus the center point and direction line"""
+        stick_attr = 'left_stick_pos' if is_left else 'right_stick_pos'
+        bounds = pygame.Rect(self.scale_position(self.positions[base_pos_key]),
+                             self.render_cache.get('joystick').get_size())
+        bounds.inflate_ip(2 * int(40 * self.scale_x + 2), 2 * int(40 * self.scale_y + 2))
+        center = self.joystick_center(base_pos_key)
+        bounds.union_ip(pygame.Rect(center[0] - 45, center[1] - 45, 90, 90))
+        return Widget(base_pos_key, bounds,
+                      lambda: (tuple(getattr(self, stick_attr)), self.button_states.get(stick_button, False)),
+                      lambda: self.draw_joystick_with_movement('joystick', base_pos_key, getattr(self, stick_attr),
+                                                               stick_button, is_left=is_left))
+
+    def circle_widget(self, is_left):
+        """Trigonometric circle shown around a stick for a few frames after it moves"""
+        center = self.left_joystick_center if is_left else self.right_joystick_center
+        circle_radius = int(self.joystick_radius * min(self.scale_x, self.scale_y))
+        bounds = pygame.Rect(center[0] - circle_radius, center[1] - circle_radius,
+                             circle_radius * 2, circle_radius * 2)
 
-        # Axis mapping
-        self.axis_mapping = {
-            0: 'left_stick_x',
-            1: 'left_stick_y',
-            2: 'right_stick_x',
-            3: 'right_stick_y',
-            4: 'l2',
-            5: 'r2',
-        }
+        def state():
+            if not self.stick_circle_visible(is_left):
+                return None
+            return tuple(self.left_stick_pos if is_left else self.right_stick_pos)
 
-    def update_controller_input(self):
-        """Update controller input states with error handling"""
-        if not self.controller_connected or not self.joystick:
-            return
+        def draw():
+            if self.stick_circle_visible(is_left):
+                stick_pos = self.left_stick_pos if is_left else self.right_stick_pos
+                self.draw_trigonometric_circle(center, stick_pos, is_left)
 
-        try:
-            # Track joystick movement
-            prev_left_stick = self.left_stick_pos.copy()
-            prev_right_stick = self.right_stick_pos.copy()
-
-            # Tạo các biến tạm thời để lưu trạng thái mới
-            current_button_states = {}
-            current_axis_values = {}
-            current_hat_values = {}
-
-            # Update button states
-            for i in range(self.joystick.get_numbuttons()):
-                button_name = self.button_mapping.get(i, f'button_{i}')
-                current_button_states[button_name] = self.joystick.get_button(i)
-
-            # Update axis values
-            for i in range(self.joystick.get_numaxes()):
-                axis_name = self.axis_mapping.get(i, f'axis_{i}')
-                value = self.joystick.get_axis(i)
-                current_axis_values[axis_name] = value
-
-                # Update joystick positions
-                if axis_name == 'left_stick_x':
-                    self.left_stick_pos[0] = value * 40
-                elif axis_name == 'left_stick_y':
-                    self.left_stick_pos[1] = value * 40
-                elif axis_name == 'right_stick_x':
-                    self.right_stick_pos[0] = value * 40
-                elif axis_name == 'right_stick_y':
-                    self.right_stick_pos[1] = value * 40
-
-            # Only activate circles when movement exceeds threshold
-            left_moved = (abs(self.left_stick_pos[0] - prev_left_stick[0]) > self.joystick_move_threshold * 40 or
-                          abs(self.left_stick_pos[1] - prev_left_stick[1]) > self.joystick_move_threshold * 40)
-            right_moved = (abs(self.right_stick_pos[0] - prev_right_stick[0]) > self.joystick_move_threshold * 40 or
-                           abs(self.right_stick_pos[1] - prev_right_stick[1]) > self.joystick_move_threshold * 40)
-
-            if left_moved:
-                self.left_stick_moved = True
-                self.left_stick_move_timer = 10
-            if right_moved:
-                self.right_stick_moved = True
-                self.right_stick_move_timer = 10
-
-            # Update hat (D-pad) values
-            for i in range(self.joystick.get_numhats()):
-                current_hat_values[f'hat_{i}'] = self.joystick.get_hat(i)
-
-            # So sánh trạng thái hiện tại với trạng thái trước đó
-            # Chỉ gửi dữ liệu nếu có thay đổi
-            if (current_button_states != self.prev_button_states or
-                    current_axis_values != self.prev_axis_values or
-                    current_hat_values != self.prev_hat_values):
-
-                # Cập nhật trạng thái chính của controller
-                self.button_states = current_button_states
-                self.axis_values = current_axis_values
-                self.hat_values = current_hat_values
-
-                # Đặt dữ liệu vào queue để gửi đi trong luồng khác
-                self.controller_data_queue.put((
-                    self.button_states,
-                    self.axis_values,
-                    self.hat_values
-                ))
-
-                # Cập nhật trạng thái trước đó để so sánh trong lần tiếp theo
-                self.prev_button_states = current_button_states.copy()
-                self.prev_axis_values = current_axis_values.copy()
-                self.prev_hat_values = current_hat_values.copy()
-
-        except pygame.error as e:
-            print(f"Controller error: {e}")
-            self.controller_connected = False
-            self.joystick = None
-            self.check_controller()  # Try to reconnect
+        return Widget('left_circle' if is_left else 'right_circle', bounds, state, draw)
+
+    def joystick_center(self, base_pos_key):
+        """Screen position of the center of a joystick base"""
+        base_pos = self.scale_position(self.positions[base_pos_key])
+        return (base_pos[0] + int(self.joystick_radius * self.scale_x),
+                base_pos[1] + int(self.joystick_radius * self.scale_y))
+
+    def stick_circle_visible(self, is_left):
+        """Circles only show while the move timer runs and the stick is past the threshold"""
+        if is_left:
+            stick_pos, move_timer = self.left_stick_pos, self.left_stick_move_timer
+        else:
+            stick_pos, move_timer = self.right_stick_pos, self.right_stick_move_timer
+        return move_timer > 0 and (abs(stick_pos[0]) > self.joystick_move_threshold * 40 or
+                                   abs(stick_pos[1]) > self.joystick_move_threshold * 40)
+
+    def on_input(self, button_states, axis_values, hat_values):
+        """Pipeline listener: take the new controller state and update stick positions and circle timers"""
+        # New stick lists are swapped in at once so the renderer never sees half an update
+        self.left_stick_pos = [axis_values.get('left_stick_x', 0) * 40,
+                               axis_values.get('left_stick_y', 0) * 40]
+        self.right_stick_pos = [axis_values.get('right_stick_x', 0) * 40,
+                                axis_values.get('right_stick_y', 0) * 40]
+
+        # Only activate circles when movement since the last rendered frame exceeds threshold
+        prev_left_stick = self.left_stick_frame_pos
+        prev_right_stick = self.right_stick_frame_pos
+        left_moved = (abs(self.left_stick_pos[0] - prev_left_stick[0]) > self.joystick_move_threshold * 40 or
+                      abs(self.left_stick_pos[1] - prev_left_stick[1]) > self.joystick_move_threshold * 40)
+        right_moved = (abs(self.right_stick_pos[0] - prev_right_stick[0]) > self.joystick_move_threshold * 40 or
+                       abs(self.right_stick_pos[1] - prev_right_stick[1]) > self.joystick_move_threshold * 40)
+
+        if left_moved:
+            self.left_stick_move_timer = 10
+        if right_moved:
+            self.right_stick_move_timer = 10
+
+        self.button_states = button_states
+        self.axis_values = axis_values
+        self.hat_values = hat_values
 
     def scale_position(self, pos):
         """Scale position based on current resolution and add offset for centering"""
@@ -336,37 +337,12 @@ class PS5ControllerTester:
         scaled_y = int(pos[1] * self.scale_y) + self.controller_offset_y
         return (scaled_x, scaled_y)
 
-    def scale_surface(self, surface, scale_factor=1.0):
-        """Scale surface based on current resolution with better quality"""
-        if surface is None:
-            return None
-
-        original_size = surface.get_size()
-        new_size = (
-            int(original_size[0] * self.scale_x * scale_factor),
-            int(original_size[1] * self.scale_y * scale_factor)
-        )
-
-        if new_size[0] <= 0 or new_size[1] <= 0:
-            return surface
-
-        return pygame.transform.smoothscale(surface, new_size)
-
     def blit_scaled(self, asset_name, position_key, scale_factor=1.0, color_tint=None):
         """Blit an asset at a scaled position with scaled size and optional color tint"""
         if asset_name in self.assets and position_key in self.positions:
-            scaled_surface = self.scale_surface(self.assets[asset_name], scale_factor)
+            scaled_surface = self.render_cache.get(asset_name, scale_factor, color_tint)
             scaled_pos = self.scale_position(self.positions[position_key])
-
-            if color_tint:
-                tinted_surface = scaled_surface.copy()
-                overlay = pygame.Surface(tinted_surface.get_size())
-                overlay.fill(color_tint)
-                overlay.set_alpha(128)
-                tinted_surface.blit(overlay, (0, 0), special_flags=pygame.BLEND_ADD)
-                self.screen.blit(tinted_surface, scaled_pos)
-            else:
-                self.screen.blit(scaled_surface, scaled_pos)
+            self.screen.blit(scaled_surface, scaled_pos)
 
     def draw_symbol_button(self, asset_name, position_key, button_name):
         """Draw a symbol button with visual feedback based on state"""
@@ -374,20 +350,6 @@ class PS5ControllerTester:
         color_tint = self.pressed_color if is_pressed else None
         self.blit_scaled(asset_name, position_key, color_tint=color_tint)
 
-    def draw_dpad_with_state(self):
-        """Draw D-pad with visual feedback"""
-        self.draw_symbol_button('dpad_up', 'dpad_up', 'dpad_up')
-        self.draw_symbol_button('dpad_down', 'dpad_down', 'dpad_down')
-        self.draw_symbol_button('dpad_left', 'dpad_left', 'dpad_left')
-        self.draw_symbol_button('dpad_right', 'dpad_right', 'dpad_right')
-
-    def draw_right_buttons(self):
-        """Draw right buttons (cross, circle, square, triangle) with visual feedback"""
-        self.draw_symbol_button('button_cross', 'button_cross', 'cross')
-        self.draw_symbol_button('button_square', 'button_square', 'square')
-        self.draw_symbol_button('button_circle', 'button_circle', 'circle')
-        self.draw_symbol_button('button_triangle', 'button_triangle', 'triangle')
-
     def draw_joystick_with_movement(self, asset_name, base_pos_key, stick_offset, stick_button, is_left=False):
         """Draw joystick with movement and press feedback"""
         base_pos = self.scale_position(self.positions[base_pos_key])
@@ -408,21 +370,10 @@ class PS5ControllerTester:
         moved_pos = (center_x + offset_x - int(self.joystick_radius * self.scale_x),
                      center_y + offset_y - int(self.joystick_radius * self.scale_y))
 
-        # Draw joystick
-        scaled_surface = self.scale_surface(self.assets[asset_name])
-
-        # Check if joystick is pressed (L3 or R3)
+        # Draw joystick, tinted if it is pressed (L3 or R3)
         is_pressed = self.button_states.get(stick_button, False)
-
-        if is_pressed:
-            tinted_surface = scaled_surface.copy()
-            overlay = pygame.Surface(tinted_surface.get_size())
-            overlay.fill(self.joystick_pressed_color)
-            overlay.set_alpha(128)
-            tinted_surface.blit(overlay, (0, 0), special_flags=pygame.BLEND_ADD)
-            self.screen.blit(tinted_surface, moved_pos)
-        else:
-            self.screen.blit(scaled_surface, moved_pos)
+        color_tint = self.joystick_pressed_color if is_pressed else None
+        self.screen.blit(self.render_cache.get(asset_name, color_tint=color_tint), moved_pos)
 
         # Draw connection line and center point only when movement exceeds threshold
         distance = math.hypot(offset_x, offset_y)
@@ -483,9 +434,8 @@ class PS5ControllerTester:
         # Determine asset name
         asset_name = 'l2' if 'l2' in trigger_name else 'r2'
 
-        # Scale and position the trigger image
-        scaled_surface = self.scale_surface(self.assets[asset_name])
-        self.screen.blit(scaled_surface, base_pos)
+        # Position the pre-scaled trigger image
+        self.screen.blit(self.render_cache.get(asset_name), base_pos)
 
         # Create a semi-transparent overlay for visual feedback
         overlay = pygame.Surface((100, int(100 * normalized_value)), pygame.SRCALPHA)
@@ -509,126 +459,50 @@ class PS5ControllerTester:
         overlay_pos = (base_pos[0], base_pos[1] + 100 - overlay.get_height())
         self.screen.blit(overlay, overlay_pos)
 
-    def draw_controller(self):
-        """Draw the complete PS5 controller with input feedback"""
+    def update_stick_timers(self):
+        """Count down the trigonometric circle timers once per frame"""
+        self.left_stick_frame_pos = self.left_stick_pos
+        self.right_stick_frame_pos = self.right_stick_pos
         if self.left_stick_move_timer > 0:
             self.left_stick_move_timer -= 1
         if self.right_stick_move_timer > 0:
             self.right_stick_move_timer -= 1
 
-        # Draw background gradient
-        self.draw_gradient_background()
-
-        # Draw L2/R2 triggers first
-        self.draw_trigger('l2', 'l2')
-        self.draw_trigger('r2', 'r2')
-
-        # Right side elements
-        r1_pressed = self.button_states.get('r1', False)
-        self.blit_scaled('r1', 'r1', color_tint=self.pressed_color if r1_pressed else None)
-
-        self.blit_scaled('white_right', 'white_right')
-        self.blit_scaled('black_right', 'black_right')
-        self.blit_scaled('right_side', 'right_side')
-        self.blit_scaled('blue_highlight_right', 'blue_highlight_right')
-
-        # Right buttons with state feedback
-        self.draw_right_buttons()
-
-        # Right side controls
-        self.draw_joystick_with_movement('joystick', 'right_joystick', self.right_stick_pos, 'r3', is_left=False)
-        self.blit_scaled('right_icon', 'right_icon')
-
-        option_pressed = self.button_states.get('option', False)
-        self.blit_scaled('option_button', 'option_button', color_tint=self.pressed_color if option_pressed else None)
-
-        # Left side elements
-        l1_pressed = self.button_states.get('l1', False)
-        self.blit_scaled('l1', 'l1', color_tint=self.pressed_color if l1_pressed else None)
-
-        self.blit_scaled('white_left', 'white_left')
-        self.blit_scaled('black_left', 'black_left')
-        self.blit_scaled('left_side', 'left_side')
-        self.blit_scaled('blue_highlight_left', 'blue_highlight_left')
-
-        # D-pad with state feedback
-        self.draw_dpad_with_state()
-
-        # Left side controls
-        self.draw_joystick_with_movement('joystick', 'left_joystick', self.left_stick_pos, 'l3', is_left=True)
-        self.blit_scaled('left_icon', 'left_icon')
-
-        share_pressed = self.button_states.get('share', False)
-        self.blit_scaled('share_button', 'share_button', color_tint=self.pressed_color if share_pressed else None)
-
-        # Center elements
-        touchpad_pressed = self.button_states.get('touchpad', False)
-        self.blit_scaled('center_pad', 'center_pad', color_tint=self.pressed_color if touchpad_pressed else None)
-
-        self.blit_scaled('highlight', 'highlight')
-        self.blit_scaled('speaker', 'speaker')
-
-        # Highlight all PS logo parts when PS button is pressed
-        ps_pressed = self.button_states.get('ps', False)
-        self.blit_scaled('ps_logo_under', 'ps_logo_under', color_tint=self.pressed_color if ps_pressed else None)
-        self.blit_scaled('ps_logo_upper', 'ps_logo_upper', color_tint=self.pressed_color if ps_pressed else None)
-        self.blit_scaled('ps_logo_under_layout', 'ps_logo_under_layout',
-                         color_tint=self.pressed_color if ps_pressed else None)
-        self.blit_scaled('ps_logo_upper_layout', 'ps_logo_upper_layout',
-                         color_tint=self.pressed_color if ps_pressed else None)
-
-        self.blit_scaled('voice_button_highlight', 'voice_button_highlight')
-        self.blit_scaled('voice_button', 'voice_button')
-        self.blit_scaled('icon_mute', 'icon_mute')
-        self.blit_scaled('loudspeaker', 'loudspeaker')
-
-        # Draw trigonometric circles only if movement exceeds threshold
-        if self.left_joystick_center and self.left_stick_move_timer > 0:
-            # Only show if movement exceeds threshold
-            if (abs(self.left_stick_pos[0]) > self.joystick_move_threshold * 40 or
-                    abs(self.left_stick_pos[1]) > self.joystick_move_threshold * 40):
-                self.draw_trigonometric_circle(self.left_joystick_center, self.left_stick_pos, True)
-
-        if self.right_joystick_center and self.right_stick_move_timer > 0:
-            # Only show if movement exceeds threshold
-            if (abs(self.right_stick_pos[0]) > self.joystick_move_threshold * 40 or
-                    abs(self.right_stick_pos[1]) > self.joystick_move_threshold * 40):
-                self.draw_trigonometric_circle(self.right_joystick_center, self.right_stick_pos, False)
-
     def draw_gradient_background(self):
         """Draw a gradient background for better visual appeal"""
-        for y in range(self.height):
-            # Calculate gradient color (darker at top, lighter at bottom)
-            color_value = 20 + int(30 * (y / self.height))
-            pygame.draw.line(self.screen, (color_value, color_value, color_value + 10),
-                             (0, y), (self.width, y))
+        self.screen.blit(self.static_layers.get('background', lambda: gradient_surface(self.width, self.height)),
+                         (0, 0))
 
     def draw_no_controller_screen(self):
         """Draw screen when no controller is connected"""
-        # Draw gradient background
-        self.draw_gradient_background()
+        self.screen.blit(self.static_layers.get('no_controller', self.build_no_controller_layer), (0, 0))
+
+    def build_no_controller_layer(self):
+        """Render the no-controller screen (background, text and icon) into one surface"""
+        layer = self.static_layers.get('background', lambda: gradient_surface(self.width, self.height)).copy()
 
         # Draw title
         title = self.title_font.render("PS5 Controller Tester", True, (255, 255, 255))
-        self.screen.blit(title, (self.width // 2 - title.get_width() // 2, 50))
+        layer.blit(title, (self.width // 2 - title.get_width() // 2, 50))
 
         # Draw warning message
         warning = self.font.render("No controller detected!", True, (255, 100, 100))
-        self.screen.blit(warning, (self.width // 2 - warning.get_width() // 2, 150))
+        layer.blit(warning, (self.width // 2 - warning.get_width() // 2, 150))
 
         # Draw instructions
         instruction1 = self.font.render("Please connect a PS5 controller to your computer", True, (200, 200, 200))
         instruction2 = self.font.render("Press 'R' to rescan for controllers", True, (200, 200, 200))
         instruction3 = self.font.render("Press ESC to exit", True, (200, 200, 200))
 
-        self.screen.blit(instruction1, (self.width // 2 - instruction1.get_width() // 2, 220))
-        self.screen.blit(instruction2, (self.width // 2 - instruction2.get_width() // 2, 260))
-        self.screen.blit(instruction3, (self.width // 2 - instruction3.get_width() // 2, 300))
+        layer.blit(instruction1, (self.width // 2 - instruction1.get_width() // 2, 220))
+        layer.blit(instruction2, (self.width // 2 - instruction2.get_width() // 2, 260))
+        layer.blit(instruction3, (self.width // 2 - instruction3.get_width() // 2, 300))
 
         # Draw controller icon
         if 'icon' in self.assets:
             icon = pygame.transform.scale(self.assets['icon'], (200, 200))
-            self.screen.blit(icon, (self.width // 2 - 100, 350))
+            layer.blit(icon, (self.width // 2 - 100, 350))
+        return layer
 
     def handle_resize(self, new_width, new_height):
         """Handle window resize"""
@@ -641,74 +515,80 @@ class PS5ControllerTester:
         self.controller_offset_x = (new_width - (self.base_width * self.controller_scale)) // 2
         self.controller_offset_y = (new_height - (self.base_height * self.controller_scale)) // 2
 
-    def run(self):
-        """Main game loop with robust error handling"""
-        running = True
-
-        while running:
-            # Handle events with robust error handling
-            try:
-                events = pygame.event.get()
-                for event in events:
-                    if event.type == pygame.QUIT:
-                        running = False
-                    elif event.type == pygame.VIDEORESIZE:
-                        self.handle_resize(event.w, event.h)
-                    elif event.type == pygame.KEYDOWN:
-                        if event.key == pygame.K_r:
-                            self.check_controller()
-                        elif event.key == pygame.K_ESCAPE:
-                            running = False
-            except Exception as e:
-                print(f"Error processing events: {e}")
-                # Reset controller state on error
-                self.controller_connected = False
-                self.joystick = None
-                self.check_controller()
-
-            # Update controller input
-            try:
-                if self.controller_connected:
-                    self.update_controller_input()
-
-            except Exception as e:
-                print(f"Error updating controller: {e}")
-                self.controller_connected = False
-                self.joystick = None
-
-            # Clear screen
-            self.screen.fill((20, 20, 30))
-
-            # Draw appropriate screen based on connection status
-            if self.controller_connected:
-                try:
-                    self.draw_controller()
-                except Exception as e:
-                    print(f"Error drawing controller: {e}")
-            else:
-                self.draw_no_controller_screen()
+        self.rebuild_render_cache()
+        self.static_layers.invalidate()
+        self.build_widgets()
+        self.renderer.invalidate()
 
-            # Update display
-            pygame.display.flip()
-            self.clock.tick(60)
+    def run(self):
+        """Main loop: the pipeline's sampler runs on this thread and calls on_tick after every sample"""
+        self.pipeline.start(sampler_thread=False)
+        self.pipeline.sampler.run()
 
         # Cleanup
-        self.running = False # Dừng luồng gửi dữ liệu
-        self.send_thread.join() # Chờ luồng gửi dữ liệu kết thúc
-
-        if self.joystick:
-            self.joystick.quit()
+        self.pipeline.stop()
+        print(f"Input pipeline stats: {self.pipeline.stats()}")
         pygame.quit()
         sys.exit()
 
-    def _send_data_thread_func(self):
-        while self.running:
+    def on_tick(self):
+        """Handle window events every input tick and redraw once per frame interval"""
+        # Handle events with robust error handling
+        try:
+            with self.pipeline.lock:
+                # The pipeline already pumped SDL and took the joystick events; the rest are window events
+                events = pygame.event.get(exclude=PIPELINE_EVENTS, pump=False)
+            for event in events:
+                if event.type == pygame.QUIT:
+                    self.pipeline.sampler.stop()
+                elif event.type == pygame.VIDEORESIZE:
+                    self.handle_resize(event.w, event.h)
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_r:
+                        with self.pipeline.lock:
+                            self.pipeline.check_controller()
+                    elif event.key == pygame.K_ESCAPE:
+                        self.pipeline.sampler.stop()
+        except Exception as e:
+            print(f"Error processing events: {e}")
+            # Reset controller state on error
+            with self.pipeline.lock:
+                self.pipeline.disconnect()
+                self.pipeline.check_controller()
+
+        now = time.monotonic()
+        if now < self.next_frame_time:
+            return
+        # Frames that were missed are dropped rather than drawn back to back
+        self.next_frame_time = max(self.next_frame_time + self.frame_interval, now)
+        self.draw_frame()
+
+    def draw_frame(self):
+        """Draw one frame, pushing only the changed areas to the display"""
+        # Switching between screens repaints everything once
+        screen_mode = 'controller' if self.controller_connected else 'no_controller'
+        if screen_mode != self.screen_mode:
+            self.screen_mode = screen_mode
+            self.renderer.invalidate()
+
+        # Draw appropriate screen based on connection status
+        dirty_rects = []
+        if self.controller_connected:
+            self.update_stick_timers()
             try:
-                if not self.controller_data_queue.empty():
-                    data = self.controller_data_queue.get()
-                    self.remote_client.send_controller_data(*data)
+                dirty_rects = self.renderer.render(self.screen, self.draw_gradient_background, self.widgets)
             except Exception as e:
-                print(f"Error sending data: {e}")
+                print(f"Error drawing controller: {e}")
+                self.renderer.invalidate()
+        elif self.renderer.full_redraw:
+            self.screen.fill((20, 20, 30))
+            self.draw_no_controller_screen()
+            self.renderer.full_redraw = False
+            dirty_rects = [self.screen.get_rect()]
+
+        # Push only the changed areas; nothing at all while the controller is idle
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
 
 
 if __name__ == "__main__":
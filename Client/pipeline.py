@@ -0,0 +1,214 @@
+﻿import threading
+import pygame
+from Client.sender import ControllerSender
+from Client.input_sampler import InputSampler, DEFAULT_POLL_HZ
+from Client.joystick_state import JoystickState, JOYSTICK_EVENTS
+from Client.conditioning import InputConditioner, DEFAULT_PROFILE_PATH
+from Common.protocol import BUTTON_NAMES, AXIS_NAMES, timestamp_ms
+
+# Cắm/rút tay cầm cũng do pipeline xử lý để client headless tự kết nối lại
+DEVICE_EVENTS = (pygame.JOYDEVICEADDED, pygame.JOYDEVICEREMOVED)
+PIPELINE_EVENTS = JOYSTICK_EVENTS + DEVICE_EVENTS
+
+
+class InputPipeline:
+    """Đường đi của input: tay cầm -> JoystickState (đã lọc trục) -> ControllerSender -> RemoteClient.
+
+    Dùng chung cho client headless và giao diện pygame. Giao diện chỉ là một viewer:
+    đăng ký listener bằng add_listener() để nhận (button_states, axis_values, hat_values)
+    mỗi khi trạng thái đổi. Mọi truy cập SDL (lấy sự kiện, mở tay cầm) đi qua self.lock.
+
+    Nếu không truyền remote_client, RemoteClient(**client_options) được tạo trong connect()
+    (tra Firebase, kiểm tra kết nối): start() chạy việc này ở luồng nền nên cửa sổ và việc
+    lấy mẫu không phải chờ; input trong lúc chờ vẫn giữ bản mới nhất và được gửi khi xong.
+    """
+
+    def __init__(self, remote_client=None, poll_hz=DEFAULT_POLL_HZ, input_profile=DEFAULT_PROFILE_PATH,
+                 pump_events=True, client_options=None):
+        self.remote_client = remote_client
+        self.client_options = client_options or {}
+        self.connection_error = None
+        self.connect_thread = None
+        # stop() có thể chạy khi connect() còn đang tra URL/thoả thuận với server
+        self.connect_lock = threading.Lock()
+        self.stopped = False
+        # Sender blocks until new state arrives and only ever sends the newest one
+        self.sender = ControllerSender(remote_client)
+        # Per-axis deadzone/quantization/hysteresis so analog noise at rest does not trigger sends
+        self.conditioner = InputConditioner.from_file(input_profile)
+        self.button_mapping = dict(BUTTON_NAMES)
+        self.axis_mapping = dict(AXIS_NAMES)
+
+        self.joystick = None
+        self.joystick_state = JoystickState()
+        self.controller_connected = False
+        self.button_states = {}
+        self.axis_values = {}
+        self.hat_values = {}
+        self.listeners = []
+
+        # SDL chỉ cho bơm sự kiện (SDL_PumpEvents) trên luồng đã khởi tạo video. True: sample()
+        # tự bơm, sampler phải chạy trên luồng chính (headless và GUI đều làm vậy). False: chủ sở
+        # hữu tự bơm ở luồng chính, sample() chỉ đọc sự kiện đã có trong hàng đợi
+        self.pump_events = pump_events
+        # Gọi sau mỗi lần lấy mẫu, trên cùng luồng: GUI xử lý sự kiện cửa sổ và vẽ ở đây
+        self.after_sample = None
+        self.lock = threading.Lock()
+        self.sampler = InputSampler(self.tick, poll_hz=poll_hz)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def check_controller(self):
+        """Mở tay cầm đầu tiên (gọi khi đang giữ self.lock hoặc trước khi chạy sampler)."""
+        try:
+            if self.joystick:
+                self.joystick.quit()
+            pygame.joystick.quit()
+            pygame.joystick.init()
+
+            if pygame.joystick.get_count() > 0:
+                self.joystick = pygame.joystick.Joystick(0)
+                self.joystick.init()
+                self.controller_connected = True
+                self.joystick_state = JoystickState.from_joystick(self.joystick, self.conditioner)
+                print(f"Controller connected: {self.joystick.get_name()}")
+                print(f"Total buttons: {self.joystick.get_numbuttons()}")
+                print(f"Total axes: {self.joystick.get_numaxes()}")
+            else:
+                self.controller_connected = False
+                self.joystick = None
+                print("No controller connected")
+        except Exception as e:
+            print(f"Error checking controller: {e}")
+            self.controller_connected = False
+            self.joystick = None
+
+    def disconnect(self):
+        self.controller_connected = False
+        self.joystick = None
+
+    def sample(self):
+        """Lấy các sự kiện tay cầm trong hàng đợi SDL; InputSampler gọi hàm này theo chu kỳ."""
+        with self.lock:
+            try:
+                # Only joystick events are taken here; window events stay queued for the GUI
+                self.process_events(pygame.event.get(PIPELINE_EVENTS, pump=self.pump_events))
+            except Exception as e:
+                print(f"Error updating controller: {e}")
+                self.disconnect()
+
+    def tick(self):
+        """Một chu kỳ của sampler: lấy mẫu rồi gọi after_sample (nếu có)."""
+        self.sample()
+        if self.after_sample is not None:
+            self.after_sample()
+
+    def process_events(self, events):
+        """Áp dụng sự kiện (gọi khi đang giữ self.lock); sự kiện không phải của tay cầm bị bỏ qua."""
+        input_events = []
+        for event in events:
+            if event.type == pygame.JOYDEVICEADDED:
+                if not self.controller_connected:
+                    self.check_controller()
+            elif event.type == pygame.JOYDEVICEREMOVED:
+                if self.joystick is not None and event.instance_id == self.joystick_state.instance_id:
+                    print("Controller disconnected")
+                    self.disconnect()
+            elif event.type in JOYSTICK_EVENTS:
+                input_events.append(event)
+        self.update_controller_input(input_events)
+
+    def update_controller_input(self, events):
+        """Apply joystick events to the controller state and send it when something changed"""
+        if not self.controller_connected or not self.joystick:
+            return
+
+        try:
+            # Capture time travels with the frame for end-to-end latency measurement
+            capture_time = timestamp_ms()
+
+            # Events update the preallocated state in place; nothing else runs until a value really changes
+            self.joystick_state.apply_events(events)
+            # Trục đang làm mượt (EMA) vẫn phải tiến tới giá trị cuối khi cần được giữ yên
+            self.joystick_state.tick()
+            if not self.joystick_state.dirty:
+                return
+
+            # Cập nhật trạng thái chính của controller
+            self.button_states, self.axis_values, self.hat_values = self.joystick_state.to_dicts(
+                self.button_mapping, self.axis_mapping)
+
+            # Đặt trạng thái mới nhất vào mailbox để gửi đi trong luồng khác
+            self.sender.submit(
+                self.button_states,
+                self.axis_values,
+                self.hat_values,
+                timestamp=capture_time
+            )
+
+            for listener in self.listeners:
+                listener(self.button_states, self.axis_values, self.hat_values)
+
+        except pygame.error as e:
+            print(f"Controller error: {e}")
+            self.disconnect()
+            self.check_controller()  # Try to reconnect
+
+    def connect(self):
+        """Tạo RemoteClient nếu chưa có rồi chạy sender; trả về False nếu không kết nối được hoặc đã stop()."""
+        remote_client = self.remote_client
+        try:
+            if remote_client is None:
+                # Import muộn: firebase_admin nạp rất chậm, không để nó làm chậm lúc mở cửa sổ
+                from Client.client import RemoteClient
+                remote_client = RemoteClient(**self.client_options)
+        except Exception as e:
+            self.connection_error = e
+            print(f"❌ Không kết nối được server: {e}")
+            return False
+        with self.connect_lock:
+            if self.stopped:
+                # Cửa sổ đã đóng trong lúc kết nối: không chạy sender sau khi đã dọn dẹp
+                if remote_client is not self.remote_client:
+                    remote_client.close()
+                return False
+            self.remote_client = remote_client
+            self.sender.remote_client = remote_client
+            self.sender.start()
+        return True
+
+    def start(self, sampler_thread=True):
+        """Kết nối server ở luồng nền; chạy sampler ở luồng riêng, hoặc (sampler_thread=False)
+        để người gọi tự chạy self.sampler.run() trên luồng chính như GUI."""
+        self.connect_thread = threading.Thread(target=self.connect, daemon=True)
+        self.connect_thread.start()
+        if sampler_thread:
+            self.sampler.start()
+
+    def run(self):
+        """Kết nối rồi chạy sampler ngay trên luồng gọi tới khi stop() (dùng cho client headless)."""
+        if not self.connect():
+            return False
+        self.sampler.run()
+        return True
+
+    def stop(self, connect_timeout=2):
+        with self.connect_lock:
+            self.stopped = True
+        if self.connect_thread is not None:
+            self.connect_thread.join(connect_timeout)
+        self.sampler.stop()
+        self.sender.stop() # Dừng luồng gửi dữ liệu và chờ nó kết thúc
+        if self.remote_client is not None:
+            self.remote_client.close()
+        if self.joystick:
+            self.joystick.quit()
+
+    def stats(self):
+        return {
+            "sampler": self.sampler.stats(),
+            "sender": self.sender.stats(),
+            "joystick_events": self.joystick_state.events,
+            "joystick_changes": self.joystick_state.changes,
+        }
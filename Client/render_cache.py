@@ -0,0 +1,124 @@
+﻿import pygame
+
+try:
+    import numpy
+    import pygame.surfarray
+except ImportError:
+    numpy = None
+
+
+def gradient_surface(width, height):
+    """Vertical background gradient, darker at the top and lighter at the bottom"""
+    surface = pygame.Surface((width, height))
+    if numpy is not None:
+        # One vectorized write instead of a draw call per pixel row
+        values = 20 + (numpy.arange(height) / height * 30).astype(numpy.uint8)
+        column = numpy.stack([values, values, values + 10], axis=-1)
+        pygame.surfarray.blit_array(surface, numpy.broadcast_to(column, (width, height, 3)))
+    else:
+        for y in range(height):
+            color_value = 20 + int(30 * (y / height))
+            pygame.draw.line(surface, (color_value, color_value, color_value + 10), (0, y), (width, y))
+    return surface
+
+
+def tint_surface(surface, color_tint):
+    """Return a copy of surface with color_tint added on top at half strength"""
+    tinted_surface = surface.copy()
+    overlay = pygame.Surface(tinted_surface.get_size())
+    overlay.fill(color_tint)
+    overlay.set_alpha(128)
+    tinted_surface.blit(overlay, (0, 0), special_flags=pygame.BLEND_ADD)
+    return tinted_surface
+
+
+class SurfaceCache:
+    """Scaled and pre-tinted asset surfaces keyed by (asset, scale factor, tint).
+
+    Variants are baked once by rebuild() (on startup and on every window resize) so
+    drawing a frame is only blits; a variant that was not baked is built on first use
+    and kept until the next rebuild. With an atlas (see Client/build_atlas.py) the
+    whole atlas is scaled once per rebuild and unscaled, untinted assets are
+    subsurfaces of it.
+    """
+
+    def __init__(self, assets, atlas=None):
+        self.assets = assets
+        self.atlas = atlas
+        self.scale_x = 1.0
+        self.scale_y = 1.0
+        self.surfaces = {}
+        self.misses = 0
+
+    def rebuild(self, scale_x, scale_y, variants=()):
+        """Drop every cached surface and bake the given (asset, scale_factor, tint) variants"""
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+        self.surfaces = {}
+        if self.atlas is not None:
+            self._slice_atlas()
+        for asset_name in self.assets:
+            if (asset_name, 1.0, None) not in self.surfaces:
+                self._build(asset_name, 1.0, None)
+        for asset_name, scale_factor, color_tint in variants:
+            self._build(asset_name, scale_factor, color_tint)
+
+    def get(self, asset_name, scale_factor=1.0, color_tint=None):
+        key = (asset_name, scale_factor, color_tint)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            self.misses += 1
+            surface = self._build(asset_name, scale_factor, color_tint)
+        return surface
+
+    def _build(self, asset_name, scale_factor, color_tint):
+        if color_tint is None:
+            surface = self._scale(self.assets[asset_name], scale_factor)
+        else:
+            surface = tint_surface(self.get(asset_name, scale_factor), color_tint)
+        self.surfaces[(asset_name, scale_factor, color_tint)] = surface
+        return surface
+
+    def _slice_atlas(self):
+        atlas_width, atlas_height = self.atlas.surface.get_size()
+        scaled_atlas = pygame.transform.smoothscale(
+            self.atlas.surface, (int(atlas_width * self.scale_x), int(atlas_height * self.scale_y)))
+        bounds = scaled_atlas.get_rect()
+        for asset_name, rect in self.atlas.rects.items():
+            # Same sizes as scaling the asset on its own, so layout does not depend on the atlas
+            scaled_rect = pygame.Rect(int(rect.x * self.scale_x), int(rect.y * self.scale_y),
+                                      int(rect.width * self.scale_x), int(rect.height * self.scale_y))
+            if scaled_rect.width > 0 and scaled_rect.height > 0 and bounds.contains(scaled_rect):
+                self.surfaces[(asset_name, 1.0, None)] = scaled_atlas.subsurface(scaled_rect)
+
+    def _scale(self, surface, scale_factor):
+        original_size = surface.get_size()
+        new_size = (
+            int(original_size[0] * self.scale_x * scale_factor),
+            int(original_size[1] * self.scale_y * scale_factor)
+        )
+
+        if new_size[0] <= 0 or new_size[1] <= 0:
+            return surface
+
+        return pygame.transform.smoothscale(surface, new_size)
+
+
+class StaticLayers:
+    """Surfaces that only depend on the window size (backgrounds, text, scaled icons).
+
+    Each layer is rendered by its build function on first use and reused every frame
+    until invalidate() is called on resize.
+    """
+
+    def __init__(self):
+        self.layers = {}
+
+    def get(self, name, build):
+        layer = self.layers.get(name)
+        if layer is None:
+            layer = self.layers[name] = build()
+        return layer
+
+    def invalidate(self):
+        self.layers = {}
@@ -0,0 +1,130 @@
+﻿"""Phát lại nhiễu trục analog đã ghi qua bộ lọc input và báo số lượt gửi tiết kiệm được.
+
+    python -m Client.replay_conditioning                       # nhiễu tổng hợp
+    python -m Client.replay_conditioning --record noise.jsonl  # ghi 10 giây từ tay cầm thật
+    python -m Client.replay_conditioning --recording noise.jsonl --profile Client/input_profile.json
+
+File ghi là JSON lines, mỗi dòng một sự kiện trục: {"t": giây, "axis": chỉ số, "value": giá trị}.
+"""
+import argparse
+import json
+import math
+import random
+import time
+import pygame
+from Client.conditioning import InputConditioner, DEFAULT_PROFILE_PATH
+from Client.input_sampler import DEFAULT_POLL_HZ
+from Client.joystick_state import JoystickState
+from Common.protocol import AXIS_NAMES
+
+# Vị trí nghỉ ban đầu của trục trước sự kiện đầu tiên
+AXIS_REST = {"l2": -1.0, "r2": -1.0}
+
+
+def synthetic_noise(seconds=10.0, rate_hz=250, seed=0):
+    """Cần analog gần như đứng yên (nhiễu + trôi nhẹ) xen kẽ vài lần gạt cần, cò nhả hẳn."""
+    rng = random.Random(seed)
+    rest = {axis: rng.uniform(-0.03, 0.03) for axis in range(4)}
+    samples = []
+    for tick in range(int(seconds * rate_hz)):
+        t = tick / rate_hz
+        # Mỗi 4 giây gạt cần trái một vòng trong 0.5 giây
+        moving = (t % 4.0) < 0.5
+        for axis in range(4):
+            value = rest[axis] + rng.gauss(0, 0.004)
+            if moving and axis < 2:
+                phase = (t % 4.0) / 0.5 * 2 * math.pi
+                value = math.cos(phase) if axis == 0 else math.sin(phase)
+            samples.append((t, axis, max(-1.0, min(1.0, value))))
+        for axis in (4, 5):
+            samples.append((t, axis, -1.0 + abs(rng.gauss(0, 0.002))))
+    return samples
+
+
+def load_recording(path):
+    with open(path, encoding="utf-8") as f:
+        return [(entry["t"], entry["axis"], entry["value"]) for entry in map(json.loads, f) if entry]
+
+
+def record_joystick(path, seconds=10.0):
+    """Ghi mọi sự kiện trục của tay cầm đầu tiên trong seconds giây."""
+    pygame.init()
+    pygame.joystick.init()
+    if pygame.joystick.get_count() == 0:
+        raise SystemExit("No controller connected")
+    joystick = pygame.joystick.Joystick(0)
+    joystick.init()
+    print(f"Recording {joystick.get_name()} for {seconds}s, leave the sticks at rest...")
+
+    count = 0
+    start = time.monotonic()
+    with open(path, "w", encoding="utf-8") as f:
+        while time.monotonic() - start < seconds:
+            for event in pygame.event.get(pygame.JOYAXISMOTION):
+                f.write(json.dumps({"t": round(time.monotonic() - start, 6),
+                                    "axis": event.axis, "value": event.value}) + "\n")
+                count += 1
+            time.sleep(0.001)
+    pygame.quit()
+    print(f"Recorded {count} axis events to {path}")
+
+
+def count_sends(samples, conditioner=None, poll_hz=DEFAULT_POLL_HZ):
+    """Số lượt gửi: mỗi chu kỳ lấy mẫu có trạng thái đổi thì gửi một frame (như InputSampler)."""
+    num_axes = max(axis for _, axis, _ in samples) + 1
+    state = JoystickState(num_axes=num_axes, conditioner=conditioner)
+    for axis in range(num_axes):
+        state.axes[axis] = state.condition(axis, AXIS_REST.get(AXIS_NAMES.get(axis), 0.0))
+
+    sends = 0
+    current_tick = None
+    for t, axis, value in samples:
+        tick = int(t * poll_hz)
+        # Mọi chu kỳ tới mẫu này, kể cả chu kỳ không có sự kiện, đều chạy như sampler thật
+        while current_tick is not None and current_tick < tick:
+            state.tick()
+            if state.dirty:
+                sends += 1
+                state.dirty = False
+            current_tick += 1
+        current_tick = tick
+        state.apply(pygame.event.Event(pygame.JOYAXISMOTION, axis=axis, value=value))
+    state.tick()
+    if state.dirty:
+        sends += 1
+    return sends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recording", help="JSON lines axis recording (default: synthetic noise)")
+    parser.add_argument("--record", metavar="PATH", help="record axis events from a controller to PATH and exit")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE_PATH)
+    parser.add_argument("--poll-hz", type=int, default=DEFAULT_POLL_HZ)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.record:
+        record_joystick(args.record, args.seconds)
+        return
+
+    if args.recording:
+        samples = load_recording(args.recording)
+    else:
+        samples = synthetic_noise(args.seconds, seed=args.seed)
+    if not samples:
+        raise SystemExit("Recording is empty")
+
+    duration = max(samples[-1][0], 1.0 / args.poll_hz)
+    raw_sends = count_sends(samples, None, args.poll_hz)
+    conditioned_sends = count_sends(samples, InputConditioner.from_file(args.profile), args.poll_hz)
+    saved = raw_sends - conditioned_sends
+    print(f"Axis events:         {len(samples)} over {duration:.1f}s")
+    print(f"Sends (raw):         {raw_sends} ({raw_sends / duration:.1f}/s)")
+    print(f"Sends (conditioned): {conditioned_sends} ({conditioned_sends / duration:.1f}/s)")
+    print(f"Saved:               {saved} ({saved / raw_sends * 100 if raw_sends else 0:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+﻿"""Gửi lại một input log (xem Client/input_log.py) tới server qua RemoteClient.
+
+    python -m Client.replay_log session.rclog              # đúng nhịp đã ghi (1x)
+    python -m Client.replay_log session.rclog --speed 4    # nhanh gấp 4
+    python -m Client.replay_log session.rclog --speed 0    # nhanh hết mức, để tạo tải
+
+Ghi log bằng `python -m Client.headless --record session.rclog`.
+"""
+import argparse
+import time
+from Client.client import RemoteClient
+from Client.input_log import read_input_log
+from Common.protocol import timestamp_ms
+
+
+def replay(remote_client, frames, speed=1.0):
+    """Gửi frames ((micro giây, frame), ...) theo nhịp đã ghi chia cho speed; speed <= 0 là không chờ."""
+    sent = failed = late = 0
+    started = time.monotonic()
+    for elapsed_us, frame in frames:
+        if speed > 0:
+            delay = started + elapsed_us / 1e6 / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -0.001:
+                late += 1
+        # Timestamp mới để server đo độ trễ của lần gửi này, không phải lần ghi
+        if remote_client.send_controller_data(frame["button_states"], frame["axis_values"],
+                                              frame["hat_values"], timestamp=timestamp_ms()):
+            sent += 1
+        else:
+            failed += 1
+    duration = time.monotonic() - started
+    return {
+        "sent": sent,
+        "failed": failed,
+        "late": late,
+        "duration_s": round(duration, 3),
+        "rate": round((sent + failed) / duration, 1) if duration else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", help="input log written by the recorder")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed, 0 = as fast as possible")
+    parser.add_argument("--loop", type=int, default=1, help="play the log this many times")
+    parser.add_argument("--transport", default="ws", choices=("ws", "http", "udp"))
+    parser.add_argument("--wire-format", default="binary", choices=("binary", "json"))
+    parser.add_argument("--firebase-cred", default=None, help="service account key used to look up the server URL")
+    args = parser.parse_args()
+
+    frames = list(read_input_log(args.log))
+    if not frames:
+        raise SystemExit(f"{args.log} không có frame nào")
+    print(f"📼 {len(frames)} frame, {frames[-1][0] / 1e6:.1f}s đã ghi")
+
+    client_options = {"transport": args.transport, "wire_format": args.wire_format}
+    if args.firebase_cred:
+        client_options["firebase_cred_path"] = args.firebase_cred
+    remote_client = RemoteClient(**client_options)
+    try:
+        for _ in range(args.loop):
+            print(f"▶️ {replay(remote_client, frames, args.speed)}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remote_client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+﻿import threading
+import time
+from Common.metrics import LatencyHistogram
+from Common.protocol import timestamp_ms
+
+
+class LatestStateMailbox:
+    """Hộp thư chỉ giữ trạng thái mới nhất: put() ghi đè frame chưa gửi, take() chặn tới khi có frame."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self._closed = False
+        self.posted = 0
+        self.coalesced = 0
+
+    def put(self, item):
+        with self._condition:
+            if self._has_item:
+                # Frame cũ chưa kịp gửi đã có trạng thái mới hơn: gộp lại, chỉ giữ bản mới
+                self.coalesced += 1
+            self._item = item
+            self._has_item = True
+            self.posted += 1
+            self._condition.notify()
+
+    def take(self, timeout=None):
+        """Lấy frame mới nhất; trả None khi hộp thư đã đóng hoặc hết timeout."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._has_item or self._closed, timeout):
+                return None
+            if not self._has_item:
+                return None
+            item, self._item, self._has_item = self._item, None, False
+            return item
+
+    @property
+    def pending(self):
+        return self._has_item
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """Đóng hộp thư; trả về True nếu còn một frame chưa gửi bị bỏ lại."""
+        with self._condition:
+            self._closed = True
+            left_over = self._has_item
+            self._item, self._has_item = None, False
+            self._condition.notify_all()
+            return left_over
+
+
+class ControllerSender:
+    """Luồng gửi dữ liệu điều khiển: ngủ tới khi có trạng thái mới, luôn gửi bản mới nhất."""
+
+    def __init__(self, remote_client, idle_interval=0.5):
+        self.remote_client = remote_client
+        self.idle_interval = idle_interval
+        self.mailbox = LatestStateMailbox()
+        self.sent = 0
+        self.dropped = 0
+        self.send_time = LatencyHistogram()
+        self.input_age = LatencyHistogram()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, button_states, axis_values, hat_values, timestamp=None):
+        """Đưa trạng thái vừa lấy mẫu vào mailbox; timestamp mặc định là lúc gọi submit()."""
+        if timestamp is None:
+            timestamp = timestamp_ms()
+        self.mailbox.put((button_states, axis_values, hat_values, timestamp))
+
+    def stop(self, timeout=None):
+        if self.mailbox.close():
+            self.dropped += 1
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def stats(self):
+        return {
+            "posted": self.mailbox.posted,
+            "sent": self.sent,
+            "coalesced": self.mailbox.coalesced,
+            "dropped": self.dropped,
+            "queue_depth": 1 if self.mailbox.pending else 0,
+            "send_time": self.send_time.summary(),
+            "input_age": self.input_age.summary(),
+        }
+
+    def _run(self):
+        while True:
+            data = self.mailbox.take(timeout=self.idle_interval)
+            if data is None:
+                if self.mailbox.closed:
+                    break
+                # Không có input mới: tranh thủ gửi keyframe nếu server vừa xin
+                try:
+                    self.remote_client.resend_keyframe_if_requested()
+                except Exception as e:
+                    print(f"Error sending keyframe: {e}")
+                continue
+            started = time.perf_counter()
+            try:
+                sent = self.remote_client.send_controller_data(*data[:3], timestamp=data[3])
+                # Thời gian gửi và tuổi của input (lấy mẫu -> gửi xong) để biết trễ nằm ở client hay mạng
+                self.send_time.record((time.perf_counter() - started) * 1e6)
+                self.input_age.record(((timestamp_ms() - data[3]) & 0xFFFFFFFF) * 1000)
+                if sent:
+                    self.sent += 1
+                else:
+                    self.dropped += 1
+            except Exception as e:
+                self.dropped += 1
+                print(f"Error sending data: {e}")
@@ -0,0 +1,273 @@
+﻿import json
+import secrets
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import requests.adapters
+from Common.protocol import CONTENT_TYPE_BINARY
+from Common.netsim import LossyDatagramSocket
+
+try:
+    import simple_websocket
+except ImportError:  # WebSocket là tuỳ chọn, thiếu thư viện thì dùng HTTP
+    simple_websocket = None
+
+try:
+    import httpx
+    import h2
+except ImportError:  # HTTP/2 là tuỳ chọn
+    httpx = h2 = None
+
+
+class HttpTransport:
+    """Gửi frame điều khiển bằng POST tới /controller-input qua session giữ kết nối (keep-alive).
+
+    Tối đa max_in_flight request được gửi song song: một response chậm không chặn
+    frame kế tiếp, còn khi mọi slot đều bận thì send() chờ (mailbox sẽ gộp frame). Các
+    request song song có thể tới server sai thứ tự nên RemoteClient chỉ gửi keyframe qua đây.
+    http2=True dùng httpx nếu đã cài httpx[http2], không thì quay về requests.
+    """
+    name = "http"
+
+    def __init__(self, server_url, connect_timeout=3.05, read_timeout=10, max_in_flight=4, http2=False):
+        self.server_url = server_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_in_flight = max(1, max_in_flight)
+        self.keyframe_requested = False
+        self.failed = 0
+        self.session, self.errors, self.http2 = self._create_session(http2)
+        self.in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self.executor = None
+        if self.max_in_flight > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="http-send")
+
+    def _create_session(self, http2):
+        if http2:
+            if httpx is not None and h2 is not None:
+                client = httpx.Client(
+                    http2=True,
+                    timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                    limits=httpx.Limits(max_connections=self.max_in_flight,
+                                        max_keepalive_connections=self.max_in_flight),
+                )
+                return client, (httpx.HTTPError,), True
+            print("⚠️ Chưa cài httpx[http2], dùng HTTP/1.1 keep-alive.")
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session, (requests.RequestException,), False
+
+    def _request(self, method, path, **kwargs):
+        if not self.http2:
+            kwargs["timeout"] = (self.connect_timeout, self.read_timeout)
+        return self.session.request(method, f"{self.server_url}{path}", **kwargs)
+
+    def get(self, path):
+        return self._request("GET", path)
+
+    def set_session(self, session_id):
+        """Gắn mã phiên server cấp vào mọi request sau đó."""
+        self.session.headers["X-Session-Id"] = session_id
+
+    def connect(self):
+        return True
+
+    def send(self, data):
+        """Gửi frame: dict đi dạng JSON, bytes đi dạng frame nhị phân."""
+        if self.executor is None:
+            return self._post_frame(data)
+        # Chờ slot trống rồi gửi ở luồng nền, không đợi response
+        self.in_flight.acquire()
+        try:
+            self.executor.submit(self._post_frame_async, data)
+        except RuntimeError:
+            self.in_flight.release()
+            return False
+        return True
+
+    def _post_frame_async(self, data):
+        try:
+            if not self._post_frame(data):
+                self.failed += 1
+                self.keyframe_requested = True
+        except self.errors as e:
+            print(f"❌ Lỗi khi gửi dữ liệu điều khiển: {e}")
+            # Frame delta đã mất: frame sau phải là keyframe
+            self.failed += 1
+            self.keyframe_requested = True
+        finally:
+            self.in_flight.release()
+
+    def _post_frame(self, data):
+        if isinstance(data, bytes):
+            # httpx nhận body thô qua content=, requests qua data=
+            body = {"content" if self.http2 else "data": data}
+            response = self._request("POST", "/controller-input",
+                                     headers={"Content-Type": CONTENT_TYPE_BINARY}, **body)
+        else:
+            response = self._request("POST", "/controller-input", json=data)
+        if response.status_code == 200:
+            # Server mất frame delta thì xin keyframe trong response
+            if response.headers.get("Content-Type", "").startswith("application/json"):
+                self.keyframe_requested = self.keyframe_requested or response.json().get("keyframe_request", False)
+            return True
+        print(f"⚠️ Lỗi gửi dữ liệu điều khiển: {response.status_code} - {response.text}")
+        return False
+
+    def poll_keyframe_request(self):
+        requested, self.keyframe_requested = self.keyframe_requested, False
+        return requested
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.session.close()
+
+
+class WebSocketTransport:
+    """Giữ một kết nối WebSocket lâu dài tới /controller-ws và stream frame qua đó."""
+    name = "ws"
+
+    def __init__(self, server_url, path="/controller-ws", session_id=None):
+        self.server_url = server_url
+        self.path = path
+        self.session_id = session_id
+        self.ws = None
+
+    @property
+    def ws_url(self):
+        path = self.path + (f"?session={self.session_id}" if self.session_id else "")
+        if self.server_url.startswith("https://"):
+            return "wss://" + self.server_url[len("https://"):] + path
+        if self.server_url.startswith("http://"):
+            return "ws://" + self.server_url[len("http://"):] + path
+        return self.server_url + path
+
+    @property
+    def connected(self):
+        return self.ws is not None and self.ws.connected
+
+    def connect(self):
+        if simple_websocket is None:
+            print("⚠️ Chưa cài simple-websocket, không thể dùng WebSocket.")
+            return False
+        self.close()
+        try:
+            print(f"🔌 Mở WebSocket tới: {self.ws_url}")
+            self.ws = simple_websocket.Client.connect(self.ws_url)
+            return True
+        except Exception as e:
+            print(f"❌ Không mở được WebSocket: {e}")
+            self.ws = None
+            return False
+
+    def send(self, data):
+        """Frame JSON gửi thành text message, frame nhị phân gửi thành binary message."""
+        message = data if isinstance(data, bytes) else json.dumps(data)
+        # Kết nối bị đóng giữa chừng (tunnel khởi động lại...) thì mở lại một lần rồi gửi tiếp
+        if not self.connected and not self.connect():
+            return False
+        try:
+            self.ws.send(message)
+            return True
+        except (simple_websocket.ConnectionClosed, simple_websocket.ConnectionError, OSError):
+            if not self.connect():
+                return False
+            try:
+                self.ws.send(message)
+                return True
+            except (simple_websocket.ConnectionClosed, simple_websocket.ConnectionError, OSError) as e:
+                print(f"❌ Lỗi gửi qua WebSocket: {e}")
+                self.close()
+                return False
+
+    def poll_keyframe_request(self):
+        """Đọc hết thông điệp server gửi về, trả True nếu trong đó có yêu cầu keyframe."""
+        requested = False
+        while True:
+            message = self.receive(timeout=0)
+            if message is None:
+                return requested
+            if isinstance(message, dict) and message.get("type") == "keyframe":
+                requested = True
+
+    def receive(self, timeout=0):
+        """Đọc một thông điệp server gửi về (nếu có), không chặn khi timeout=0."""
+        if not self.connected:
+            return None
+        try:
+            message = self.ws.receive(timeout=timeout)
+        except (simple_websocket.ConnectionClosed, simple_websocket.ConnectionError):
+            self.close()
+            return None
+        if isinstance(message, str):
+            return json.loads(message)
+        return message
+
+    def close(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+            self.ws = None
+
+
+class UdpTransport:
+    """Gửi mỗi frame là một datagram độc lập (keyframe có sequence number), không chờ ACK.
+
+    Mỗi datagram bắt đầu bằng 8 byte mã phiên để server tách input của từng client.
+
+    Frame có nút bấm đổi trạng thái được gửi thêm redundancy bản sao; server bỏ bản
+    trùng và frame đến trễ. UDP không có ACK nên poll_keyframe_request() luôn trả True:
+    khi input đứng yên, sender gửi lại trạng thái cuối định kỳ như heartbeat.
+    loss/jitter_ms > 0 bật bộ giả lập mất gói để thử trên localhost.
+    """
+    name = "udp"
+
+    def __init__(self, host, port, session_id=None, redundancy=2, loss=0.0, jitter_ms=0.0):
+        self.address = (host, port)
+        self.session_token = bytes.fromhex(session_id) if session_id else secrets.token_bytes(8)
+        self.redundancy = redundancy
+        self.loss = loss
+        self.jitter_ms = jitter_ms
+        self.sock = None
+
+    def connect(self):
+        self.close()
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if self.loss > 0 or self.jitter_ms > 0:
+                self.sock = LossyDatagramSocket(self.sock, loss=self.loss, jitter_ms=self.jitter_ms)
+            print(f"📡 Gửi dữ liệu qua UDP tới: {self.address[0]}:{self.address[1]}")
+            return True
+        except OSError as e:
+            print(f"❌ Không tạo được UDP socket: {e}")
+            self.sock = None
+            return False
+
+    def send(self, data, important=False):
+        if not isinstance(data, bytes):
+            raise ValueError("UDP chỉ gửi frame nhị phân")
+        if self.sock is None and not self.connect():
+            return False
+        copies = 1 + (self.redundancy if important else 0)
+        datagram = self.session_token + data
+        try:
+            for _ in range(copies):
+                self.sock.sendto(datagram, self.address)
+            return True
+        except OSError as e:
+            print(f"❌ Lỗi gửi qua UDP: {e}")
+            return False
+
+    def poll_keyframe_request(self):
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
@@ -0,0 +1,11 @@
+﻿import json
+import os
+
+
+def write_json_atomic(path, data):
+    """Ghi data thành file JSON: ghi file tạm rồi đổi tên để tiến trình khác không đọc phải file ghi dở."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
@@ -0,0 +1,130 @@
+﻿import threading
+
+# Histogram kiểu HDR: 64 bucket tuyến tính cho giá trị nhỏ, sau đó mỗi lần giá trị gấp đôi
+# lại chia thành 32 bucket, nên sai số tương đối luôn dưới ~3% mà chỉ tốn vài trăm ô đếm.
+_SUB_BITS = 6
+_SUB_COUNT = 1 << _SUB_BITS
+_HALF = _SUB_COUNT // 2
+
+
+def _bucket_index(value):
+    if value < _SUB_COUNT:
+        return value
+    shift = value.bit_length() - _SUB_BITS
+    return _SUB_COUNT + (shift - 1) * _HALF + ((value >> shift) - _HALF)
+
+
+def _bucket_upper(index):
+    """Giá trị lớn nhất rơi vào bucket index."""
+    if index < _SUB_COUNT:
+        return index
+    shift = (index - _SUB_COUNT) // _HALF + 1
+    sub = (index - _SUB_COUNT) % _HALF + _HALF
+    return ((sub + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Đếm phân bố độ trễ (đơn vị micro giây) để tính p50/p99/p999 mà không lưu từng mẫu."""
+
+    def __init__(self, max_value_us=60_000_000):
+        self.max_value = max_value_us
+        self.counts = [0] * (_bucket_index(max_value_us) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self._lock = threading.Lock()
+
+    def record(self, value_us):
+        value = min(max(int(value_us), 0), self.max_value)
+        with self._lock:
+            self.counts[_bucket_index(value)] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        with self._lock:
+            if self.count == 0:
+                return 0
+            target = max(1, int(round(self.count * percent / 100)))
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= target:
+                    return min(_bucket_upper(index), self.max)
+            return self.max
+
+    def merge(self, other):
+        """Cộng dồn một histogram khác (vd. đo ở process khác) vào histogram này."""
+        with self._lock:
+            for index, count in enumerate(other.counts):
+                if count:
+                    self.counts[index] += count
+            self.count += other.count
+            self.total += other.total
+            if other.min is not None and (self.min is None or other.min < self.min):
+                self.min = other.min
+            self.max = max(self.max, other.max)
+
+    def __getstate__(self):
+        # Lock không pickle được; cần khi gửi histogram giữa các process
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_us": round(self.mean, 1),
+            "min_us": self.min or 0,
+            "p50_us": self.percentile(50),
+            "p99_us": self.percentile(99),
+            "p999_us": self.percentile(99.9),
+            "max_us": self.max,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * len(self.counts)
+            self.count = 0
+            self.total = 0
+            self.min = None
+            self.max = 0
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def prometheus_summary(name, histogram, help_text, labels=None):
+    """Xuất histogram dạng summary của Prometheus (giây)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+    for quantile in (0.5, 0.9, 0.99, 0.999):
+        quantile_labels = dict(labels or {}, quantile=str(quantile))
+        value = histogram.percentile(quantile * 100) / 1e6
+        lines.append(f"{name}{_format_labels(quantile_labels)} {value:.6f}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total / 1e6:.6f}")
+    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+    return lines
+
+
+def prometheus_metric(name, metric_type, help_text, samples):
+    """samples: danh sách (labels, giá trị)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    return lines
@@ -0,0 +1,68 @@
+﻿import heapq
+import random
+import threading
+import time
+
+
+class LossyDatagramSocket:
+    """Bọc một UDP socket để giả lập mạng xấu khi thử trên localhost.
+
+    Mỗi datagram bị bỏ với xác suất loss, số còn lại được gửi sau một độ trễ
+    ngẫu nhiên trong [0, jitter_ms] nên có thể đến sai thứ tự.
+    """
+
+    def __init__(self, sock, loss=0.0, jitter_ms=0.0, seed=None):
+        self.sock = sock
+        self.loss = loss
+        self.jitter_ms = jitter_ms
+        self.random = random.Random(seed)
+        self.sent = 0
+        self.lost = 0
+        self._queue = []
+        self._counter = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = None
+        if jitter_ms > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def sendto(self, data, address):
+        if self.random.random() < self.loss:
+            self.lost += 1
+            return len(data)
+        self.sent += 1
+        if self._thread is None:
+            return self.sock.sendto(data, address)
+        due = time.monotonic() + self.random.uniform(0, self.jitter_ms) / 1000
+        with self._condition:
+            self._counter += 1
+            heapq.heappush(self._queue, (due, self._counter, data, address))
+            self._condition.notify()
+        return len(data)
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                due, _, data, address = self._queue[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._queue)
+                try:
+                    self.sock.sendto(data, address)
+                except OSError:
+                    pass
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.sock.close()
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
@@ -0,0 +1,424 @@
+﻿import struct
+import time
+
+# ========== WIRE FORMAT ==========
+# Frame nhị phân cho dữ liệu bộ điều khiển (little-endian):
+#   B     version (4 bit cao) | loại frame (4 bit thấp)
+#   H     sequence number (quay vòng 16 bit)
+#   I     timestamp lúc lấy mẫu, mili giây (quay vòng 32 bit)
+#   B     số nút bấm, theo sau là bitmask ceil(n/8) byte
+#   B     số trục (4 bit cao) | số hat (4 bit thấp)
+#   h*n   giá trị trục đã lượng tử hoá về int16
+#   B*    mỗi hat 4 bit: (x + 1) << 2 | (y + 1), hai hat một byte
+# Với tay cầm PS5 (16 nút, 6 trục, 1 hat) một keyframe chỉ còn 24 byte.
+#
+# Frame delta chỉ mang các giá trị đã đổi so với frame trước, cùng header:
+#   B     các phần có mặt: bit 0 nút, bit 1 trục, bit 2 hat
+#   nút   B số nút đổi, mỗi nút một byte: chỉ số << 1 | trạng thái
+#   trục  B số trục đổi, mỗi trục: B chỉ số + h giá trị
+#   hat   B số hat đổi, mỗi hat một byte: chỉ số << 4 | nibble
+# Nhấn/nhả một nút khi cần analog đứng yên chỉ tốn 10 byte.
+VERSION = 1
+FRAME_KEY = 0
+FRAME_DELTA = 1
+
+SECTION_BUTTONS = 0x01
+SECTION_AXES = 0x02
+SECTION_HATS = 0x04
+
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_BINARY = "application/x-controller-frame"
+FORMATS = ("json", "binary")
+
+AXIS_SCALE = 32767
+
+# Keyframe lùi xa hơn cửa sổ này được coi là client khởi động lại, không phải frame đến trễ
+REORDER_WINDOW = 256
+
+_HEADER = struct.Struct("<BHI")
+_AXIS_CHANGE = struct.Struct("<Bh")
+
+# Tên nút/trục theo chỉ số của pygame, dùng chung cho client và server
+BUTTON_NAMES = {
+    0: 'cross',
+    1: 'circle',
+    2: 'square',
+    3: 'triangle',
+    4: 'share',
+    5: 'ps',
+    6: 'option',
+    7: 'l3',
+    8: 'r3',
+    9: 'l1',
+    10: 'r1',
+    11: 'dpad_up',
+    12: 'dpad_down',
+    13: 'dpad_left',
+    14: 'dpad_right',
+    15: 'touchpad',
+}
+
+AXIS_NAMES = {
+    0: 'left_stick_x',
+    1: 'left_stick_y',
+    2: 'right_stick_x',
+    3: 'right_stick_y',
+    4: 'l2',
+    5: 'r2',
+}
+
+_BUTTON_INDEX = {name: i for i, name in BUTTON_NAMES.items()}
+_AXIS_INDEX = {name: i for i, name in AXIS_NAMES.items()}
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def button_name(index):
+    return BUTTON_NAMES.get(index, f'button_{index}')
+
+
+def axis_name(index):
+    return AXIS_NAMES.get(index, f'axis_{index}')
+
+
+def hat_name(index):
+    return f'hat_{index}'
+
+
+def _index(name, known, prefix):
+    if name in known:
+        return known[name]
+    if name.startswith(prefix):
+        return int(name[len(prefix):])
+    raise ProtocolError(f"Không biết chỉ số của '{name}'")
+
+
+def button_index(name):
+    return _index(name, _BUTTON_INDEX, 'button_')
+
+
+def axis_index(name):
+    return _index(name, _AXIS_INDEX, 'axis_')
+
+
+def hat_index(name):
+    return _index(name, {}, 'hat_')
+
+
+def timestamp_ms():
+    """Thời điểm hiện tại theo mili giây, cắt về 32 bit như trong frame."""
+    return int(time.time() * 1000) & 0xFFFFFFFF
+
+
+def quantize_axis(value):
+    return max(-AXIS_SCALE, min(AXIS_SCALE, int(round(value * AXIS_SCALE))))
+
+
+def dequantize_axis(value):
+    return value / AXIS_SCALE
+
+
+def _pack_hat(value):
+    x, y = value
+    return ((int(x) + 1) << 2) | (int(y) + 1)
+
+
+def _unpack_hat(nibble):
+    return [(nibble >> 2) - 1, (nibble & 0x3) - 1]
+
+
+def _encode_keyframe(packed, buttons, axes, hats):
+    n_buttons = max(buttons) + 1 if buttons else 0
+    n_axes = max(axes) + 1 if axes else 0
+    n_hats = max(hats) + 1 if hats else 0
+    if n_buttons > 255 or n_axes > 15 or n_hats > 15:
+        raise ProtocolError("Quá nhiều nút/trục/hat cho một frame")
+
+    mask = 0
+    for i, pressed in buttons.items():
+        if pressed:
+            mask |= 1 << i
+
+    packed.append(n_buttons)
+    packed += mask.to_bytes((n_buttons + 7) // 8, "little")
+    packed.append((n_axes << 4) | n_hats)
+    packed += struct.pack(f"<{n_axes}h", *(quantize_axis(axes.get(i, 0.0)) for i in range(n_axes)))
+    for i in range(0, n_hats, 2):
+        high = _pack_hat(hats.get(i, (0, 0)))
+        low = _pack_hat(hats.get(i + 1, (0, 0))) if i + 1 < n_hats else 0
+        packed.append((high << 4) | low)
+
+
+def _encode_delta(packed, buttons, axes, hats):
+    if max(buttons, default=0) > 127 or max(hats, default=0) > 15 or max(axes, default=0) > 255:
+        raise ProtocolError("Chỉ số nút/trục/hat vượt giới hạn của frame delta")
+    sections = ((SECTION_BUTTONS if buttons else 0) |
+                (SECTION_AXES if axes else 0) |
+                (SECTION_HATS if hats else 0))
+    packed.append(sections)
+    if buttons:
+        packed.append(len(buttons))
+        packed += bytes((i << 1) | (1 if pressed else 0) for i, pressed in buttons.items())
+    if axes:
+        packed.append(len(axes))
+        for i, value in axes.items():
+            packed += _AXIS_CHANGE.pack(i, quantize_axis(value))
+    if hats:
+        packed.append(len(hats))
+        packed += bytes((i << 4) | _pack_hat(value) for i, value in hats.items())
+
+
+def encode_frame(button_states, axis_values, hat_values, seq=0, timestamp=None, keyframe=True):
+    """Đóng gói trạng thái bộ điều khiển thành frame nhị phân.
+
+    Với keyframe=False chỉ các giá trị được truyền vào (những giá trị đã đổi) được gửi đi.
+    """
+    if timestamp is None:
+        timestamp = timestamp_ms()
+
+    buttons = {button_index(name): value for name, value in button_states.items()}
+    axes = {axis_index(name): value for name, value in axis_values.items()}
+    hats = {hat_index(name): value for name, value in hat_values.items()}
+
+    frame_type = FRAME_KEY if keyframe else FRAME_DELTA
+    packed = bytearray(_HEADER.pack((VERSION << 4) | frame_type, seq & 0xFFFF, timestamp & 0xFFFFFFFF))
+    if keyframe:
+        _encode_keyframe(packed, buttons, axes, hats)
+    else:
+        _encode_delta(packed, buttons, axes, hats)
+    return bytes(packed)
+
+
+def _decode_keyframe(payload, offset):
+    n_buttons = payload[offset]
+    offset += 1
+    mask_size = (n_buttons + 7) // 8
+    mask = int.from_bytes(payload[offset:offset + mask_size], "little")
+    offset += mask_size
+
+    counts = payload[offset]
+    offset += 1
+    n_axes, n_hats = counts >> 4, counts & 0x0F
+    axes = struct.unpack_from(f"<{n_axes}h", payload, offset)
+    offset += 2 * n_axes
+
+    hat_values = {}
+    for i in range(n_hats):
+        byte = payload[offset + i // 2]
+        nibble = byte >> 4 if i % 2 == 0 else byte & 0x0F
+        hat_values[hat_name(i)] = _unpack_hat(nibble)
+
+    button_states = {button_name(i): (mask >> i) & 1 for i in range(n_buttons)}
+    axis_values = {axis_name(i): dequantize_axis(v) for i, v in enumerate(axes)}
+    return button_states, axis_values, hat_values
+
+
+def _decode_delta(payload, offset):
+    sections = payload[offset]
+    offset += 1
+    button_states, axis_values, hat_values = {}, {}, {}
+    if sections & SECTION_BUTTONS:
+        count = payload[offset]
+        for byte in payload[offset + 1:offset + 1 + count]:
+            button_states[button_name(byte >> 1)] = byte & 1
+        if len(button_states) != count:
+            raise IndexError("thiếu dữ liệu nút")
+        offset += 1 + count
+    if sections & SECTION_AXES:
+        count = payload[offset]
+        offset += 1
+        for _ in range(count):
+            i, value = _AXIS_CHANGE.unpack_from(payload, offset)
+            axis_values[axis_name(i)] = dequantize_axis(value)
+            offset += _AXIS_CHANGE.size
+    if sections & SECTION_HATS:
+        count = payload[offset]
+        offset += 1
+        for i in range(count):
+            byte = payload[offset + i]
+            hat_values[hat_name(byte >> 4)] = _unpack_hat(byte & 0x0F)
+    return button_states, axis_values, hat_values
+
+
+def decode_frame(payload):
+    """Giải mã frame nhị phân thành dict cùng dạng với payload JSON."""
+    try:
+        version_type, seq, timestamp = _HEADER.unpack_from(payload, 0)
+        if version_type >> 4 != VERSION:
+            raise ProtocolError(f"Không hỗ trợ phiên bản frame {version_type >> 4}")
+        frame_type = version_type & 0x0F
+        if frame_type == FRAME_KEY:
+            button_states, axis_values, hat_values = _decode_keyframe(payload, _HEADER.size)
+        elif frame_type == FRAME_DELTA:
+            button_states, axis_values, hat_values = _decode_delta(payload, _HEADER.size)
+        else:
+            raise ProtocolError(f"Loại frame không hợp lệ: {frame_type}")
+    except (struct.error, IndexError) as e:
+        raise ProtocolError(f"Frame bị cắt cụt: {e}") from e
+
+    return {
+        "seq": seq,
+        "timestamp": timestamp,
+        "keyframe": frame_type == FRAME_KEY,
+        "button_states": button_states,
+        "axis_values": axis_values,
+        "hat_values": hat_values,
+    }
+
+
+def _is_uint(value, limit):
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= limit
+
+
+def check_json_frame(frame):
+    """Kiểm tra payload JSON có cùng dạng với kết quả decode_frame; sai thì ném ProtocolError."""
+    if not isinstance(frame, dict):
+        raise ProtocolError(f"Frame phải là object JSON, không phải {type(frame).__name__}")
+    if frame.get("seq") is not None and not _is_uint(frame["seq"], 0xFFFF):
+        raise ProtocolError(f"seq không hợp lệ: {frame['seq']!r}")
+    if frame.get("timestamp") is not None and not _is_uint(frame["timestamp"], 0xFFFFFFFF):
+        raise ProtocolError(f"timestamp không hợp lệ: {frame['timestamp']!r}")
+    if not isinstance(frame.get("keyframe", True), bool):
+        raise ProtocolError(f"keyframe không hợp lệ: {frame['keyframe']!r}")
+    for section in ("button_states", "axis_values", "hat_values"):
+        if not isinstance(frame.get(section, {}), dict):
+            raise ProtocolError(f"{section} phải là object JSON")
+    return frame
+
+
+def _changed(current, previous):
+    return {name: value for name, value in current.items() if previous.get(name) != value}
+
+
+def seq_distance(seq, last_seq):
+    """Khoảng cách từ last_seq tới seq trên vòng 16 bit; âm nghĩa là frame cũ hơn."""
+    diff = (seq - last_seq) & 0xFFFF
+    return diff - 0x10000 if diff >= 0x8000 else diff
+
+
+class FrameEncoder:
+    """Phía client: biến trạng thái đầy đủ thành keyframe hoặc delta kèm sequence number.
+
+    Cứ keyframe_interval frame lại gửi một keyframe, hoặc ngay frame sau khi
+    server yêu cầu qua request_keyframe().
+    """
+
+    def __init__(self, wire_format="binary", keyframe_interval=60):
+        self.wire_format = wire_format
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.frames_since_keyframe = 0
+        self.keyframe_pending = True
+        self.last_buttons = {}
+        self.last_axes = {}
+        self.last_hats = {}
+
+    def request_keyframe(self):
+        self.keyframe_pending = True
+
+    def encode(self, button_states, axis_values, hat_values, timestamp=None):
+        """Trả về frame để gửi, hoặc None nếu trạng thái không đổi gì."""
+        keyframe = self.keyframe_pending or self.frames_since_keyframe >= self.keyframe_interval
+        if keyframe:
+            buttons, axes, hats = button_states, axis_values, hat_values
+        else:
+            buttons = _changed(button_states, self.last_buttons)
+            axes = _changed(axis_values, self.last_axes)
+            hats = _changed(hat_values, self.last_hats)
+            if not (buttons or axes or hats):
+                return None
+
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.keyframe_pending = False
+        self.frames_since_keyframe = 0 if keyframe else self.frames_since_keyframe + 1
+        self.last_buttons = dict(button_states)
+        self.last_axes = dict(axis_values)
+        self.last_hats = dict(hat_values)
+
+        if timestamp is None:
+            timestamp = timestamp_ms()
+        if self.wire_format == "binary":
+            return encode_frame(buttons, axes, hats, seq=self.seq, timestamp=timestamp, keyframe=keyframe)
+        return {
+            "seq": self.seq,
+            "timestamp": timestamp,
+            "keyframe": keyframe,
+            "button_states": buttons,
+            "axis_values": axes,
+            "hat_values": hats
+        }
+
+
+class FrameDecoder:
+    """Phía server: ghép keyframe và delta thành trạng thái đầy đủ, phát hiện mất frame.
+
+    Frame đến trễ (sequence cũ hơn frame đã áp dụng) bị bỏ qua. Khi sequence nhảy
+    cóc hoặc delta đến trước keyframe đầu tiên, needs_keyframe được bật để
+    server xin client gửi lại keyframe.
+    """
+
+    def __init__(self):
+        self.button_states = {}
+        self.axis_values = {}
+        self.hat_values = {}
+        self.last_seq = None
+        self.has_keyframe = False
+        self.needs_keyframe = False
+        self.gaps = 0
+        self.lost_frames = 0
+        self.stale_frames = 0
+
+    def is_stale(self, frame):
+        """Frame trùng (bản sao dư của UDP) hoặc đến trễ: apply() sẽ bỏ nó mà không đổi trạng thái."""
+        seq = frame.get("seq")
+        if seq is None or self.last_seq is None:
+            return False
+        distance = seq_distance(seq, self.last_seq)
+        if frame.get("keyframe", True) and distance < -REORDER_WINDOW:
+            return False
+        return distance <= 0
+
+    def apply(self, frame):
+        """Áp dụng một frame đã giải mã; trả về trạng thái đầy đủ hoặc None nếu frame bị bỏ."""
+        # Client JSON cũ không có seq/keyframe: mỗi payload là một trạng thái đầy đủ
+        keyframe = frame.get("keyframe", True)
+        seq = frame.get("seq")
+
+        if seq is not None and self.last_seq is not None:
+            distance = seq_distance(seq, self.last_seq)
+            if keyframe and distance < -REORDER_WINDOW:
+                distance = 1
+            elif distance <= 0:
+                self.stale_frames += 1
+                return None
+            if distance > 1:
+                self.gaps += 1
+                self.lost_frames += distance - 1
+                if not keyframe:
+                    self.needs_keyframe = True
+        if seq is not None:
+            self.last_seq = seq
+
+        if keyframe:
+            self.button_states = dict(frame.get("button_states", {}))
+            self.axis_values = dict(frame.get("axis_values", {}))
+            self.hat_values = dict(frame.get("hat_values", {}))
+            self.has_keyframe = True
+            self.needs_keyframe = False
+        else:
+            # Tạo dict mới thay vì update tại chỗ: trạng thái đã trả ra trước đó không bị đổi theo
+            self.button_states = {**self.button_states, **frame.get("button_states", {})}
+            self.axis_values = {**self.axis_values, **frame.get("axis_values", {})}
+            self.hat_values = {**self.hat_values, **frame.get("hat_values", {})}
+            if not self.has_keyframe:
+                self.needs_keyframe = True
+
+        return {
+            "seq": seq,
+            "timestamp": frame.get("timestamp"),
+            "button_states": self.button_states,
+            "axis_values": self.axis_values,
+            "hat_values": self.hat_values,
+        }
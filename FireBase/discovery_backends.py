@@ -0,0 +1,117 @@
+﻿import json
+import os
+import tempfile
+import threading
+from Common.fileio import write_json_atomic
+
+# Nơi server công bố server_url để client tìm thấy:
+#   "firebase": Realtime Database thật (FirebaseController), cần mạng và service account
+#   "file":     file JSON trên máy (RC_DISCOVERY_FILE), client và server cùng một máy
+#   "memory":   bộ nhớ của process, client và server chạy chung một process (test, benchmark)
+DISCOVERY_BACKENDS = ("firebase", "file", "memory")
+DEFAULT_DISCOVERY_BACKEND = os.environ.get("RC_DISCOVERY_BACKEND", "firebase")
+DEFAULT_DISCOVERY_FILE = os.environ.get(
+    "RC_DISCOVERY_FILE", os.path.join(tempfile.gettempdir(), "remote-controller", "server_url.json"))
+
+
+class _Registration:
+    """Giống ListenerRegistration của firebase_admin: close() để ngừng nghe."""
+
+    def __init__(self, close):
+        self._close = close
+
+    def close(self):
+        self._close()
+
+
+class MemoryDiscovery:
+    """server_url dùng chung giữa mọi instance trong cùng process."""
+
+    _lock = threading.Lock()
+    _url = None
+    _callbacks = []
+
+    @classmethod
+    def set_url(cls, url: str):
+        with cls._lock:
+            cls._url = url
+            callbacks = list(cls._callbacks)
+        for callback in callbacks:
+            callback(url)
+
+    @classmethod
+    def get_url(cls) -> object:
+        with cls._lock:
+            return cls._url
+
+    @classmethod
+    def listen_url(cls, callback):
+        with cls._lock:
+            cls._callbacks.append(callback)
+            url = cls._url
+        # Như Firebase: báo ngay giá trị hiện tại
+        callback(url)
+
+        def close():
+            with cls._lock:
+                if callback in cls._callbacks:
+                    cls._callbacks.remove(callback)
+        return _Registration(close)
+
+
+class FileDiscovery:
+    """server_url trong một file JSON; listener theo dõi thời điểm sửa file."""
+
+    def __init__(self, path=DEFAULT_DISCOVERY_FILE, poll_interval=0.5):
+        self.path = path
+        self.poll_interval = poll_interval
+
+    def set_url(self, url: str):
+        write_json_atomic(self.path, {"server_url": url})
+
+    def get_url(self) -> object:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f).get("server_url")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def listen_url(self, callback):
+        stopped = threading.Event()
+
+        def watch():
+            last_mtime = self._mtime()
+            last_url = self.get_url()
+            callback(last_url)
+            while not stopped.wait(self.poll_interval):
+                mtime = self._mtime()
+                if mtime == last_mtime:
+                    continue
+                last_mtime = mtime
+                url = self.get_url()
+                if url != last_url:
+                    last_url = url
+                    callback(url)
+
+        threading.Thread(target=watch, daemon=True).start()
+        return _Registration(stopped.set)
+
+
+def create_discovery(backend=None, cred_path=None, path=None):
+    """Tạo nguồn server_url (có set_url, get_url, listen_url) theo tên backend."""
+    backend = backend or DEFAULT_DISCOVERY_BACKEND
+    if backend == "firebase":
+        # Import muộn: firebase_admin nạp chậm và không cần cho các backend local
+        from FireBase.firebase_controller import FirebaseController
+        return FirebaseController(cred_path=cred_path) if cred_path else FirebaseController()
+    if backend == "file":
+        return FileDiscovery(path or DEFAULT_DISCOVERY_FILE)
+    if backend == "memory":
+        return MemoryDiscovery()
+    raise ValueError(f"Backend discovery không hợp lệ: {backend}")
@@ -1,5 +1,8 @@
-﻿import firebase_admin
-from firebase_admin import credentials, db, initialize_app
+﻿try:
+    import firebase_admin
+    from firebase_admin import credentials, db, initialize_app
+except ImportError:  # Chỉ cần cho backend discovery "firebase" (xem discovery_backends.py)
+    firebase_admin = None
 
 class FirebaseController:
     def __init__(self,
@@ -11,6 +14,8 @@ class FirebaseController:
         self._initialize_firebase()
 
     def _initialize_firebase(self):
+        if firebase_admin is None:
+            raise ImportError("Chưa cài firebase-admin; dùng RC_DISCOVERY_BACKEND=file hoặc memory khi chạy local.")
         if not firebase_admin._apps:
             cred = credentials.Certificate(self.cred_path)
             initialize_app(cred, {
@@ -26,6 +31,14 @@ class FirebaseController:
     def get_url() -> object:
         return db.reference("server_url").get()
 
+    @staticmethod
+    def listen_url(callback):
+        """Gọi callback(url) ngay với giá trị hiện tại và mỗi khi server_url đổi (luồng riêng).
+
+        Trả về ListenerRegistration; gọi close() để ngừng nghe.
+        """
+        return db.reference("server_url").listen(lambda event: callback(event.data))
+
 
 # if __name__ == "__main__":
 #     print(FirebaseController().get_url())
\ No newline at end of file
@@ -0,0 +1,136 @@
+﻿import threading
+import time
+from collections import deque
+
+
+class RingBuffer:
+    """Vòng đệm có giới hạn giữa luồng nhận request và worker.
+
+    deque(maxlen) có append/popleft nguyên tử dưới GIL nên không cần khoá: luồng
+    HTTP không bao giờ phải chờ. Khi đầy, frame cũ nhất bị đẩy ra (đếm vào overflow).
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._items = deque(maxlen=capacity)
+        self.pushed = 0
+        self.overflow = 0
+
+    def push(self, item):
+        if len(self._items) >= self.capacity:
+            self.overflow += 1
+        self._items.append(item)
+        self.pushed += 1
+
+    def drain(self):
+        items = []
+        try:
+            while True:
+                items.append(self._items.popleft())
+        except IndexError:
+            return items
+
+    def __len__(self):
+        return len(self._items)
+
+
+def coalesce(frames):
+    """Bỏ các frame chỉ khác frame kế tiếp (cùng nguồn) ở giá trị trục.
+
+    Trục analog chỉ cần giá trị mới nhất trong một tick, còn mọi lần đổi trạng thái
+    nút/hat đều được giữ để nhấn-nhả nhanh trong cùng một tick không bị mất.
+    """
+    kept = []
+    next_by_source = {}
+    for frame in reversed(frames):
+        source, state = frame[0], frame[1]
+        following = next_by_source.get(source)
+        if (following is None or
+                state["button_states"] != following["button_states"] or
+                state["hat_values"] != following["hat_values"]):
+            kept.append(frame)
+        next_by_source[source] = state
+    kept.reverse()
+    return kept
+
+
+class InputDispatcher:
+    """Worker áp dụng frame điều khiển vào các output sink theo tick cố định.
+
+    submit() chỉ đẩy frame vào RingBuffer rồi trả về ngay; mọi thao tác với thiết bị
+    đầu ra (gamepad ảo, bàn phím, file ghi) chạy trên luồng worker.
+    """
+
+    def __init__(self, sinks=None, tick_rate=250, capacity=1024, metrics=None):
+        self.sinks = list(sinks or [])
+        self.metrics = metrics
+        self.tick_interval = 1.0 / tick_rate
+        self.buffer = RingBuffer(capacity)
+        self.ticks = 0
+        self.dispatched = 0
+        self.coalesced = 0
+        self.sink_errors = 0
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, source, state):
+        self.buffer.push((source, state, time.monotonic()))
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            self._dispatch(self.buffer.drain())
+            next_tick += self.tick_interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                # Tụt lại sau quá nhiều tick: bắt đầu nhịp mới thay vì chạy bù liên tục
+                next_tick = time.monotonic()
+        self._dispatch(self.buffer.drain())
+
+    def _dispatch(self, frames):
+        self.ticks += 1
+        if not frames:
+            return
+        kept = coalesce(frames)
+        self.coalesced += len(frames) - len(kept)
+        for sink in self.sinks:
+            try:
+                for source, state, _ in kept:
+                    sink.apply(source, state)
+                sink.flush()
+            except Exception as e:
+                self.sink_errors += 1
+                print(f"❌ Lỗi output sink {type(sink).__name__}: {e}")
+        self.dispatched += len(kept)
+        if self.metrics is not None:
+            for _, state, received_at in kept:
+                self.metrics.observe_dispatch(state, received_at)
+
+    def stats(self):
+        return {
+            "queued": len(self.buffer),
+            "received": self.buffer.pushed,
+            "overflow": self.buffer.overflow,
+            "coalesced": self.coalesced,
+            "dispatched": self.dispatched,
+            "sink_errors": self.sink_errors,
+            "ticks": self.ticks,
+        }
+
+    def stop(self, timeout=1):
+        self._stop.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print(f"❌ Lỗi đóng output sink {type(sink).__name__}: {e}")
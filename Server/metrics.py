@@ -0,0 +1,100 @@
+﻿import time
+from Common.metrics import LatencyHistogram, prometheus_metric, prometheus_summary
+from Common.protocol import timestamp_ms
+
+
+class ServerMetrics:
+    """Độ trễ input đo phía server, xuất ra /metrics theo định dạng text của Prometheus.
+
+    Độ trễ nhận/dispatch tính từ timestamp lúc client lấy mẫu (mili giây, đồng hồ của
+    client) nên chỉ chính xác khi đồng hồ hai máy được đồng bộ; frame có timestamp
+    "ở tương lai" được đếm vào clock_skew thay vì ghi nhận. Độ trễ hàng đợi (nhận ->
+    dispatch) chỉ dùng đồng hồ server.
+    """
+
+    def __init__(self):
+        self.receive_latency = LatencyHistogram()
+        self.dispatch_latency = LatencyHistogram()
+        self.queue_latency = LatencyHistogram()
+        self.frames_received = 0
+        self.frames_accepted = 0
+        self.clock_skew = 0
+        self.started_at = time.monotonic()
+
+    def _since_capture_us(self, timestamp):
+        # Timestamp quay vòng 32 bit: hiệu âm nghĩa là đồng hồ client chạy nhanh hơn server
+        elapsed = (timestamp_ms() - timestamp) & 0xFFFFFFFF
+        if elapsed >= 0x80000000:
+            self.clock_skew += 1
+            return None
+        return elapsed * 1000
+
+    def observe_receive(self, frame):
+        self.frames_received += 1
+        timestamp = frame.get("timestamp")
+        if timestamp is not None:
+            latency = self._since_capture_us(timestamp)
+            if latency is not None:
+                self.receive_latency.record(latency)
+
+    def observe_accept(self):
+        self.frames_accepted += 1
+
+    def observe_dispatch(self, state, received_at):
+        self.queue_latency.record((time.monotonic() - received_at) * 1e6)
+        timestamp = state.get("timestamp")
+        if timestamp is not None:
+            latency = self._since_capture_us(timestamp)
+            if latency is not None:
+                self.dispatch_latency.record(latency)
+
+    def render(self, dispatcher, sessions, udp_listener=None):
+        lines = []
+        lines += prometheus_summary("rc_receive_latency_seconds", self.receive_latency,
+                                    "Client capture to server receive")
+        lines += prometheus_summary("rc_dispatch_latency_seconds", self.dispatch_latency,
+                                    "Client capture to output sink dispatch")
+        lines += prometheus_summary("rc_queue_latency_seconds", self.queue_latency,
+                                    "Server receive to output sink dispatch")
+        lines += prometheus_metric("rc_frames_received_total", "counter", "Frames received on any transport",
+                                   [({}, self.frames_received)])
+        lines += prometheus_metric("rc_frames_accepted_total", "counter",
+                                   "Frames applied by a session decoder (not rate limited, duplicate or late)",
+                                   [({}, self.frames_accepted)])
+        lines += prometheus_metric("rc_clock_skew_frames_total", "counter",
+                                   "Frames whose capture timestamp is ahead of the server clock",
+                                   [({}, self.clock_skew)])
+        lines += prometheus_metric("rc_uptime_seconds", "gauge", "Seconds since the server started",
+                                   [({}, round(time.monotonic() - self.started_at, 1))])
+
+        dispatch = dispatcher.stats()
+        lines += prometheus_metric("rc_dispatch_queue_depth", "gauge", "Frames waiting in the ring buffer",
+                                   [({}, dispatch["queued"])])
+        lines += prometheus_metric("rc_dispatch_frames_total", "counter", "Frames handled by the dispatcher",
+                                   [({"result": "dispatched"}, dispatch["dispatched"]),
+                                    ({"result": "coalesced"}, dispatch["coalesced"]),
+                                    ({"result": "overflow"}, dispatch["overflow"])])
+        lines += prometheus_metric("rc_sink_errors_total", "counter", "Output sink errors",
+                                   [({}, dispatch["sink_errors"])])
+
+        session_stats = sessions.stats()
+        lines += prometheus_metric("rc_sessions_active", "gauge", "Active controller sessions",
+                                   [({}, session_stats["active"])])
+        lines += prometheus_metric("rc_sessions_evicted_total", "counter", "Sessions evicted for idleness",
+                                   [({}, session_stats["evicted"])])
+        per_session = session_stats["sessions"]
+        for name, key, metric_type, help_text in (
+                ("rc_session_frames_total", "frames", "counter", "Frames accepted per session"),
+                ("rc_session_frame_rate", "rate", "gauge", "Average frames per second per session"),
+                ("rc_session_rate_limited_total", "rate_limited", "counter", "Frames dropped by the rate limit"),
+                ("rc_session_reordered_total", "stale", "counter", "Late or duplicate frames discarded"),
+                ("rc_session_lost_frames_total", "lost", "counter", "Frames missing from the sequence"),
+        ):
+            lines += prometheus_metric(name, metric_type, help_text,
+                                       [({"session": s["session_id"]}, s[key]) for s in per_session])
+
+        if udp_listener is not None:
+            lines += prometheus_metric("rc_udp_datagrams_total", "counter", "UDP datagrams by result",
+                                       [({"result": result}, count)
+                                        for result, count in udp_listener.stats().items()])
+        return "\n".join(lines) + "\n"
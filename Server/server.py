@@ -1,114 +1,356 @@
 ﻿import os
-import time
+
+# Chế độ server: "gevent" (production), "waitress" (chỉ HTTP) hoặc "dev" (server phát triển của Flask)
+SERVER_MODE = os.environ.get("RC_SERVER_MODE", "gevent")
+if __name__ == "__main__" and SERVER_MODE == "gevent":
+    # gevent phải patch thư viện chuẩn trước mọi import khác
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        pass
+
+import signal
 import threading
-import subprocess
-import requests
-from flask import Flask, jsonify, request
-from FireBase.firebase_controller import FirebaseController
+import json
+from flask import Flask, Response, jsonify, request
+from FireBase.discovery_backends import DEFAULT_DISCOVERY_BACKEND, create_discovery
+from Common.protocol import CONTENT_TYPE_BINARY, FORMATS, ProtocolError, check_json_frame, decode_frame
+from Server.udp_listener import UdpInputListener
+from Server.dispatcher import InputDispatcher
+from Server.sinks import KeyboardSink, LogSink, RecordingSink, VirtualGamepadSink
+from Server.session_manager import ACCEPTED, RATE_LIMITED, UNKNOWN_SESSION, SessionManager
+from Server.serving import ServerRunner
+from Server.metrics import ServerMetrics
+from Server.supervisor import Supervisor
+from Server.tunnels import TunnelRotator, create_tunnel_agent
+
+try:
+    from flask_sock import Sock
+except ImportError:  # Không có flask-sock thì chỉ phục vụ HTTP
+    Sock = None
 
 # ========== CONFIG ==========
 NGROK_PATH = r"D:\Python\RemoteController\Server\Ngrok\ngrok.exe"
-PORT = 8080
+# Agent API của ngrok (hoặc Server/stub_tunnels_api.py khi thử local)
+NGROK_API = os.environ.get("RC_NGROK_API", "http://localhost:4040/api")
+# "ngrok" hoặc "local" (không tunnel, công bố thẳng http://LOCAL_HOST:PORT, chạy được khi không có mạng)
+TUNNEL_BACKEND = os.environ.get("RC_TUNNEL_BACKEND", "ngrok")
+LOCAL_HOST = os.environ.get("RC_LOCAL_HOST", "127.0.0.1")
+# Nơi công bố server_url: "firebase", "file" (RC_DISCOVERY_FILE) hoặc "memory", xem FireBase/discovery_backends.py
+DISCOVERY_BACKEND = DEFAULT_DISCOVERY_BACKEND
+TUNNEL_READY_TIMEOUT = 30  # giây tối đa chờ tunnel mới trả lời /check-connection
+TUNNEL_DRAIN = 30  # giây giữ tunnel cũ sau khi công bố URL mới
+TUNNEL_HEALTH_INTERVAL = 5  # giây giữa hai lần thăm dò tunnel đang công bố
+TUNNEL_HEALTH_FAILURES = 2  # thăm dò lỗi liên tiếp chừng này lần thì mở tunnel mới ngay
+SERVER_HEALTH_INTERVAL = 5  # giây giữa hai lần kiểm tra server còn nhận kết nối
+FIREBASE_DEBOUNCE = 1  # giây gom các lần đổi URL trước khi ghi Firebase
+PORT = int(os.environ.get("RC_PORT", 8080))
+# Cổng nhận input UDP (RC_UDP_PORT rỗng hoặc "off" để tắt, 0 để hệ điều hành chọn); ngrok http không
+# chuyển UDP, cần mở cổng trực tiếp
+_UDP_PORT_SETTING = os.environ.get("RC_UDP_PORT", "8081").strip().lower()
+UDP_PORT = None if _UDP_PORT_SETTING in ("", "off", "none") else int(_UDP_PORT_SETTING)
+# Host client gửi UDP tới (IP công khai / DNS có mở cổng UDP_PORT). Không đặt thì chỉ quảng bá
+# khi tunnel là "local" (host của URL chính là server); qua ngrok client sẽ không dùng UDP
+UDP_HOST = os.environ.get("RC_UDP_HOST") or (LOCAL_HOST if TUNNEL_BACKEND == "local" else None)
 DELAY = 3600  # thời gian cập nhật Firebase (s) = 1 giờ
 FIREBASE_CRED = r"../Firebase/service-account-key.json"
+TICK_RATE = 250  # số lần/giây worker áp dụng input ra output sink
+OUTPUT_SINKS = ["log"]  # "log", "gamepad", "keyboard", "record:<đường dẫn file>"
+MAX_SESSIONS = 64
+SESSION_IDLE_TIMEOUT = 60  # giây không gửi gì thì thu hồi phiên
+SESSION_RATE_LIMIT = 500  # frame/giây tối đa cho mỗi phiên
+SERVER_CONCURRENCY = 1000  # số kết nối đồng thời tối đa (gevent)
+SERVER_THREADS = 16  # số luồng xử lý request (waitress)
 
 # ========== FIREBASE + NGROK CLASS ==========
 class NgrokFirebaseUpdater:
-    def __init__(self, ngrok_path, port, delay, firebase_cred_path):
+    """Giám sát server, tunnel và URL trên Firebase bằng các tác vụ của một Supervisor.
+
+    - "server": chạy server Flask, khởi động lại nếu cổng không còn nhận kết nối.
+    - "rotate": xoay tunnel mỗi delay giây, hoặc ngay khi tunnel đang công bố chết.
+    - "health": thăm dò /check-connection qua tunnel mỗi TUNNEL_HEALTH_INTERVAL giây.
+    - "publish": ghi URL lên Firebase (gom trong FIREBASE_DEBOUNCE giây), chỉ khi URL đã đổi.
+    - "retire": đóng tunnel cũ sau drain giây, khi URL mới đã lên Firebase.
+    Tunnel và nơi công bố URL chọn bằng tunnel_backend / discovery_backend (RC_TUNNEL_BACKEND,
+    RC_DISCOVERY_BACKEND); "local" + "file" chạy được trên một máy không có mạng.
+    """
+
+    def __init__(self, ngrok_path, port, delay, firebase_cred_path, api_url=NGROK_API,
+                 drain=TUNNEL_DRAIN, ready_timeout=TUNNEL_READY_TIMEOUT, runner=None,
+                 health_interval=TUNNEL_HEALTH_INTERVAL, tunnel_backend=TUNNEL_BACKEND,
+                 discovery_backend=DISCOVERY_BACKEND):
         self.ngrok_path = ngrok_path
         self.port = port
         self.delay = delay
-        self.firebase_controller = FirebaseController(cred_path=firebase_cred_path)
+        self.drain = drain
+        self.runner = runner
+        self.discovery_backend = discovery_backend
+        self.discovery = create_discovery(discovery_backend, cred_path=firebase_cred_path)
+        self._stop_event = threading.Event()
         self.disable_proxies()
+        self.pending_url = None
+        self.published_url = None
+        self.health_failures = 0
+        # Tunnel mới lên và khỏe rồi mới công bố, tunnel cũ chỉ đóng sau khi client đã chuyển
+        agent = create_tunnel_agent(tunnel_backend, ngrok_path, api_url, host=LOCAL_HOST)
+        self.rotator = TunnelRotator(agent, port, self.request_publish,
+                                     ready_timeout=ready_timeout, stop_event=self._stop_event)
+
+        self.supervisor = Supervisor(self._stop_event)
+        if runner is not None:
+            self.supervisor.add("server", self.check_server, interval=SERVER_HEALTH_INTERVAL)
+        self.supervisor.add("rotate", self.rotate, interval=delay)
+        self.supervisor.add("health", self.check_tunnel, interval=health_interval, delay=health_interval)
+        self.supervisor.add("publish", self.publish, delay=None)
+        self.supervisor.add("retire", self.retire, delay=None)
+
+    def stop(self):
+        self.supervisor.stop()
 
     def disable_proxies(self):
         for var in ["http_proxy", "https_proxy", "HTTP_PROXY", "HTTPS_PROXY"]:
             os.environ.pop(var, None)
 
-    def start_ngrok(self) -> str:
-        subprocess.run("taskkill /F /IM ngrok.exe", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        subprocess.Popen([self.ngrok_path, "http", str(self.port)], shell=True)
-        print("🔄 Đang khởi động Ngrok...")
+    def server_ready(self):
+        return self.runner is None or self.runner.wait_ready(timeout=1)
 
-        for i in range(30):
-            try:
-                res = requests.get("http://localhost:4040/api/tunnels")
-                if res.status_code == 200:
-                    data = res.json()
-                    for tunnel in data.get("tunnels", []):
-                        public_url = tunnel.get("public_url")
-                        if public_url:
-                            print(f"✅ Ngrok URL nhận được sau {i + 1}s: {public_url}")
-                            return public_url
-            except requests.RequestException:
-                pass
-            time.sleep(1)
-
-        print("❌ Không thể lấy URL từ Ngrok sau 30 giây.")
+    def check_server(self):
+        if self.runner.server is None:
+            self.runner.start()
+        elif not self.runner.wait_ready(timeout=1):
+            print("⚠️ Server không còn nhận kết nối, đang khởi động lại...")
+            self.runner.stop()
+            self.runner.start()
+        if not self.runner.wait_ready():
+            print("⚠️ Server chưa sẵn sàng sau 10 giây.")
+
+    def rotate(self):
+        if not self.server_ready():
+            # Chỉ mở tunnel khi server đã nhận kết nối
+            return 1
+        print("⏳ Đang tạo tunnel mới...")
+        previous = self.rotator.current
+        url = self.rotator.rotate()
+        self.health_failures = 0
+        if url is None:
+            # Chưa có tunnel nào dùng được: thử lại sớm thay vì chờ cả chu kỳ
+            return 10
+        if self.rotator.current is not previous:
+            self.supervisor.trigger("retire", self.drain if previous else 0)
+        print(f"🕒 Xoay tunnel tiếp sau {self.delay // 60} phút.")
         return None
 
-    def update_firebase_host(self, url: str):
-        try:
-            if url:
-                self.firebase_controller.set_url(url)
-                print("📡 Đã cập nhật URL lên Firebase:", url)
-            else:
-                print("⚠️ URL rỗng, không cập nhật Firebase.")
-        except Exception as e:
-            print(f"❌ Lỗi khi cập nhật Firebase: {e}")
+    def check_tunnel(self):
+        if self.rotator.current is None:
+            return
+        if not self.server_ready():
+            # Server chết thì tunnel nào cũng không trả lời: khởi động lại server, không xoay tunnel
+            self.supervisor.trigger("server")
+            return
+        if self.rotator.healthy():
+            self.health_failures = 0
+            return
+        self.health_failures += 1
+        print(f"⚠️ Tunnel {self.rotator.current[1]} không trả lời ({self.health_failures}/{TUNNEL_HEALTH_FAILURES}).")
+        if self.health_failures >= TUNNEL_HEALTH_FAILURES:
+            print("🚑 Tunnel đã chết, mở tunnel mới ngay.")
+            self.supervisor.trigger("rotate")
+
+    def request_publish(self, url):
+        """Gọi bởi TunnelRotator: hẹn ghi URL lên Firebase, gom các lần đổi liên tiếp.
+
+        Ghi lỗi thì tác vụ "publish" được thử lại; retire() giữ tunnel cũ tới khi ghi xong.
+        """
+        self.pending_url = url
+        self.supervisor.trigger("publish", FIREBASE_DEBOUNCE)
+
+    def publish(self):
+        url = self.pending_url
+        if url == self.published_url:
+            return
+        # Lỗi được Supervisor thử lại với khoảng chờ tăng dần
+        self.discovery.set_url(url)
+        self.published_url = url
+        print(f"📡 Đã công bố URL ({self.discovery_backend}): {url}")
+
+    def retire(self):
+        current = self.rotator.current
+        if current is not None and self.published_url != current[1]:
+            # Client chưa biết URL mới: giữ tunnel cũ tới khi Firebase đã được ghi
+            return 1
+        self.rotator.retire()
 
     def run(self):
-        while True:
-            try:
-                print("⏳ Đang tạo Ngrok tunnel và cập nhật...")
-                url = self.start_ngrok()
-                self.update_firebase_host(url)
-                print(f"🕒 Chờ {self.delay // 60} phút...\n")
-                time.sleep(self.delay)
-            except KeyboardInterrupt:
-                print("🛑 Đã dừng chương trình bởi người dùng.")
-                break
-            except Exception as e:
-                print(f"❌ Lỗi không xác định: {e}")
-                time.sleep(10)
+        try:
+            self.supervisor.run()
+        except KeyboardInterrupt:
+            print("🛑 Đã dừng chương trình bởi người dùng.")
+        finally:
+            self.rotator.close()
 
 # ========== FLASK API ==========
 app = Flask(__name__)
 
+udp_listener = None
+sessions = SessionManager(MAX_SESSIONS, idle_timeout=SESSION_IDLE_TIMEOUT, rate_limit=SESSION_RATE_LIMIT)
+
 @app.route("/check-connection", methods=["GET"])
 def check_connection():
     print("✅ Flask đã nhận request check_connection")
+    # Cấp phiên cho client (client gửi lại X-Session-Id để giữ phiên cũ)
+    session_id = sessions.open(request.headers.get("X-Session-Id"), request.remote_addr)
+    if session_id is None:
+        return jsonify({"status": "error", "message": "Server đã đủ số phiên."}), 503
     return jsonify({
         "status": "ok",
-        "message": "Connection successful"
+        "message": "Connection successful",
+        "formats": list(FORMATS),
+        "udp_port": udp_listener.port if udp_listener is not None else None,
+        "udp_host": UDP_HOST if udp_listener is not None else None,
+        "session_id": session_id
     }), 200
 
+@app.route("/sessions", methods=["GET"])
+def session_stats():
+    return jsonify(sessions.stats()), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(dispatcher, sessions, udp_listener), mimetype="text/plain; version=0.0.4")
+
+def accept_frame(session_id, frame, remote):
+    """Áp dụng frame vào phiên rồi đẩy sang dispatcher; phiên lạ (đã bị thu hồi, client cũ) được mở lại."""
+    metrics.observe_receive(frame)
+    status, state, needs_keyframe = sessions.accept(session_id, frame)
+    if status == UNKNOWN_SESSION and sessions.open(session_id, remote) is not None:
+        status, state, needs_keyframe = sessions.accept(session_id, frame)
+    if status == ACCEPTED:
+        metrics.observe_accept()
+        handle_controller_data(state, session_id)
+    return status, needs_keyframe
+
+# ========== DISPATCH ==========
+def create_sinks(names):
+    sinks = []
+    for name in names:
+        try:
+            if name == "log":
+                sinks.append(LogSink())
+            elif name == "gamepad":
+                sinks.append(VirtualGamepadSink())
+            elif name == "keyboard":
+                sinks.append(KeyboardSink())
+            elif name.startswith("record:"):
+                sinks.append(RecordingSink(name[len("record:"):]))
+            else:
+                print(f"⚠️ Không biết output sink '{name}'")
+        except (RuntimeError, OSError) as e:
+            print(f"❌ Không tạo được output sink '{name}': {e}")
+    return sinks
+
+metrics = ServerMetrics()
+dispatcher = InputDispatcher(create_sinks(OUTPUT_SINKS), tick_rate=TICK_RATE, metrics=metrics)
+
+def handle_controller_data(state, source="http"):
+    # Chỉ đẩy vào ring buffer rồi trả về ngay, worker của dispatcher lo phần output
+    dispatcher.submit(source, state)
+
 @app.route("/controller-input", methods=["POST"])
 def controller_input():
-    if request.is_json:
-        data = request.get_json()
-        print(f"🎮 Nhận dữ liệu điều khiển: {data}")
-        # TODO: Xử lý dữ liệu điều khiển tại đây (ví dụ: gửi lệnh tới game/ứng dụng đích)
-        return jsonify({"status": "success", "message": "Dữ liệu điều khiển đã nhận."}), 200
+    if request.mimetype == CONTENT_TYPE_BINARY:
+        try:
+            data = decode_frame(request.get_data())
+        except ProtocolError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+    elif request.is_json:
+        try:
+            data = check_json_frame(request.get_json())
+        except ProtocolError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
     else:
-        return jsonify({"status": "error", "message": "Yêu cầu phải là JSON."}), 400
+        return jsonify({"status": "error", "message": "Yêu cầu phải là JSON hoặc frame nhị phân."}), 415
+    # Client không khai báo phiên (bản cũ) thì gộp theo địa chỉ IP
+    session_id = request.headers.get("X-Session-Id") or f"http:{request.remote_addr}"
+    status, keyframe_request = accept_frame(session_id, data, request.remote_addr)
+    if status == RATE_LIMITED:
+        return jsonify({"status": "error", "message": "Gửi quá nhanh."}), 429
+    if status == UNKNOWN_SESSION:
+        return jsonify({"status": "error", "message": "Server đã đủ số phiên."}), 503
+    return jsonify({
+        "status": "success",
+        "message": "Dữ liệu điều khiển đã nhận.",
+        "keyframe_request": keyframe_request
+    }), 200
+
+# ========== WEBSOCKET ==========
+# Kênh lâu dài: client stream frame liên tục, không có handshake/response cho từng frame
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route("/controller-ws")
+    def controller_ws(ws):
+        print("🔌 Client đã mở WebSocket")
+        session_id = request.args.get("session") or f"ws:{request.remote_addr}:{request.environ.get('REMOTE_PORT')}"
+        keyframe_requested = False
+        while True:
+            message = ws.receive()
+            try:
+                # Binary message là frame nhị phân, text message là JSON
+                data = decode_frame(message) if isinstance(message, bytes) else check_json_frame(json.loads(message))
+            except (ProtocolError, TypeError, ValueError) as e:
+                ws.send(json.dumps({"status": "error", "message": f"Frame không hợp lệ: {e}"}))
+                continue
+            status, needs_keyframe = accept_frame(session_id, data, request.remote_addr)
+            if status == UNKNOWN_SESSION:
+                ws.send(json.dumps({"status": "error", "message": "Server đã đủ số phiên."}))
+                break
+            # Mất frame delta: xin client một keyframe (chỉ xin một lần cho mỗi lần mất)
+            if needs_keyframe and not keyframe_requested:
+                ws.send(json.dumps({"type": "keyframe"}))
+            keyframe_requested = needs_keyframe
+else:
+    print("⚠️ Chưa cài flask-sock, WebSocket /controller-ws bị tắt.")
 
 def run_flask_server(host="0.0.0.0", port=PORT):
     app.run(host=host, port=port, debug=False, use_reloader=False)
 
+def start_udp_listener(host="0.0.0.0", port=UDP_PORT):
+    global udp_listener
+    udp_listener = UdpInputListener(accept_frame, host=host, port=port)
+    udp_listener.start()
+    return udp_listener
+
 # ========== MAIN ==========
 if __name__ == "__main__":
+    runner = ServerRunner(app, port=PORT, mode=SERVER_MODE,
+                          concurrency=SERVER_CONCURRENCY, threads=SERVER_THREADS)
+    # Supervisor chạy server, xoay/kiểm tra tunnel và ghi Firebase
     updater = NgrokFirebaseUpdater(
         ngrok_path=NGROK_PATH,
         port=PORT,
         delay=DELAY,
         firebase_cred_path=FIREBASE_CRED,
+        runner=runner,
     )
 
-    # Chạy Flask ở luồng riêng
-    flask_thread = threading.Thread(target=run_flask_server)
-    flask_thread.daemon = True
-    flask_thread.start()
+    # Worker áp dụng input ra output sink, dọn các phiên không hoạt động
+    dispatcher.start()
+    sessions.start_sweeper()
+
+    # Nhận input UDP song song với HTTP/WebSocket
+    if UDP_PORT is not None:
+        start_udp_listener()
+
+    # SIGTERM (dịch vụ bị tắt) dừng supervisor giống Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: updater.stop())
 
-    # Chạy cập nhật Firebase mỗi giờ
-    updater.run()
+    try:
+        updater.run()
+    finally:
+        runner.stop()
+        if udp_listener is not None:
+            udp_listener.stop()
+        dispatcher.stop()
+        sessions.stop()
+        print("👋 Server đã dừng.")
@@ -0,0 +1,104 @@
+﻿import socket
+import threading
+import time
+
+try:
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIHandler, WSGIServer
+except ImportError:
+    WSGIServer = None
+
+try:
+    import waitress.server
+except ImportError:
+    waitress = None
+
+MODES = ("gevent", "waitress", "dev")
+
+if WSGIServer is not None:
+    class NoDelayWSGIHandler(WSGIHandler):
+        """Tắt Nagle trên từng kết nối: pywsgi ghi header và body bằng hai lần send, trên
+        kết nối keep-alive phần body bị giữ lại chờ ACK trễ của client (~40 ms mỗi request)."""
+
+        def handle(self):
+            try:
+                self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+            super().handle()
+
+
+class ServerRunner:
+    """Chạy Flask app trên server WSGI được chọn, khởi động/dừng được từ luồng chính.
+
+    - "gevent": một event loop gevent, tối đa concurrency kết nối đồng thời (mỗi kết nối
+      một greenlet), hỗ trợ WebSocket. Cần gọi gevent.monkey.patch_all() trước khi import
+      các module khác.
+    - "waitress": pool threads luồng, chỉ HTTP (waitress không hỗ trợ WebSocket).
+    - "dev": server phát triển của Werkzeug, dùng khi làm việc local.
+    Chỉ chạy một process: phiên, dispatcher và listener UDP nằm trong bộ nhớ process này.
+    """
+
+    def __init__(self, app, host="0.0.0.0", port=8080, mode="gevent", concurrency=1000, threads=16):
+        if mode == "gevent" and WSGIServer is None:
+            print("⚠️ Chưa cài gevent, dùng server phát triển.")
+            mode = "dev"
+        if mode == "waitress" and waitress is None:
+            print("⚠️ Chưa cài waitress, dùng server phát triển.")
+            mode = "dev"
+        if mode not in MODES:
+            raise ValueError(f"Chế độ server không hợp lệ: {mode}")
+        self.app = app
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.concurrency = concurrency
+        self.threads = threads
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        if self.mode == "gevent":
+            # start() chỉ đăng ký socket với event loop, việc phục vụ chạy khi luồng chính nhường lượt
+            self.server = WSGIServer((self.host, self.port), self.app, spawn=Pool(self.concurrency), log=None,
+                                     handler_class=NoDelayWSGIHandler)
+            self.server.start()
+        elif self.mode == "waitress":
+            self.server = waitress.server.create_server(self.app, host=self.host, port=self.port,
+                                                        threads=self.threads)
+            self.thread = threading.Thread(target=self.server.run, daemon=True)
+            self.thread.start()
+        else:
+            from werkzeug.serving import make_server
+            self.server = make_server(self.host, self.port, self.app, threaded=True)
+            self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+            self.thread.start()
+        print(f"🚀 Server ({self.mode}) đang chạy tại {self.host}:{self.port}")
+
+    def wait_ready(self, timeout=10):
+        """Chờ tới khi cổng nhận kết nối, để chỉ mở tunnel khi server đã sẵn sàng."""
+        host = "127.0.0.1" if self.host in ("0.0.0.0", "") else self.host
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection((host, self.port), timeout=0.5):
+                    return True
+            except OSError:
+                time.sleep(0.05)
+        return False
+
+    def stop(self, timeout=5):
+        """Ngừng nhận kết nối mới và chờ các request đang chạy xong (tối đa timeout giây)."""
+        if self.server is None:
+            return
+        print("🛑 Đang dừng server...")
+        if self.mode == "gevent":
+            self.server.stop(timeout=timeout)
+        elif self.mode == "waitress":
+            self.server.close()
+            self.server.task_dispatcher.shutdown(timeout=timeout)
+        else:
+            self.server.shutdown()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.server = None
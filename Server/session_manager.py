@@ -0,0 +1,164 @@
+﻿import secrets
+import threading
+import time
+from array import array
+from Common.protocol import FrameDecoder
+
+ACCEPTED = "accepted"
+STALE = "stale"
+RATE_LIMITED = "rate_limited"
+UNKNOWN_SESSION = "unknown_session"
+
+
+class SessionManager:
+    """Quản lý phiên của từng client điều khiển.
+
+    Mỗi phiên chiếm một slot cố định; số liệu của slot nằm trong các mảng cấp phát
+    sẵn (array) thay vì một object/dict cho mỗi client. Mỗi phiên có FrameDecoder
+    riêng (sequence, keyframe/delta), giới hạn tốc độ kiểu token bucket và bị thu hồi
+    khi không gửi gì quá idle_timeout giây. Frame trùng/đến trễ bị bỏ trước khi tính
+    token nên bản sao dư của UDP không làm frame thật bị giới hạn tốc độ.
+    """
+
+    def __init__(self, max_sessions=64, idle_timeout=60, rate_limit=500, burst=None):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else rate_limit
+
+        self.session_ids = [None] * max_sessions
+        self.remotes = [None] * max_sessions
+        self.decoders = [None] * max_sessions
+        self.slot_locks = [threading.Lock() for _ in range(max_sessions)]
+        self.created_at = array('d', [0.0] * max_sessions)
+        self.last_seen = array('d', [0.0] * max_sessions)
+        self.tokens = array('d', [0.0] * max_sessions)
+        self.frames = array('Q', [0] * max_sessions)
+        self.limited = array('Q', [0] * max_sessions)
+
+        self.index = {}
+        self.free_slots = list(range(max_sessions - 1, -1, -1))
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    def open(self, session_id=None, remote=None):
+        """Cấp phiên mới (hoặc làm mới phiên đang có); trả None khi đã hết slot."""
+        now = time.monotonic()
+        with self._lock:
+            slot = self.index.get(session_id)
+            if slot is not None:
+                self.last_seen[slot] = now
+                return session_id
+            if not self.free_slots:
+                self._evict_idle(now)
+            if not self.free_slots:
+                return None
+            slot = self.free_slots.pop()
+            if session_id is None:
+                session_id = secrets.token_hex(8)
+            self.index[session_id] = slot
+            self.session_ids[slot] = session_id
+            self.remotes[slot] = remote
+            self.decoders[slot] = FrameDecoder()
+            self.created_at[slot] = now
+            self.last_seen[slot] = now
+            self.tokens[slot] = self.burst
+            self.frames[slot] = 0
+            self.limited[slot] = 0
+            return session_id
+
+    def accept(self, session_id, frame):
+        """Áp dụng frame vào phiên; trả (trạng thái xử lý, state đầy đủ hoặc None, cần keyframe)."""
+        slot = self.index.get(session_id)
+        if slot is None:
+            return UNKNOWN_SESSION, None, False
+        now = time.monotonic()
+        with self.slot_locks[slot]:
+            if self.session_ids[slot] != session_id:
+                return UNKNOWN_SESSION, None, False
+            # Token bucket: nạp lại rate_limit token/giây, tối đa burst
+            tokens = min(self.burst, self.tokens[slot] + (now - self.last_seen[slot]) * self.rate_limit)
+            self.last_seen[slot] = now
+            decoder = self.decoders[slot]
+            if decoder.is_stale(frame):
+                self.tokens[slot] = tokens
+                decoder.stale_frames += 1
+                return STALE, None, decoder.needs_keyframe
+            if tokens < 1:
+                self.tokens[slot] = tokens
+                self.limited[slot] += 1
+                return RATE_LIMITED, None, False
+            self.tokens[slot] = tokens - 1
+            self.frames[slot] += 1
+            state = decoder.apply(frame)
+            return (ACCEPTED if state is not None else STALE), state, decoder.needs_keyframe
+
+    def close(self, session_id):
+        with self._lock:
+            slot = self.index.get(session_id)
+            if slot is not None:
+                self._release(slot)
+
+    def _release(self, slot):
+        with self.slot_locks[slot]:
+            del self.index[self.session_ids[slot]]
+            self.session_ids[slot] = None
+            self.remotes[slot] = None
+            self.decoders[slot] = None
+        self.free_slots.append(slot)
+
+    def _evict_idle(self, now):
+        for slot in list(self.index.values()):
+            if now - self.last_seen[slot] > self.idle_timeout:
+                print(f"💤 Thu hồi phiên không hoạt động: {self.session_ids[slot]}")
+                self._release(slot)
+                self.evicted += 1
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    def start_sweeper(self, interval=None):
+        interval = interval or max(1.0, self.idle_timeout / 2)
+
+        def sweep():
+            while not self._stop.wait(interval):
+                self.evict_idle()
+
+        self._sweeper = threading.Thread(target=sweep, daemon=True)
+        self._sweeper.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def __len__(self):
+        return len(self.index)
+
+    def stats(self):
+        now = time.monotonic()
+        sessions = []
+        for session_id, slot in list(self.index.items()):
+            decoder = self.decoders[slot]
+            if decoder is None:
+                continue
+            age = now - self.created_at[slot]
+            sessions.append({
+                "session_id": session_id,
+                "remote": self.remotes[slot],
+                "age": round(age, 1),
+                "idle": round(now - self.last_seen[slot], 1),
+                "frames": self.frames[slot],
+                "rate": round(self.frames[slot] / age, 1) if age > 0 else 0.0,
+                "rate_limited": self.limited[slot],
+                "stale": decoder.stale_frames,
+                "gaps": decoder.gaps,
+                "lost": decoder.lost_frames,
+            })
+        return {
+            "active": len(sessions),
+            "capacity": self.max_sessions,
+            "evicted": self.evicted,
+            "sessions": sessions,
+        }
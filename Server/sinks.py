@@ -0,0 +1,208 @@
+﻿import json
+import time
+
+try:
+    import vgamepad
+except ImportError:  # Gamepad ảo cần vgamepad + driver ViGEmBus (Windows)
+    vgamepad = None
+
+try:
+    from pynput import keyboard
+except ImportError:  # Giả lập bàn phím là tuỳ chọn
+    keyboard = None
+
+
+class OutputSink:
+    """Đích nhận trạng thái bộ điều khiển; mọi phương thức chạy trên luồng worker của dispatcher."""
+
+    def apply(self, source, state):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class LogSink(OutputSink):
+    """In trạng thái mới nhất tối đa một lần mỗi interval giây thay vì in từng frame."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.frames = 0
+        self.latest = {}
+        self._last_print = 0.0
+
+    def apply(self, source, state):
+        self.frames += 1
+        self.latest[source] = state
+
+    def flush(self):
+        now = time.monotonic()
+        if now - self._last_print < self.interval or not self.latest:
+            return
+        for source, state in self.latest.items():
+            pressed = [name for name, value in state["button_states"].items() if value]
+            print(f"🎮 [{source}] {self.frames} frame, nút đang nhấn: {pressed}")
+        self.latest.clear()
+        self.frames = 0
+        self._last_print = now
+
+
+class RecordingSink(OutputSink):
+    """Ghi mỗi trạng thái thành một dòng JSON (kèm thời điểm dispatch) để phân tích lại sau."""
+
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8", buffering=1 << 16)
+
+    def apply(self, source, state):
+        record = {"time": time.time(), "source": str(source)}
+        record.update(state)
+        self.file.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+DEFAULT_KEY_MAPPING = {
+    'cross': 'space',
+    'circle': 'esc',
+    'square': 'e',
+    'triangle': 'q',
+    'dpad_up': 'up',
+    'dpad_down': 'down',
+    'dpad_left': 'left',
+    'dpad_right': 'right',
+    'option': 'enter',
+    'l1': 'shift',
+    'r1': 'ctrl',
+}
+
+
+class KeyboardSink(OutputSink):
+    """Nhấn/nhả phím theo nút bấm (cần pynput). Chỉ gửi sự kiện khi trạng thái nút thật sự đổi."""
+
+    def __init__(self, mapping=None):
+        if keyboard is None:
+            raise RuntimeError("Chưa cài pynput, không thể giả lập bàn phím.")
+        self.controller = keyboard.Controller()
+        self.mapping = {button: self._resolve(key) for button, key in (mapping or DEFAULT_KEY_MAPPING).items()}
+        self.pressed = set()
+
+    @staticmethod
+    def _resolve(key):
+        return getattr(keyboard.Key, key, key)
+
+    def apply(self, source, state):
+        for button, key in self.mapping.items():
+            is_pressed = bool(state["button_states"].get(button))
+            if is_pressed and key not in self.pressed:
+                self.controller.press(key)
+                self.pressed.add(key)
+            elif not is_pressed and key in self.pressed:
+                self.controller.release(key)
+                self.pressed.discard(key)
+
+    def close(self):
+        for key in list(self.pressed):
+            self.controller.release(key)
+        self.pressed.clear()
+
+
+DS4_BUTTONS = {
+    'cross': 'DS4_BUTTON_CROSS',
+    'circle': 'DS4_BUTTON_CIRCLE',
+    'square': 'DS4_BUTTON_SQUARE',
+    'triangle': 'DS4_BUTTON_TRIANGLE',
+    'share': 'DS4_BUTTON_SHARE',
+    'option': 'DS4_BUTTON_OPTIONS',
+    'l3': 'DS4_BUTTON_THUMB_LEFT',
+    'r3': 'DS4_BUTTON_THUMB_RIGHT',
+    'l1': 'DS4_BUTTON_SHOULDER_LEFT',
+    'r1': 'DS4_BUTTON_SHOULDER_RIGHT',
+}
+
+DS4_SPECIAL_BUTTONS = {
+    'ps': 'DS4_SPECIAL_BUTTON_PS',
+    'touchpad': 'DS4_SPECIAL_BUTTON_TOUCHPAD',
+}
+
+# (lên, xuống, trái, phải) -> hướng D-pad của DS4
+DS4_DPAD = {
+    (True, False, False, False): 'DS4_BUTTON_DPAD_NORTH',
+    (True, False, False, True): 'DS4_BUTTON_DPAD_NORTHEAST',
+    (False, False, False, True): 'DS4_BUTTON_DPAD_EAST',
+    (False, True, False, True): 'DS4_BUTTON_DPAD_SOUTHEAST',
+    (False, True, False, False): 'DS4_BUTTON_DPAD_SOUTH',
+    (False, True, True, False): 'DS4_BUTTON_DPAD_SOUTHWEST',
+    (False, False, True, False): 'DS4_BUTTON_DPAD_WEST',
+    (True, False, True, False): 'DS4_BUTTON_DPAD_NORTHWEST',
+}
+
+
+class VirtualGamepadSink(OutputSink):
+    """Đẩy trạng thái ra tay cầm DS4 ảo (vgamepad/ViGEmBus), mỗi nguồn input một tay cầm."""
+
+    def __init__(self):
+        if vgamepad is None:
+            raise RuntimeError("Chưa cài vgamepad, không thể tạo tay cầm ảo.")
+        self.gamepads = {}
+        self.dirty = set()
+
+    def _gamepad(self, source):
+        gamepad = self.gamepads.get(source)
+        if gamepad is None:
+            gamepad = self.gamepads[source] = vgamepad.VDS4Gamepad()
+        return gamepad
+
+    def apply(self, source, state):
+        gamepad = self._gamepad(source)
+        buttons = state["button_states"]
+        axes = state["axis_values"]
+
+        for name, ds4_name in DS4_BUTTONS.items():
+            button = getattr(vgamepad.DS4_BUTTONS, ds4_name)
+            if buttons.get(name):
+                gamepad.press_button(button=button)
+            else:
+                gamepad.release_button(button=button)
+        for name, ds4_name in DS4_SPECIAL_BUTTONS.items():
+            button = getattr(vgamepad.DS4_SPECIAL_BUTTONS, ds4_name)
+            if buttons.get(name):
+                gamepad.press_special_button(special_button=button)
+            else:
+                gamepad.release_special_button(special_button=button)
+
+        # D-pad có thể đến từ nút (SDL với tay PS5) hoặc từ hat
+        hat_x, hat_y = state["hat_values"].get('hat_0', (0, 0))
+        dpad = (bool(buttons.get('dpad_up')) or hat_y > 0,
+                bool(buttons.get('dpad_down')) or hat_y < 0,
+                bool(buttons.get('dpad_left')) or hat_x < 0,
+                bool(buttons.get('dpad_right')) or hat_x > 0)
+        direction = DS4_DPAD.get(dpad, 'DS4_BUTTON_DPAD_NONE')
+        gamepad.directional_pad(direction=getattr(vgamepad.DS4_DPAD_DIRECTIONS, direction))
+
+        gamepad.left_joystick_float(x_value_float=axes.get('left_stick_x', 0.0),
+                                    y_value_float=axes.get('left_stick_y', 0.0))
+        gamepad.right_joystick_float(x_value_float=axes.get('right_stick_x', 0.0),
+                                     y_value_float=axes.get('right_stick_y', 0.0))
+        # Cò L2/R2 từ [-1, 1] về [0, 1]
+        gamepad.left_trigger_float(value_float=(axes.get('l2', -1.0) + 1) / 2)
+        gamepad.right_trigger_float(value_float=(axes.get('r2', -1.0) + 1) / 2)
+        self.dirty.add(source)
+
+    def flush(self):
+        # Gửi report cho driver một lần mỗi tick, không phải mỗi frame
+        for source in self.dirty:
+            self.gamepads[source].update()
+        self.dirty.clear()
+
+    def close(self):
+        for gamepad in self.gamepads.values():
+            gamepad.reset()
+            gamepad.update()
+        self.gamepads.clear()
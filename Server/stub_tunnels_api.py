@@ -0,0 +1,135 @@
+﻿"""Agent API giả lập của ngrok để thử xoay tunnel trên máy local, không cần tài khoản ngrok.
+
+    python -m Server.stub_tunnels_api --port 4040 --ready-delay 2
+
+Hỗ trợ GET/POST /api/tunnels và GET/DELETE /api/tunnels/<tên> như agent thật. Mỗi tunnel
+là một TCP proxy trên 127.0.0.1 (public_url là http://127.0.0.1:<cổng>) chuyển tới addr;
+trong ready-delay giây đầu proxy đóng ngay mọi kết nối, giống tunnel chưa lên.
+Server dùng stub khi RC_NGROK_API trỏ về nó (mặc định đã là http://localhost:4040/api).
+"""
+import argparse
+import socket
+import threading
+import time
+from flask import Flask, jsonify, request
+
+
+class FakeTunnel:
+    """TCP proxy từ một cổng ngẫu nhiên trên 127.0.0.1 tới cổng local addr."""
+
+    def __init__(self, name, addr, proto="http", ready_delay=0.0):
+        self.name = name
+        self.proto = proto
+        self.target = ("127.0.0.1", int(str(addr).rsplit(":", 1)[-1]))
+        self.ready_at = time.monotonic() + ready_delay
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.public_url = f"http://127.0.0.1:{self.port}"
+        self.closed = False
+        self.connections = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            if time.monotonic() < self.ready_at:
+                client.close()
+                continue
+            try:
+                upstream = socket.create_connection(self.target, timeout=5)
+            except OSError:
+                client.close()
+                continue
+            self.connections += 1
+            for source, destination in ((client, upstream), (upstream, client)):
+                threading.Thread(target=self._pipe, args=(source, destination), daemon=True).start()
+
+    @staticmethod
+    def _pipe(source, destination):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, destination):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def close(self):
+        self.closed = True
+        self.listener.close()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "public_url": self.public_url,
+            "proto": self.proto,
+            "config": {"addr": f"http://localhost:{self.target[1]}"},
+            "metrics": {"conns": {"count": self.connections}},
+        }
+
+
+def create_app(ready_delay=0.0):
+    app = Flask(__name__)
+    tunnels = {}
+    lock = threading.Lock()
+
+    @app.route("/api/tunnels", methods=["GET"])
+    def list_tunnels():
+        with lock:
+            return jsonify({"tunnels": [t.to_dict() for t in tunnels.values()], "uri": "/api/tunnels"})
+
+    @app.route("/api/tunnels", methods=["POST"])
+    def start_tunnel():
+        config = request.get_json(force=True) or {}
+        name, addr = config.get("name"), config.get("addr")
+        if not name or not addr:
+            return jsonify({"error_code": 102, "msg": "name và addr là bắt buộc"}), 400
+        with lock:
+            if name in tunnels:
+                return jsonify({"error_code": 102, "msg": f"tunnel {name} đã tồn tại"}), 400
+            tunnel = tunnels[name] = FakeTunnel(name, addr, config.get("proto", "http"), ready_delay)
+        print(f"🚇 Mở tunnel {name}: {tunnel.public_url} -> {tunnel.target[1]}")
+        return jsonify(tunnel.to_dict()), 201
+
+    @app.route("/api/tunnels/<name>", methods=["GET"])
+    def get_tunnel(name):
+        with lock:
+            tunnel = tunnels.get(name)
+        if tunnel is None:
+            return jsonify({"error_code": 100, "msg": "not found"}), 404
+        return jsonify(tunnel.to_dict()), 200
+
+    @app.route("/api/tunnels/<name>", methods=["DELETE"])
+    def stop_tunnel(name):
+        with lock:
+            tunnel = tunnels.pop(name, None)
+        if tunnel is None:
+            return jsonify({"error_code": 100, "msg": "not found"}), 404
+        tunnel.close()
+        print(f"🧹 Đóng tunnel {name}")
+        return "", 204
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=4040)
+    parser.add_argument("--ready-delay", type=float, default=0.0,
+                        help="seconds a new tunnel refuses connections, like one still starting")
+    args = parser.parse_args()
+    create_app(args.ready_delay).run(host="127.0.0.1", port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
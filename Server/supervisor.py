@@ -0,0 +1,90 @@
+﻿import threading
+import time
+
+
+class Supervisor:
+    """Lịch chạy các tác vụ của server (server Flask, kiểm tra tunnel, ghi Firebase) trên một luồng.
+
+    Mỗi tác vụ là một hàm không tham số, chạy lại sau interval giây; hàm có thể trả về số
+    giây để tự hẹn lần chạy kế tiếp. trigger() gọi từ luồng khác (hoặc từ chính một tác vụ)
+    đánh thức lịch ngay, không phải chờ hết chu kỳ. Tác vụ ném exception được thử lại với
+    khoảng chờ tăng dần (1, 2, 4... tối đa max_backoff giây) thay vì một khoảng cố định.
+    """
+
+    def __init__(self, stop_event=None, max_backoff=60):
+        self.stop_event = stop_event or threading.Event()
+        self.max_backoff = max_backoff
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def add(self, name, func, interval=None, delay=0.0):
+        """Đăng ký tác vụ; chạy lần đầu sau delay giây (None: chỉ chạy khi được trigger)."""
+        with self._lock:
+            self._tasks[name] = {
+                "func": func,
+                "interval": interval,
+                "due": None if delay is None else time.monotonic() + delay,
+                "failures": 0,
+                "runs": 0,
+            }
+        self._wake.set()
+
+    def trigger(self, name, delay=0.0):
+        """Hẹn tác vụ chạy sau delay giây, trừ khi nó đã được hẹn sớm hơn."""
+        due = time.monotonic() + delay
+        with self._lock:
+            task = self._tasks[name]
+            if task["due"] is None or due < task["due"]:
+                task["due"] = due
+        self._wake.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self._wake.set()
+
+    def _next_task(self):
+        with self._lock:
+            scheduled = [(task["due"], name) for name, task in self._tasks.items() if task["due"] is not None]
+        return min(scheduled) if scheduled else (None, None)
+
+    def run(self):
+        """Chạy lịch trên luồng hiện tại tới khi stop()."""
+        while not self.stop_event.is_set():
+            # Xoá cờ trước khi đọc lịch để không lỡ trigger() xảy ra trong lúc này
+            self._wake.clear()
+            due, name = self._next_task()
+            timeout = None if due is None else due - time.monotonic()
+            if timeout is None or timeout > 0:
+                self._wake.wait(timeout)
+                continue
+
+            task = self._tasks[name]
+            with self._lock:
+                task["due"] = None
+            try:
+                result = task["func"]()
+                task["failures"] = 0
+            except Exception as e:
+                task["failures"] += 1
+                backoff = min(self.max_backoff, 2 ** (task["failures"] - 1))
+                print(f"❌ Tác vụ {name} lỗi ({e}), thử lại sau {backoff}s.")
+                result = backoff
+            task["runs"] += 1
+
+            if result is None:
+                result = task["interval"]
+            if result is not None:
+                self.trigger(name, result)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "runs": task["runs"],
+                    "failures": task["failures"],
+                    "due_in": None if task["due"] is None else round(task["due"] - now, 1),
+                }
+                for name, task in self._tasks.items()
+            }
@@ -0,0 +1,232 @@
+﻿import subprocess
+import threading
+import time
+import requests
+
+# Tên các tunnel do server tạo, để nhận ra tunnel cũ còn sót lại trong agent
+TUNNEL_PREFIX = "rc-"
+
+# "ngrok": tunnel công khai qua agent ngrok; "local": client kết nối thẳng tới server (cùng máy/mạng LAN)
+TUNNEL_BACKENDS = ("ngrok", "local")
+
+
+def wait_with_backoff(check, timeout, initial=0.25, maximum=4.0, factor=2.0, stop_event=None):
+    """Gọi check() tới khi trả về giá trị khác None/False, khoảng chờ tăng dần theo cấp số nhân.
+
+    Trả về kết quả của check(), hoặc None khi hết timeout giây (hay stop_event được set).
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial
+    while True:
+        result = check()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        wait = min(delay, remaining)
+        if stop_event is not None:
+            if stop_event.wait(wait):
+                return None
+        else:
+            time.sleep(wait)
+        delay = min(delay * factor, maximum)
+
+
+class NgrokAgent:
+    """Điều khiển agent ngrok qua agent API (mặc định http://localhost:4040/api).
+
+    Agent chạy lâu dài với "ngrok start --none"; từng tunnel được mở/đóng bằng
+    POST/DELETE /api/tunnels nên đổi tunnel không phải tắt process. Nếu API đã trả lời
+    (agent có sẵn, hoặc Server/stub_tunnels_api.py khi thử local) thì không chạy ngrok.
+    """
+
+    def __init__(self, ngrok_path=None, api_url="http://localhost:4040/api", timeout=5):
+        self.ngrok_path = ngrok_path
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.http = requests.Session()
+        # Agent API luôn ở localhost, không đi qua proxy
+        self.http.trust_env = False
+        self.process = None
+
+    def _api(self, method, path, **kwargs):
+        return self.http.request(method, f"{self.api_url}{path}", timeout=self.timeout, **kwargs)
+
+    def available(self):
+        try:
+            return self._api("GET", "/tunnels").status_code == 200
+        except requests.RequestException:
+            return False
+
+    def ensure_running(self, timeout=30):
+        """Đảm bảo agent API sẵn sàng, chạy agent nếu cần. Trả về False nếu không được."""
+        if self.available():
+            return True
+        if not self.ngrok_path:
+            print(f"❌ Không kết nối được agent API tại {self.api_url}.")
+            return False
+        if self.process is None or self.process.poll() is not None:
+            print("🔄 Đang khởi động Ngrok agent...")
+            self.process = subprocess.Popen([self.ngrok_path, "start", "--none", "--log", "stdout"],
+                                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return wait_with_backoff(self.available, timeout)
+
+    def tunnels(self):
+        response = self._api("GET", "/tunnels")
+        response.raise_for_status()
+        return response.json().get("tunnels", [])
+
+    def open_tunnel(self, name, port, proto="http"):
+        """Mở tunnel mới tới cổng local; trả về public URL."""
+        response = self._api("POST", "/tunnels", json={"name": name, "addr": str(port), "proto": proto})
+        response.raise_for_status()
+        return response.json()["public_url"]
+
+    def close_tunnel(self, name):
+        try:
+            response = self._api("DELETE", f"/tunnels/{name}")
+            return response.status_code in (200, 204, 404)
+        except requests.RequestException as e:
+            print(f"⚠️ Không đóng được tunnel {name}: {e}")
+            return False
+
+    def stop(self):
+        """Tắt agent nếu chính server đã chạy nó."""
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+
+class LocalTunnels:
+    """Thay cho NgrokAgent khi không có mạng: "tunnel" chính là địa chỉ trực tiếp của server."""
+
+    def __init__(self, host="127.0.0.1"):
+        self.host = host
+        self.opened = {}
+
+    def ensure_running(self, timeout=30):
+        return True
+
+    def tunnels(self):
+        return [{"name": name, "public_url": url} for name, url in self.opened.items()]
+
+    def open_tunnel(self, name, port, proto="http"):
+        url = f"http://{self.host}:{port}"
+        self.opened[name] = url
+        return url
+
+    def close_tunnel(self, name):
+        self.opened.pop(name, None)
+        return True
+
+    def stop(self):
+        self.opened.clear()
+
+
+def create_tunnel_agent(backend, ngrok_path=None, api_url="http://localhost:4040/api", host="127.0.0.1"):
+    if backend == "ngrok":
+        return NgrokAgent(ngrok_path, api_url)
+    if backend == "local":
+        return LocalTunnels(host)
+    raise ValueError(f"Backend tunnel không hợp lệ: {backend}")
+
+
+class TunnelRotator:
+    """Xoay tunnel kiểu blue/green, không có lúc nào client mất đường tới server.
+
+    rotate(): mở tunnel mới song song với tunnel cũ, chờ /check-connection qua tunnel mới
+    trả lời (backoff theo cấp số nhân) rồi công bố URL mới bằng publish(url). publish chỉ
+    nhận URL để ghi sau (bất đồng bộ, lỗi được thử lại ở nơi khác) nên không báo thất bại;
+    tunnel cũ chuyển vào retiring và người gọi chỉ gọi retire() để đóng khi URL mới đã thực
+    sự được ghi. Tunnel mới không khỏe thì đóng nó và giữ nguyên tunnel cũ.
+    """
+
+    def __init__(self, agent, port, publish, ready_timeout=30,
+                 probe_path="/check-connection", stop_event=None):
+        self.agent = agent
+        self.port = port
+        self.publish = publish
+        self.ready_timeout = ready_timeout
+        self.probe_path = probe_path
+        self.stop_event = stop_event or threading.Event()
+        self.current = None  # (tên, URL) của tunnel đang công bố
+        self.retiring = []  # tên các tunnel cũ chờ đóng
+        self.probe_session_id = None
+        self.http = requests.Session()
+        self.http.trust_env = False
+
+    def probe(self, url):
+        """Gọi /check-connection qua tunnel; chỉ tính là khỏe khi chính server trả lời ok."""
+        headers = {"ngrok-skip-browser-warning": "1"}
+        if self.probe_session_id:
+            # Dùng lại một phiên để các lần thăm dò không chiếm slot phiên của client
+            headers["X-Session-Id"] = self.probe_session_id
+        try:
+            response = self.http.get(f"{url}{self.probe_path}", headers=headers, timeout=5)
+            if response.status_code != 200:
+                return False
+            info = response.json()
+        except (requests.RequestException, ValueError):
+            return False
+        self.probe_session_id = info.get("session_id") or self.probe_session_id
+        return info.get("status") == "ok"
+
+    def old_tunnels(self, keep):
+        """Các tunnel của server trừ keep: tunnel đang công bố và tunnel do lần chạy trước để lại."""
+        try:
+            return [t["name"] for t in self.agent.tunnels()
+                    if t.get("name", "").startswith(TUNNEL_PREFIX) and t["name"] != keep]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"⚠️ Không đọc được danh sách tunnel: {e}")
+            return []
+
+    def rotate(self):
+        """Thực hiện một lần xoay; trả về URL đang công bố sau khi xoay (None nếu chưa có)."""
+        if not self.agent.ensure_running():
+            return self.current[1] if self.current else None
+
+        name = f"{TUNNEL_PREFIX}{int(time.time() * 1000)}"
+        started = time.monotonic()
+        try:
+            url = self.agent.open_tunnel(name, self.port)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"❌ Không mở được tunnel mới: {e}")
+            return self.current[1] if self.current else None
+
+        if not wait_with_backoff(lambda: self.probe(url), self.ready_timeout, stop_event=self.stop_event):
+            if not self.stop_event.is_set():
+                print(f"❌ Tunnel mới {url} không trả lời sau {self.ready_timeout}s, giữ tunnel cũ.")
+            self.agent.close_tunnel(name)
+            return self.current[1] if self.current else None
+        print(f"✅ Tunnel mới sẵn sàng sau {time.monotonic() - started:.1f}s: {url}")
+
+        old = self.old_tunnels(keep=name)
+        self.publish(url)
+        self.current = (name, url)
+        self.retiring = old
+        return url
+
+    def healthy(self):
+        """Tunnel đang công bố còn đưa request tới server không."""
+        return self.current is not None and self.probe(self.current[1])
+
+    def retire(self):
+        """Đóng các tunnel cũ sau khi client đã chuyển sang tunnel mới."""
+        for old_name in self.retiring:
+            self.agent.close_tunnel(old_name)
+        if self.retiring:
+            print(f"🧹 Đã đóng {len(self.retiring)} tunnel cũ.")
+        self.retiring = []
+
+    def close(self):
+        """Đóng mọi tunnel đang mở và agent (nếu server đã chạy nó)."""
+        self.retire()
+        if self.current is not None:
+            self.agent.close_tunnel(self.current[0])
+            self.current = None
+        self.agent.stop()
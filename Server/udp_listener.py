@@ -0,0 +1,67 @@
+﻿import socket
+import threading
+from Common.protocol import ProtocolError, decode_frame
+
+SESSION_TOKEN_SIZE = 8
+
+
+class UdpInputListener:
+    """Nhận frame điều khiển qua UDP, mỗi datagram là một keyframe độc lập.
+
+    Datagram = 8 byte mã phiên (session_id dạng hex) + frame nhị phân. handler nhận
+    (session_id, frame, remote) và trả về (trạng thái xử lý, cần keyframe); bộ giải
+    mã của phiên bỏ datagram đến trễ và bản sao dự phòng (cùng sequence number).
+    """
+
+    def __init__(self, handler, host="0.0.0.0", port=8081, buffer_size=2048):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.buffer_size = buffer_size
+        self.received = 0
+        self.invalid = 0
+        self.results = {}
+        self.sock = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((self.host, self.port))
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print(f"📡 Đang nghe UDP tại {self.host}:{self.port}")
+
+    def _run(self):
+        while self.running:
+            try:
+                payload, address = self.sock.recvfrom(self.buffer_size)
+            except OSError:
+                break
+            self.received += 1
+            try:
+                frame = decode_frame(payload[SESSION_TOKEN_SIZE:])
+            except ProtocolError:
+                self.invalid += 1
+                continue
+            if not frame["keyframe"]:
+                # Delta không tự đủ thông tin, không dùng được khi có thể mất gói
+                self.invalid += 1
+                continue
+            session_id = payload[:SESSION_TOKEN_SIZE].hex()
+            status, _ = self.handler(session_id, frame, address[0])
+            self.results[status] = self.results.get(status, 0) + 1
+
+    def stats(self):
+        stats = {"received": self.received, "invalid": self.invalid}
+        stats.update(self.results)
+        return stats
+
+    def stop(self):
+        self.running = False
+        if self.sock is not None:
+            self.sock.close()
+        if self.thread is not None:
+            self.thread.join(timeout=1)